@@ -0,0 +1,29 @@
+"""JSON responses for service output that is already JSON-safe.
+
+Returning a `FastJSONResponse` from a route skips FastAPI's `response_model`
+validation and `jsonable_encoder` pass; the declared `response_model` still
+documents the schema in OpenAPI. Bytes come from orjson when it is installed,
+else from the stdlib encoder.
+"""
+import json
+from typing import Any
+
+from fastapi.responses import JSONResponse
+
+try:
+    import orjson
+except ImportError:  # optional: pip install orjson
+    orjson = None
+
+
+def dumps(content: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(content, option=orjson.OPT_SERIALIZE_NUMPY)
+    return json.dumps(content, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+class FastJSONResponse(JSONResponse):
+    """`JSONResponse` that encodes with `dumps`; content is not validated."""
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
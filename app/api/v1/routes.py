@@ -1,63 +1,269 @@
-from typing import List
-from fastapi import APIRouter, HTTPException, status, Request
+import hmac
+from typing import List, Optional
+from fastapi import APIRouter, Depends, Header, HTTPException, status, Request
+from fastapi.responses import JSONResponse, Response
 
 from app.api.v1.schemas import (
-    ClassifyIn, ClassifyBatchIn, ClassificationOut, ClassificationBatchOut, FeedbackIn
+    ClassifyIn, ClassifyBatchIn, ClassificationOut, ClassificationBatchOut, FeedbackIn,
+    FeedbackBatchIn, FeedbackBatchOut, FeedbackResult, ReloadIn, SimilarIn, SimilarOut
 )
-from app.ml.model_loader import META, EMB_ID, THRESHOLD
+from app.core.config import (
+    MODEL_RETRY_AFTER_S, OVERLOAD_RETRY_AFTER_S, ADMIN_TOKEN, METRICS_ON, IDEMPOTENCY_KEY_MAX_LEN,
+    REQUEST_TIMEOUT_MS, REQUEST_TIMEOUT_MAX_MS, DISCONNECT_POLL_MS, DEADLINE_STATUS
+)
+from app.core.deadline import DEADLINES, Deadline, DeadlineExceeded, run_within
+from app.core.metrics import CONTENT_TYPE, METRICS, timed_handler
+from app.ml.model_loader import ModelBundle
+from app.ml.registry import REGISTRY, ModelNotReady, ReloadInProgress, get_bundle, is_ready, resolve_model_dir
+from app.ml.worker_pool import INFERENCE, Overloaded
+from app.ml.cache import SCORE_CACHE
+from app.ml.embedding_store import EMBEDDING_STORE
 from app.services.classifier_service import (
-    classify_one_service, classify_batch_service, submit_feedback_service
+    classify_one_service, classify_batch_service, submit_feedback_service, submit_feedback_batch_service,
+    similar_service
 )
+from app.services.idempotency import IDEMPOTENCY, KeyConflict
+from app.services.telemetry_writer import TELEMETRY_WRITER
+from app.db.session import pool_stats
+from app.api.v1.responses import FastJSONResponse
+from app.api.v1.streaming import NDJSONStreamingResponse, classify_ndjson
 
 router = APIRouter()
 
+def require_model() -> ModelBundle:
+    """Fail fast with 503 + Retry-After until the background load has finished."""
+    try:
+        return get_bundle()
+    except ModelNotReady as e:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Model not ready",
+            headers={"Retry-After": str(MODEL_RETRY_AFTER_S)},
+        ) from e
+
+def _overloaded() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+        detail="Inference queue full",
+        headers={"Retry-After": str(OVERLOAD_RETRY_AFTER_S)},
+    )
+
+def idempotency_key(idempotency_key: Optional[str] = Header(default=None)) -> Optional[str]:
+    if idempotency_key is not None and not 0 < len(idempotency_key) <= IDEMPOTENCY_KEY_MAX_LEN:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                            detail=f"Idempotency-Key must be 1-{IDEMPOTENCY_KEY_MAX_LEN} chars")
+    return idempotency_key
+
+def request_timeout(x_request_timeout_ms: Optional[str] = Header(default=None)) -> Optional[float]:
+    """Seconds: X-Request-Timeout-Ms (capped at REQUEST_TIMEOUT_MAX_MS), else REQUEST_TIMEOUT_MS (0 = None)."""
+    timeout_ms = REQUEST_TIMEOUT_MS
+    if x_request_timeout_ms is not None:
+        timeout_ms = int(x_request_timeout_ms) if x_request_timeout_ms.isdigit() else 0
+        if timeout_ms <= 0:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                                detail="X-Request-Timeout-Ms must be a positive integer")
+        if REQUEST_TIMEOUT_MAX_MS > 0:
+            timeout_ms = min(timeout_ms, REQUEST_TIMEOUT_MAX_MS)
+    return timeout_ms / 1000.0 if timeout_ms > 0 else None
+
+def request_deadline(timeout_s: Optional[float] = Depends(request_timeout)) -> Deadline:
+    return Deadline(timeout_s)
+
+def _within(deadline: Deadline, request: Request, work):
+    return run_within(deadline, work, request.is_disconnected, DISCONNECT_POLL_MS / 1000.0)
+
+def _deadline_exceeded(e: DeadlineExceeded) -> HTTPException:
+    # 499 (client closed request): nobody reads it, but access logs tell it apart from a timeout
+    code = 499 if e.reason == "cancelled" else DEADLINE_STATUS
+    return HTTPException(status_code=code, detail=f"Request deadline exceeded ({e.reason} during {e.stage})")
+
+def _result(cid, label: str, p: float, suggestion: Optional[str], bundle: ModelBundle) -> dict:
+    # JSON-safe, so the same dict can be replayed from memory or the DB
+    return {
+        "classification_id": str(cid),
+        "label": label,
+        "score_produtivo": round(float(p), 3),
+        "threshold_used": bundle.threshold,
+        "suggestion": suggestion,
+    }
+
+def _model_info() -> dict:
+    if not is_ready():
+        return {}
+    bundle = get_bundle()
+    return {
+        "model_version": bundle.version,
+        "model_generation": bundle.generation,
+        "embedding_model": bundle.emb_id,
+        "embedding_backend": bundle.emb_backend,
+        "classifier_head": bundle.head_report or {"kind": bundle.head.kind},
+        "threshold": bundle.threshold,
+        "threshold_source": bundle.threshold_source,
+    }
+
 @router.get("/healthz")
 def healthz():
+    """Liveness: the process is up, whether or not the model has loaded."""
     return {
         "status": "ok",
-        "model_version": META.get("created_at", "unknown"),
-        "embedding_model": EMB_ID,
-        "threshold": THRESHOLD,
-        # Telemetry readiness is now implicit; DB errors won't bubble here
+        "model_state": "ready" if is_ready() else REGISTRY.state["phase"],
+        **_model_info(),
+        "cache": SCORE_CACHE.stats(),
+        # Telemetry is written in the background; DB errors show up as failed/dropped counters
+        "telemetry": TELEMETRY_WRITER.stats(),
+        "inference": INFERENCE.stats(),
+        "idempotency": IDEMPOTENCY.stats(),
+        "embedding_store": EMBEDDING_STORE.stats(),
+        "deadlines": DEADLINES.stats(),
+        "db_pools": pool_stats(),
+    }
+
+@router.get("/readyz")
+def readyz():
+    """Readiness: 200 once a model is loaded and warmed up, 503 before that (or after a failed first load).
+
+    Also 503 while the inference worker pool is broken and could not be replaced.
+    """
+    ready = is_ready() and INFERENCE.broken is None
+    body = {
+        "status": "ready" if ready else ("inference_broken" if is_ready() else REGISTRY.state["phase"]),
+        "error": REGISTRY.state["error"] if not is_ready() or INFERENCE.broken is None else INFERENCE.broken,
+        "load_ms": REGISTRY.state["load_ms"],
+        "timings_ms": get_bundle().timings_ms if is_ready() else {},
+        **_model_info(),
     }
+    if not ready:
+        return JSONResponse(body, status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                            headers={"Retry-After": str(MODEL_RETRY_AFTER_S)})
+    return body
+
+@router.get("/metrics", include_in_schema=False)
+def metrics():
+    """Prometheus text format: stage/request latency histograms, batch sizes, queue depths, counters."""
+    if not METRICS_ON:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not Found")
+    return Response(METRICS.render(), media_type=CONTENT_TYPE)
 
 @router.post("/classify", response_model=ClassificationOut)
-def classify_one(payload: ClassifyIn, request: Request):
+@timed_handler
+async def classify_one(payload: ClassifyIn, request: Request, response: Response,
+                       bundle: ModelBundle = Depends(require_model),
+                       key: Optional[str] = Depends(idempotency_key),
+                       deadline: Deadline = Depends(request_deadline)):
+    async def compute(text: str) -> dict:
+        with INFERENCE.admit():
+            cid, label, p, suggestion = await classify_one_service(text, bundle, deadline)
+        return _result(cid, label, p, suggestion, bundle)
+
     try:
-        cid, label, p, suggestion = classify_one_service(payload.text)
+        result, replayed = await _within(deadline, request, IDEMPOTENCY.run(key, payload.text, compute))
+    except KeyConflict as e:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=str(e)) from e
+    except Overloaded as e:
+        raise _overloaded() from e
+    except DeadlineExceeded as e:
+        raise _deadline_exceeded(e) from e
     except Exception as e:
         raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Model not ready") from e
 
-    return ClassificationOut(
-        classification_id=cid,
-        label=label,
-        score_produtivo=round(float(p), 3),
-        threshold_used=THRESHOLD,
-        suggestion=suggestion
-    )
+    if replayed:
+        response.headers["Idempotent-Replayed"] = "true"
+    return ClassificationOut(**result)
 
 @router.post("/classify_batch", response_model=ClassificationBatchOut)
-def classify_batch(payload: ClassifyBatchIn, request: Request):
+@timed_handler
+async def classify_batch(payload: ClassifyBatchIn, request: Request,
+                         bundle: ModelBundle = Depends(require_model),
+                         key: Optional[str] = Depends(idempotency_key),
+                         deadline: Deadline = Depends(request_deadline)):
+    """Items are keyed by `idempotency_keys`, else by `<Idempotency-Key>:<index>`."""
+    keys = payload.idempotency_keys
+    if keys is None:
+        keys = [f"{key}:{i}" if key is not None else None for i in range(len(payload.texts))]
+
+    async def compute(texts: List[str]) -> List[dict]:
+        with INFERENCE.admit():
+            raw_results = await classify_batch_service(texts, bundle, deadline)
+        return [_result(cid, label, p, suggestion, bundle) for cid, label, p, suggestion in raw_results]
+
     try:
-        raw_results = classify_batch_service(payload.texts)
+        outcomes = await _within(deadline, request, IDEMPOTENCY.run_many(keys, payload.texts, compute))
+    except KeyConflict as e:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=str(e)) from e
+    except Overloaded as e:
+        raise _overloaded() from e
+    except DeadlineExceeded as e:
+        raise _deadline_exceeded(e) from e
     except Exception as e:
         raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail="Model not ready") from e
 
-    results: List[ClassificationOut] = []
-    for cid, label, p, suggestion in raw_results:
-        results.append(ClassificationOut(
-            classification_id=cid,
-            label=label,
-            score_produtivo=round(float(p), 3),
-            threshold_used=THRESHOLD,
-            suggestion=suggestion
-        ))
-    return ClassificationBatchOut(results=results)
+    headers = {"Idempotent-Replayed": "true"} if outcomes and all(replayed for _, replayed in outcomes) else None
+    # items are `_result` dicts the service just built (or replayed); encode them as they are
+    return FastJSONResponse({"results": [result for result, _ in outcomes]}, headers=headers)
+
+@router.post("/classify_stream", response_class=NDJSONStreamingResponse, dependencies=[Depends(require_model)])
+@timed_handler
+async def classify_stream(request: Request, timeout_s: Optional[float] = Depends(request_timeout)):
+    """NDJSON in (`{"id": ..., "text": ...}` per line), NDJSON out as each chunk is classified."""
+    return NDJSONStreamingResponse(classify_ndjson(request, timeout_s))
 
 @router.post("/feedback", status_code=status.HTTP_204_NO_CONTENT)
-def submit_feedback(payload: FeedbackIn):
+@timed_handler
+async def submit_feedback(payload: FeedbackIn):
     try:
-        submit_feedback_service(str(payload.classification_id), payload.helpful, payload.reason_code)
+        await submit_feedback_service(payload.classification_id, payload.helpful, payload.reason_code)
     except HTTPException:
         raise
     return None
+
+@router.post("/feedback_batch", response_model=FeedbackBatchOut)
+@timed_handler
+async def submit_feedback_batch(payload: FeedbackBatchIn):
+    """One upsert for all items; unknown classification_ids are reported per item instead of failing the batch."""
+    found = await submit_feedback_batch_service(
+        [(item.classification_id, item.helpful, item.reason_code) for item in payload.items]
+    )
+    return FeedbackBatchOut(results=[
+        FeedbackResult(classification_id=item.classification_id, status="ok" if ok else "not_found")
+        for item, ok in zip(payload.items, found)
+    ])
+
+@router.post("/similar", response_model=SimilarOut)
+@timed_handler
+async def similar(payload: SimilarIn, bundle: ModelBundle = Depends(require_model)):
+    """Nearest past classifications (cosine similarity of embeddings), with their telemetry and feedback."""
+    if not EMBEDDING_STORE.enabled:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Embedding store disabled")
+    try:
+        with INFERENCE.admit():
+            results = await similar_service(payload.text, payload.classification_id, payload.k, bundle)
+    except Overloaded as e:
+        raise _overloaded() from e
+    if results is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="classification_id not in embedding store")
+    return SimilarOut(results=results)
+
+# ================== Admin ==================
+def require_admin(x_admin_token: Optional[str] = Header(default=None)) -> None:
+    """Admin endpoints are off unless ADMIN_TOKEN is set, and then need a matching X-Admin-Token."""
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Not Found")
+    if not x_admin_token or not hmac.compare_digest(x_admin_token, ADMIN_TOKEN):
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="invalid admin token")
+
+@router.get("/admin/models", dependencies=[Depends(require_admin)])
+def admin_models():
+    return REGISTRY.describe()
+
+@router.post("/admin/reload", status_code=status.HTTP_202_ACCEPTED, dependencies=[Depends(require_admin)])
+def admin_reload(payload: Optional[ReloadIn] = None):
+    """Load + validate + warm a model directory under MODELS_ROOT in the background, then swap it in atomically."""
+    try:
+        arts_dir = resolve_model_dir(payload.model) if payload and payload.model else None
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=str(e)) from e
+    try:
+        REGISTRY.reload_in_background(arts_dir)
+    except ReloadInProgress as e:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(e)) from e
+    return REGISTRY.describe()
@@ -0,0 +1,156 @@
+import json
+from typing import Any, AsyncIterator, List, Optional, Tuple
+
+from fastapi import Request
+from fastapi.responses import StreamingResponse
+from pydantic import ValidationError
+from starlette.requests import ClientDisconnect
+
+from app.api.v1.schemas import ClassifyIn
+from app.core.config import STREAM_CHUNK_ITEMS, STREAM_MAX_LINE_BYTES, DISCONNECT_POLL_MS
+from app.core.deadline import Deadline, DeadlineExceeded, run_within
+from app.ml.registry import get_bundle
+from app.ml.worker_pool import INFERENCE, Overloaded
+from app.services.classifier_service import classify_batch_service
+
+
+class NDJSONStreamingResponse(StreamingResponse):
+    """StreamingResponse that does not listen for `http.disconnect` in parallel.
+
+    The stock response consumes `receive()` while streaming, which would steal
+    request-body chunks from a generator that is still reading the upload.
+    Disconnects are detected by the generator instead (see `classify_ndjson`).
+    """
+
+    media_type = "application/x-ndjson"
+
+    async def __call__(self, scope, receive, send) -> None:
+        await self.stream_response(send)
+        if self.background is not None:
+            await self.background()
+
+
+def _line(obj: dict) -> bytes:
+    return json.dumps(obj, ensure_ascii=False).encode("utf-8") + b"\n"
+
+
+async def _ndjson_lines(request: Request) -> AsyncIterator[Tuple[int, Optional[bytes]]]:
+    """Yield (line_no, raw_line) from the body; raw_line is None when the line exceeded the size cap."""
+    buf = bytearray()
+    line_no = 0
+    skipping = False
+    async for chunk in request.stream():
+        start = 0
+        while True:
+            nl = chunk.find(b"\n", start)
+            if nl < 0:
+                if not skipping:
+                    buf += chunk[start:]
+                    if len(buf) > STREAM_MAX_LINE_BYTES:
+                        line_no += 1
+                        yield line_no, None
+                        buf.clear()
+                        skipping = True
+                break
+            if skipping:
+                skipping = False
+            else:
+                buf += chunk[start:nl]
+                line_no += 1
+                yield line_no, bytes(buf) if len(buf) <= STREAM_MAX_LINE_BYTES else None
+            buf.clear()
+            start = nl + 1
+    if buf.strip() and not skipping:
+        yield line_no + 1, bytes(buf) if len(buf) <= STREAM_MAX_LINE_BYTES else None
+
+
+def _parse_item(line_no: int, raw: Optional[bytes]) -> Tuple[Any, Optional[str], Optional[str]]:
+    """Return (id, cleaned_text, error)."""
+    if raw is None:
+        return None, None, f"line {line_no} exceeds {STREAM_MAX_LINE_BYTES} bytes"
+    try:
+        obj = json.loads(raw)
+    except ValueError:
+        return None, None, f"line {line_no} is not valid JSON"
+    if not isinstance(obj, dict):
+        return None, None, f"line {line_no} must be an object with id and text"
+    item_id = obj.get("id")
+    try:
+        text = ClassifyIn(text=obj.get("text")).text
+    except ValidationError as e:
+        return item_id, None, e.errors()[0].get("msg", "invalid text")
+    return item_id, text, None
+
+
+def _errors(ids: List[Any], lines: List[int], error: str) -> bytes:
+    return b"".join(_line({"id": item_id, "line": line_no, "error": error}) for item_id, line_no in zip(ids, lines))
+
+
+async def _run_chunk(ids: List[Any], lines: List[int], texts: List[str], timeout_s: Optional[float],
+                     request: Optional[Request] = None) -> bytes:
+    """Classify one chunk under its own deadline; pass `request` once the body is read to watch for disconnects.
+
+    A shed or expired chunk yields an error line per item (retry those ids);
+    a disconnect raises DeadlineExceeded("cancelled", ...).
+    """
+    bundle = get_bundle()
+    deadline = Deadline(timeout_s)
+
+    async def work():
+        with INFERENCE.admit():
+            return await classify_batch_service(texts, bundle, deadline)
+
+    try:
+        results = await run_within(deadline, work(), request.is_disconnected if request is not None else None,
+                                   DISCONNECT_POLL_MS / 1000.0)
+    except Overloaded:
+        return _errors(ids, lines, "inference queue full")
+    except DeadlineExceeded as e:
+        if e.reason == "cancelled":
+            raise
+        return _errors(ids, lines, "deadline exceeded")
+    out = bytearray()
+    for item_id, (cid, label, p, suggestion) in zip(ids, results):
+        out += _line({
+            "id": item_id,
+            "classification_id": str(cid),
+            "label": label,
+            "score_produtivo": round(float(p), 3),
+            "threshold_used": bundle.threshold,
+            "suggestion": suggestion,
+        })
+    return bytes(out)
+
+
+async def classify_ndjson(request: Request, timeout_s: Optional[float] = None) -> AsyncIterator[bytes]:
+    """Classify `{id, text}` lines in chunks of STREAM_CHUNK_ITEMS, yielding NDJSON results per chunk.
+
+    Only one chunk of texts is held at a time. Invalid lines produce an
+    `{"id", "line", "error"}` line as soon as they are read, so output order
+    follows completion, not input; match results by `id`. Each chunk is
+    admitted to the inference pool like a /classify_batch call and gets its
+    own `timeout_s` deadline. Stops early when the client goes away.
+    """
+    ids: List[Any] = []
+    lines: List[int] = []
+    texts: List[str] = []
+    try:
+        async for line_no, raw in _ndjson_lines(request):
+            if raw is not None and not raw.strip():
+                continue
+            item_id, text, error = _parse_item(line_no, raw)
+            if error is not None:
+                yield _line({"id": item_id, "line": line_no, "error": error})
+                continue
+            ids.append(item_id)
+            lines.append(line_no)
+            texts.append(text)
+            if len(texts) >= STREAM_CHUNK_ITEMS:
+                # still reading the body: a disconnect surfaces as ClientDisconnect on the next read
+                yield await _run_chunk(ids, lines, texts, timeout_s)
+                ids, lines, texts = [], [], []
+        # body fully read: receive() is free, so disconnects can be polled directly
+        if texts:
+            yield await _run_chunk(ids, lines, texts, timeout_s, request)
+    except (ClientDisconnect, DeadlineExceeded):
+        return
@@ -0,0 +1,339 @@
+# app/cli/classify.py
+"""Offline batch classification.
+
+    python -m app.cli.classify emails.csv scores.jsonl --workers 4 [--telemetry]
+
+Reads CSV, JSONL/NDJSON or Parquet, shards chunks across worker processes
+(each loads the model once), and appends results to the output file. Texts
+go through the API's input check (`clean_text`); rejected rows are appended
+to `<output>.errors.jsonl` instead. A `<output>.ckpt` file is rewritten after
+every chunk, so re-running the same command after a crash resumes where it
+stopped; it also records how many result rows `--telemetry` has loaded, so a
+rerun only loads the rest.
+"""
+import argparse
+import csv
+import json
+import multiprocessing as mp
+import os
+import sys
+import time
+import uuid
+from collections import deque
+from datetime import datetime, timezone
+from typing import Any, Deque, Dict, Iterator, List, Optional, Tuple
+
+OUTPUT_FIELDS = [
+    "row", "id", "classification_id", "label", "score_produtivo", "template_code", "language",
+    "text_length_chars", "latency_ms", "threshold_used", "model_version", "embedding_model", "ts_utc",
+]
+
+ERROR_FIELDS = ["row", "id", "error"]
+
+Record = Tuple[int, Any, str]  # (row index, id, text)
+
+
+# ================== Input ==================
+def _iter_csv(path: str) -> Iterator[dict]:
+    with open(path, "r", encoding="utf-8", newline="") as f:
+        yield from csv.DictReader(f)
+
+
+def _iter_jsonl(path: str) -> Iterator[dict]:
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def _iter_parquet(path: str) -> Iterator[dict]:
+    try:
+        import pyarrow.parquet as pq
+    except ImportError as e:
+        raise SystemExit("Parquet input needs pyarrow (pip install pyarrow)") from e
+    for batch in pq.ParquetFile(path).iter_batches(batch_size=4096):
+        yield from batch.to_pylist()
+
+
+def iter_records(path: str, text_col: str, id_col: Optional[str]) -> Iterator[Record]:
+    ext = os.path.splitext(path)[1].lower()
+    if ext == ".csv":
+        rows = _iter_csv(path)
+    elif ext in (".jsonl", ".ndjson"):
+        rows = _iter_jsonl(path)
+    elif ext == ".parquet":
+        rows = _iter_parquet(path)
+    else:
+        raise SystemExit(f"unsupported input format: {ext} (use .csv, .jsonl, .ndjson or .parquet)")
+    for i, row in enumerate(rows):
+        yield i, (row.get(id_col) if id_col else i), str(row.get(text_col) or "")
+
+
+def iter_chunks(records: Iterator[Record], size: int, skip: int) -> Iterator[List[Record]]:
+    chunk: List[Record] = []
+    for rec in records:
+        if rec[0] < skip:
+            continue
+        chunk.append(rec)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+# ================== Workers ==================
+def _init_worker() -> None:
+    # Load the model once per process
+    from app.ml.registry import REGISTRY
+    REGISTRY.load_once()
+
+
+def _classify_chunk(chunk: List[Record]) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]], int]:
+    """(result rows, rejected rows, next row index) for one chunk."""
+    from app.api.v1.schemas import clean_text
+    from app.core.config import LANG_SET
+    from app.ml.inference import infer_labels, decide_label
+    from app.ml.registry import get_bundle
+    from app.utils.lang import detect_languages
+    from app.utils.suggest import suggest_replies_pt
+
+    bundle = get_bundle()
+    start = time.perf_counter()
+    accepted: List[Record] = []
+    rejected: List[Dict[str, Any]] = []
+    for row, item_id, text in chunk:
+        try:
+            accepted.append((row, item_id, clean_text(text)))
+        except ValueError as e:
+            rejected.append({"row": row, "id": item_id, "error": str(e)})
+    next_row = chunk[-1][0] + 1 if chunk else 0
+    chunk = accepted
+    texts = [t for _, _, t in chunk]
+    probs = infer_labels(texts, bundle).tolist() if texts else []
+    labels = [decide_label(float(p), bundle.threshold) for p in probs]
+    suggestions = suggest_replies_pt(texts, labels)
+    per_item_ms = int((time.perf_counter() - start) * 1000 / max(len(texts), 1))
+    ts_utc = datetime.now(timezone.utc).isoformat()
+    out = []
+    for (row, item_id, _), text, p, label, (_, template_code), lang in zip(
+            chunk, texts, probs, labels, suggestions, detect_languages(texts)):
+        out.append({
+            "row": row,
+            "id": item_id,
+            "classification_id": str(uuid.uuid4()),
+            "label": label,
+            "score_produtivo": round(float(p), 4),
+            "template_code": template_code,
+            "language": lang if lang in LANG_SET else "unknown",
+            "text_length_chars": len(text),
+            "latency_ms": per_item_ms,
+            "threshold_used": float(bundle.threshold),
+            "model_version": bundle.version,
+            "embedding_model": bundle.emb_id,
+            "ts_utc": ts_utc,
+        })
+    return out, rejected, next_row
+
+
+# ================== Output + checkpoints ==================
+class ResultWriter:
+    """Appends result rows as JSONL or CSV (rejects as JSONL) and records a byte-exact checkpoint after each chunk."""
+
+    def __init__(self, path: str, source: str):
+        self.path = path
+        self.ckpt_path = path + ".ckpt"
+        self.errors_path = path + ".errors.jsonl"
+        self.source = source
+        self.is_csv = path.lower().endswith(".csv")
+        self.rows_done = 0
+        self.telemetry_rows = 0  # result rows already bulk-loaded by --telemetry
+        ckpt = self._read_ckpt()
+        if ckpt and os.path.exists(path):
+            self.rows_done = ckpt["rows_done"]
+            self.telemetry_rows = ckpt.get("telemetry_rows", 0)
+            # drop anything written after the last checkpoint (killed mid-chunk)
+            with open(path, "r+b") as f:
+                f.truncate(ckpt["output_bytes"])
+            if os.path.exists(self.errors_path):
+                with open(self.errors_path, "r+b") as f:
+                    f.truncate(ckpt.get("errors_bytes", 0))
+        self.f = open(path, "a", encoding="utf-8", newline="")
+        self.errors = open(self.errors_path, "a", encoding="utf-8")
+        self.csv = csv.DictWriter(self.f, fieldnames=OUTPUT_FIELDS) if self.is_csv else None
+        if self.csv and self.f.tell() == 0:
+            self.csv.writeheader()
+
+    def _read_ckpt(self) -> Optional[dict]:
+        if not os.path.exists(self.ckpt_path):
+            return None
+        with open(self.ckpt_path, "r", encoding="utf-8") as f:
+            ckpt = json.load(f)
+        if ckpt.get("input") != self.source:
+            raise SystemExit(f"{self.ckpt_path} belongs to {ckpt.get('input')!r}; remove it to start over")
+        return ckpt
+
+    def write(self, rows: List[Dict[str, Any]], rejected: List[Dict[str, Any]], next_row: int) -> None:
+        for r in rows:
+            if self.csv:
+                self.csv.writerow(r)
+            else:
+                self.f.write(json.dumps(r, ensure_ascii=False) + "\n")
+        for r in rejected:
+            self.errors.write(json.dumps(r, ensure_ascii=False) + "\n")
+        for f in (self.f, self.errors):
+            f.flush()
+            os.fsync(f.fileno())
+        self.rows_done = next_row
+        self._write_ckpt()
+
+    def loaded(self, telemetry_rows: int) -> None:
+        """Record that the first `telemetry_rows` result rows are in the classification table."""
+        self.telemetry_rows = telemetry_rows
+        self._write_ckpt()
+
+    def _write_ckpt(self) -> None:
+        tmp = self.ckpt_path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"input": self.source, "rows_done": self.rows_done, "output_bytes": self.f.tell(),
+                       "errors_bytes": self.errors.tell(), "telemetry_rows": self.telemetry_rows}, f)
+        os.replace(tmp, self.ckpt_path)
+
+    def close(self) -> None:
+        self.f.close()
+        self.errors.close()
+
+
+def iter_output(path: str) -> Iterator[Dict[str, Any]]:
+    if path.lower().endswith(".csv"):
+        yield from _iter_csv(path)
+    else:
+        yield from _iter_jsonl(path)
+
+
+# ================== Telemetry bulk load ==================
+def bulk_load_telemetry(writer: ResultWriter, batch_rows: int = 5000) -> int:
+    """Insert the result rows not loaded yet, advancing the checkpoint's `telemetry_rows` per batch.
+
+    Rows keep the `ts_utc` they were classified at (load time for outputs
+    written before that column existed), so they land in the right partition.
+    A run killed between a batch's commit and its checkpoint leaves at most
+    that batch loaded but unrecorded, so the first batch is filtered against
+    the ids already in the table.
+    """
+    from app.db.session import SessionLocal
+    from app.repositories.telemetry_repo import (
+        build_classification_row, existing_classification_ids, insert_classification_rows
+    )
+
+    if SessionLocal is None:
+        raise SystemExit("--telemetry needs DATABASE_URL")
+    loaded = 0
+    done = writer.telemetry_rows
+    first = True
+    batch: List[Dict[str, Any]] = []
+
+    def flush(db) -> int:
+        nonlocal batch, done, first
+        rows = batch
+        if first and rows:
+            present = existing_classification_ids(db, [r["classification_id"] for r in rows])
+            rows = [r for r in rows if r["classification_id"] not in present]
+            first = False
+        n = insert_classification_rows(db, rows)
+        done += len(batch)
+        writer.loaded(done)
+        batch = []
+        return n
+
+    with SessionLocal() as db:
+        for i, r in enumerate(iter_output(writer.path)):
+            if i < done:
+                continue
+            batch.append(build_classification_row(
+                classification_id=uuid.UUID(r["classification_id"]),
+                model_version=r["model_version"],
+                embedding_model=r["embedding_model"],
+                threshold_used=float(r["threshold_used"]),
+                label=r["label"],
+                score_produtivo=float(r["score_produtivo"]),
+                template_code=r["template_code"],
+                text_length_chars=int(r["text_length_chars"]),
+                latency_ms=int(r["latency_ms"]),
+                language=r["language"],
+                ts_utc=datetime.fromisoformat(r["ts_utc"]) if r.get("ts_utc") else None,
+            ))
+            if len(batch) >= batch_rows:
+                loaded += flush(db)
+        loaded += flush(db)
+    return loaded
+
+
+# ================== Main ==================
+def main(argv: Optional[List[str]] = None) -> int:
+    ap = argparse.ArgumentParser(prog="python -m app.cli.classify", description=__doc__.split("\n\n")[0])
+    ap.add_argument("input", help=".csv, .jsonl/.ndjson or .parquet")
+    ap.add_argument("output", help=".jsonl or .csv (appended to; resumable)")
+    ap.add_argument("--text-col", default="text")
+    ap.add_argument("--id-col", default="id", help="column echoed back as `id` (empty: row number)")
+    ap.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    ap.add_argument("--chunk-size", type=int, default=256)
+    ap.add_argument("--telemetry", action="store_true",
+                    help="bulk-load results not loaded by an earlier run into the classification table at the end")
+    args = ap.parse_args(argv)
+
+    source = os.path.abspath(args.input)
+    writer = ResultWriter(args.output, source)
+    skip = writer.rows_done
+    if skip:
+        print(f"resuming after {skip} rows", file=sys.stderr)
+
+    chunks = iter_chunks(iter_records(args.input, args.text_col, args.id_col or None), args.chunk_size, skip)
+    done = 0
+    rejected = 0
+    start = time.perf_counter()
+
+    def record(result: Tuple[List[Dict[str, Any]], List[Dict[str, Any]], int]) -> None:
+        nonlocal done, rejected
+        rows, rejects, next_row = result
+        writer.write(rows, rejects, next_row)
+        done += len(rows)
+        rejected += len(rejects)
+        elapsed = time.perf_counter() - start
+        print(f"\r{skip + done + rejected} rows ({done / elapsed:.1f} items/s)", end="", file=sys.stderr)
+
+    try:
+        workers = max(1, args.workers)
+        with mp.get_context("spawn").Pool(workers, initializer=_init_worker) as pool:
+            # At most 2 chunks per worker in flight, so memory stays bounded however large
+            # the input is (Pool.imap would read it all ahead). Results are taken in input
+            # order, so the checkpoint is a simple row watermark.
+            window: Deque = deque()
+            for chunk in chunks:
+                window.append(pool.apply_async(_classify_chunk, (chunk,)))
+                if len(window) >= 2 * workers:
+                    record(window.popleft().get())
+            while window:
+                record(window.popleft().get())
+        elapsed = time.perf_counter() - start
+        print(file=sys.stderr)
+        print(json.dumps({
+            "rows": done,
+            "rejected": rejected,
+            "resumed_from": skip,
+            "seconds": round(elapsed, 2),
+            "items_per_s": round(done / elapsed, 1) if elapsed > 0 else 0.0,
+            "workers": args.workers,
+        }))
+        if rejected:
+            print(f"{rejected} rows rejected, see {writer.errors_path}", file=sys.stderr)
+
+        if args.telemetry:
+            print(json.dumps({"telemetry_rows": bulk_load_telemetry(writer)}))
+    finally:
+        writer.close()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,107 @@
+# app/cli/recalibrate.py
+"""Propose a decision threshold from feedback telemetry.
+
+    python -m app.cli.recalibrate [--since-days 90] [--objective f1] [--min-precision 0.9] [--dry-run]
+
+Streams classification rows that received feedback (server-side cursor,
+`--chunk-rows` at a time) into per-(model_version, template_code) score
+histograms, then reports precision / recall / F1 / helpful-rate at the
+proposed and current thresholds per model and template (see
+app/ml/recalibration.py for how feedback maps to right/wrong labels).
+
+For the model in MODEL_DIR, the proposal is written to THRESHOLD_FILE
+(default `MODEL_DIR/threshold.json`); the service uses it on its next load
+or `/admin/reload`, unless `THRESHOLD` is set.
+"""
+import argparse
+import json
+import os
+import time
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional
+
+from sqlalchemy import select
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    from app.core.config import ARTS_DIR, THRESHOLD_FILE
+    from app.db.models import ModelVersion
+    from app.db.session import engine
+    from app.ml.model_loader import DEFAULT_EMB_ID, resolve_threshold
+    from app.ml.recalibration import FeedbackCurves, propose, summarize
+    from app.repositories.telemetry_repo import stream_feedback_scores
+
+    ap = argparse.ArgumentParser(prog="python -m app.cli.recalibrate", description=__doc__.split("\n\n")[0])
+    ap.add_argument("--since-days", type=int, default=90, help="only classifications from the last N days (0 = all)")
+    ap.add_argument("--objective", choices=("f1", "helpful_rate"), default="f1")
+    ap.add_argument("--min-precision", type=float, help="instead: lowest threshold with at least this precision")
+    ap.add_argument("--min-judged", type=int, default=200, help="label-judged feedback rows needed for a proposal")
+    ap.add_argument("--bins", type=int, default=1000, help="score histogram bins (threshold resolution)")
+    ap.add_argument("--chunk-rows", type=int, default=50_000)
+    ap.add_argument("--curves", type=float, default=0.0, metavar="STEP", help="include curves sampled every STEP (e.g. 0.01)")
+    ap.add_argument("--model-dir", default=ARTS_DIR)
+    ap.add_argument("--out", help=f"threshold file (default: <model-dir>/{THRESHOLD_FILE or 'threshold.json'})")
+    ap.add_argument("--dry-run", action="store_true", help="report only, write nothing")
+    args = ap.parse_args(argv)
+
+    if engine is None:
+        raise SystemExit("recalibration needs DATABASE_URL")
+    with open(os.path.join(args.model_dir, "metadata.json"), "r", encoding="utf-8") as f:
+        meta = json.load(f)
+    served = (meta.get("created_at", "unknown"), meta.get("embedding_model"))
+    # what the service serves for this directory: THRESHOLD, else an earlier proposal, else metadata.json
+    served_threshold, served_source = resolve_threshold(
+        args.model_dir, meta, meta.get("embedding_model", DEFAULT_EMB_ID))
+
+    start = time.perf_counter()
+    since = datetime.now(timezone.utc) - timedelta(days=args.since_days) if args.since_days > 0 else None
+    acc = FeedbackCurves(args.bins)
+    with engine.connect() as conn:
+        for chunk in stream_feedback_scores(conn, since, args.chunk_rows):
+            acc.add(chunk)
+        versions = {mid: (v, e) for mid, v, e in conn.execute(
+            select(ModelVersion.model_id, ModelVersion.model_version, ModelVersion.embedding_model))}
+
+    report = {"since": since.isoformat() if since else None, "rows": acc.rows, "models": []}
+    written = None
+    for mid in acc.models():
+        version, emb = versions.get(mid, ("unknown", "unknown"))
+        is_served = version == served[0] and (served[1] is None or emb == served[1])
+        current = served_threshold if is_served else None
+        counts = acc.total(mid)
+        proposed = propose(counts, args.objective, args.min_precision, args.min_judged)
+        entry = {"model_version": version, "embedding_model": emb, "served": is_served,
+                 "current_source": served_source if is_served else None,
+                 **summarize(counts, proposed, {"current": current}, args.curves), "templates": {}}
+        for code in acc.templates(mid):
+            t_counts = acc.total(mid, code)
+            entry["templates"][code] = summarize(
+                t_counts, propose(t_counts, args.objective, args.min_precision, args.min_judged),
+                {"model_proposed": proposed, "current": current}, args.curves)
+        report["models"].append(entry)
+
+        if is_served and proposed is not None and not args.dry_run:
+            written = args.out or os.path.join(args.model_dir, THRESHOLD_FILE or "threshold.json")
+            doc = {
+                "threshold_produtivo": proposed,
+                "model_version": version,
+                "embedding_model": emb,
+                "created_at": datetime.now(timezone.utc).isoformat(),
+                "objective": f"precision>={args.min_precision}" if args.min_precision is not None else args.objective,
+                "since": report["since"],
+                "feedback": entry["feedback"],
+                "label_judged": entry["label_judged"],
+                "at_threshold": entry["at_proposed"],
+            }
+            with open(written + ".tmp", "w", encoding="utf-8") as f:
+                json.dump(doc, f, indent=2)
+            os.replace(written + ".tmp", written)
+
+    report["written"] = written
+    report["seconds"] = round(time.perf_counter() - start, 2)
+    print(json.dumps(report, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
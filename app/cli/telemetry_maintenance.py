@@ -0,0 +1,76 @@
+# app/cli/telemetry_maintenance.py
+"""Telemetry partitions, hourly rollups and retention (Postgres).
+
+    python -m app.cli.telemetry_maintenance [--months-ahead 3] [--retention-months 13] [--rollup-hours 48]
+    python -m app.cli.telemetry_maintenance --partitions-only   # what the entrypoint runs on start
+
+Run it hourly (cron / scheduled task). It creates the coming months'
+`classification` partitions, recomputes `classification_hourly` for the last
+`--rollup-hours` hours, and, only when `--retention-months` (default
+TELEMETRY_RETENTION_MONTHS, 0) is set, drops older partitions. Concurrent
+runs are safe: a second run exits without doing anything while the first
+holds the lock.
+"""
+import argparse
+import json
+import time
+from datetime import datetime, timedelta, timezone
+from typing import List, Optional
+
+from sqlalchemy import text
+
+# any constant works; it only has to be the same for every run
+_LOCK_ID = 0x6175746f75  # "autou"
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    from app.core.config import TELEMETRY_PARTITIONS_AHEAD, TELEMETRY_RETENTION_MONTHS, TELEMETRY_ROLLUP_HOURS
+    from app.db.session import engine
+    from app.repositories.telemetry_maintenance_repo import (
+        add_months, drop_expired, ensure_partitions, month_start, rollup_hourly
+    )
+
+    ap = argparse.ArgumentParser(prog="python -m app.cli.telemetry_maintenance", description=__doc__.split("\n\n")[0])
+    ap.add_argument("--months-ahead", type=int, default=TELEMETRY_PARTITIONS_AHEAD)
+    ap.add_argument("--retention-months", type=int, default=TELEMETRY_RETENTION_MONTHS, help="0 = keep forever")
+    ap.add_argument("--rollup-hours", type=int, default=TELEMETRY_ROLLUP_HOURS, help="0 = skip rollups")
+    ap.add_argument("--partitions-only", action="store_true", help="only create partitions (no rollups or retention)")
+    args = ap.parse_args(argv)
+    if args.partitions_only:
+        args.rollup_hours = args.retention_months = 0
+
+    if engine is None:
+        raise SystemExit("telemetry maintenance needs DATABASE_URL")
+    if engine.dialect.name != "postgresql":
+        raise SystemExit("telemetry maintenance needs Postgres (partitioning)")
+
+    now = datetime.now(timezone.utc)
+    report = {}
+    start = time.perf_counter()
+    with engine.connect() as conn:
+        if not conn.execute(text("SELECT pg_try_advisory_lock(:id)"), {"id": _LOCK_ID}).scalar():
+            print(json.dumps({"skipped": "another run holds the lock"}))
+            return 0
+        conn.commit()
+        try:
+            with conn.begin():
+                report["partitions_created"] = ensure_partitions(conn, now, 1 + max(0, args.months_ahead))
+            if args.rollup_hours > 0:
+                until = now.replace(minute=0, second=0, microsecond=0) + timedelta(hours=1)
+                with conn.begin():
+                    report["rollup_rows"] = rollup_hourly(conn, until - timedelta(hours=args.rollup_hours + 1), until)
+            if args.retention_months > 0:
+                cutoff = add_months(month_start(now), -args.retention_months)
+                with conn.begin():
+                    report["partitions_dropped"] = drop_expired(conn, cutoff)
+                report["retention_cutoff"] = cutoff.isoformat()
+        finally:
+            conn.execute(text("SELECT pg_advisory_unlock(:id)"), {"id": _LOCK_ID})
+            conn.commit()
+    report["seconds"] = round(time.perf_counter() - start, 2)
+    print(json.dumps(report))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
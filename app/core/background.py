@@ -0,0 +1,152 @@
+# app/core/background.py
+"""Queue + daemon thread that hands items to a handler in batches.
+
+The telemetry writer, the embedding store and the micro-batcher all queue
+work from request handlers and process it on one background thread. This
+is that machinery, once: a (bounded) queue, a lazily started daemon thread,
+batching by size and age, a `stop()` that handles whatever is still queued,
+and `drain()` to wait until everything queued so far has been handled.
+
+A batch goes to `handle` once it has `max_batch` items, once its first item
+is `max_wait_ms` old, or as soon as the queue is empty while `hold()` is
+false (the micro-batcher only waits for company while inference is busy).
+An exception from `handle` is logged and counted in `errors`; it never
+stops the thread.
+"""
+import logging
+import threading
+import time
+from queue import Empty, Full, Queue
+from typing import Any, Callable, List, Optional
+
+from app.core.metrics import EVENTS, QUEUE_DEPTH
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+
+class _Barrier(threading.Event):
+    """Queued by `drain()`; set once everything queued before it was handled."""
+
+
+class BackgroundQueue:
+    def __init__(self, name: str, handle: Callable[[List[Any]], None], max_queue: int = 0,
+                 max_batch: int = 1, max_wait_ms: float = 0.0, hold: Optional[Callable[[], bool]] = None):
+        self.name = name
+        self.handle = handle
+        self.max_batch = max(1, max_batch)
+        self.max_wait_s = max(0.0, max_wait_ms) / 1000.0
+        self.hold = hold or (lambda: True)
+        self._queue: Queue = Queue(maxsize=max(0, max_queue))
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self.errors = 0  # batches whose handler raised
+
+    @property
+    def started(self) -> bool:
+        return self._thread is not None
+
+    def start(self) -> None:
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+                self._thread.start()
+
+    def stop(self, timeout: float = 10.0) -> None:
+        """Handle whatever is queued and stop the thread."""
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            self._queue.put(_STOP)
+            thread.join(timeout)
+
+    def put(self, item: Any, timeout: float = 0.0) -> bool:
+        """Queue an item, waiting up to `timeout` seconds for room; False if the queue stayed full."""
+        try:
+            if timeout > 0:
+                self._queue.put(item, timeout=timeout)
+            else:
+                self._queue.put_nowait(item)
+        except Full:
+            return False
+        return True
+
+    def drain(self, timeout: float = 5.0) -> bool:
+        """Wait until everything queued before this call was handled; False on timeout or if not started."""
+        if self._thread is None:
+            return False
+        barrier = _Barrier()
+        try:
+            self._queue.put(barrier, timeout=timeout)
+        except Full:
+            return False
+        return barrier.wait(timeout)
+
+    def qsize(self) -> int:
+        return self._queue.qsize()
+
+    def register_metrics(self, queue: str, component: str) -> None:
+        """Queue depth and handler errors on /metrics."""
+        QUEUE_DEPTH.add(self.qsize, queue)
+        EVENTS.add(lambda: self.errors, component, "handler_errors")
+
+    def _handle(self, batch: List[Any]) -> None:
+        if not batch:
+            return
+        try:
+            self.handle(batch)
+        except Exception:
+            self.errors += 1
+            logger.exception("%s failed to handle a batch of %d", self.name, len(batch))
+
+    def _timeout(self, batch: List[Any], started: float) -> Optional[float]:
+        if not batch:
+            return None  # nothing to flush: sleep until an item comes in
+        if not self.hold():
+            return 0.0
+        return started + self.max_wait_s - time.monotonic()
+
+    def _run(self) -> None:
+        batch: List[Any] = []
+        started = 0.0
+        while True:
+            timeout = self._timeout(batch, started)
+            try:
+                item = self._queue.get() if timeout is None else (
+                    self._queue.get(timeout=timeout) if timeout > 0 else self._queue.get_nowait())
+            except Empty:
+                item = None
+            if item is _STOP:
+                self._shutdown(batch)
+                return
+            if isinstance(item, _Barrier):
+                self._handle(batch)
+                batch = []
+                item.set()
+                continue
+            if item is not None:
+                if not batch:
+                    started = time.monotonic()
+                batch.append(item)
+            if batch and (item is None or len(batch) >= self.max_batch
+                          or time.monotonic() >= started + self.max_wait_s):
+                self._handle(batch)
+                batch = []
+
+    def _shutdown(self, batch: List[Any]) -> None:
+        # handle anything queued before (or raced with) the stop
+        barriers = []
+        while True:
+            try:
+                rest = self._queue.get_nowait()
+            except Empty:
+                break
+            if isinstance(rest, _Barrier):
+                barriers.append(rest)
+            elif rest is not _STOP:
+                batch.append(rest)
+        for i in range(0, len(batch), self.max_batch):
+            self._handle(batch[i:i + self.max_batch])
+        for barrier in barriers:
+            barrier.set()
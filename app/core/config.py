@@ -14,3 +14,117 @@ TELEMETRY_ON = os.environ.get("TELEMETRY", "on").lower() in ("1", "true", "on",
 MAX_TEXT_CHARS = int(os.environ.get("MAX_TEXT_CHARS", "20000"))
 MAX_BATCH_ITEMS = int(os.environ.get("MAX_BATCH_ITEMS", "200"))
 LANG_SET = {"pt", "en", "unknown"}
+
+# Micro-batching of concurrent /classify requests; a request waits up to
+# BATCH_MAX_WAIT_MS for company only while every inference slot is busy
+MICRO_BATCH_ON = os.environ.get("MICRO_BATCH", "on").lower() in ("1", "true", "on", "yes")
+BATCH_MAX_SIZE = int(os.environ.get("BATCH_MAX_SIZE", "32"))
+BATCH_MAX_WAIT_MS = float(os.environ.get("BATCH_MAX_WAIT_MS", "5"))
+
+# Embedding/score cache (keyed on normalized text + model version)
+CACHE_ON = os.environ.get("CACHE", "on").lower() in ("1", "true", "on", "yes")
+CACHE_MAX_ITEMS = int(os.environ.get("CACHE_MAX_ITEMS", "10000"))
+CACHE_TTL_S = float(os.environ.get("CACHE_TTL_S", "3600"))
+CACHE_BACKEND = os.environ.get("CACHE_BACKEND", "memory").lower()  # memory | sqlite
+CACHE_SQLITE_PATH = os.environ.get("CACHE_SQLITE_PATH", "/tmp/autou_score_cache.sqlite")
+
+# Background telemetry writer
+TELEMETRY_QUEUE_MAX = int(os.environ.get("TELEMETRY_QUEUE_MAX", "10000"))
+TELEMETRY_FLUSH_ROWS = int(os.environ.get("TELEMETRY_FLUSH_ROWS", "500"))
+TELEMETRY_FLUSH_MS = float(os.environ.get("TELEMETRY_FLUSH_MS", "200"))
+TELEMETRY_FULL_POLICY = os.environ.get("TELEMETRY_FULL_POLICY", "drop").lower()  # drop | block
+TELEMETRY_BLOCK_MS = float(os.environ.get("TELEMETRY_BLOCK_MS", "50"))
+
+# Embedding backend: torch | onnx | onnx-int8 (falls back to metadata.json "embed_backend")
+EMBED_BACKEND = os.environ.get("EMBED_BACKEND", "").lower()
+# Extra backends for tests/benchmarks: modules imported on first load that call
+# app.ml.model_loader.register_embed_backend (e.g. benchmarks.hashing_backend)
+EMBED_BACKEND_MODULES = [m.strip() for m in os.environ.get("EMBED_BACKEND_MODULES", "").split(",") if m.strip()]
+ONNX_PARITY_TOL = float(os.environ.get("ONNX_PARITY_TOL", "0.01"))
+
+# Classifier head: fused NumPy evaluation of the calibrated model (sklearn fallback)
+FUSED_HEAD_ON = os.environ.get("FUSED_HEAD", "on").lower() in ("1", "true", "on", "yes")
+FUSED_HEAD_PARITY_TOL = float(os.environ.get("FUSED_HEAD_PARITY_TOL", "1e-4"))
+
+# Encoder input shaping: char budget per segment, long-text strategy and length-bucketed batching
+EMBED_CHARS_PER_TOKEN = int(os.environ.get("EMBED_CHARS_PER_TOKEN", "4"))
+LONG_TEXT_STRATEGY = os.environ.get("LONG_TEXT_STRATEGY", "head").lower()  # head | head_tail | chunk_mean
+MAX_CHUNKS = int(os.environ.get("MAX_CHUNKS", "8"))
+EMBED_BATCH_SIZE = int(os.environ.get("EMBED_BATCH_SIZE", "32"))
+EMBED_BATCH_CHARS = int(os.environ.get("EMBED_BATCH_CHARS", "16384"))
+
+# NDJSON streaming endpoint
+STREAM_CHUNK_ITEMS = int(os.environ.get("STREAM_CHUNK_ITEMS", "64"))
+STREAM_MAX_LINE_BYTES = int(os.environ.get("STREAM_MAX_LINE_BYTES", str(MAX_TEXT_CHARS * 4 + 4096)))
+
+# Model loading: warmup batch sizes and Retry-After hint while not ready
+WARMUP_BATCH_SIZES = [int(n) for n in os.environ.get("WARMUP_BATCH_SIZES", "1,8,32").split(",") if n.strip()]
+MODEL_RETRY_AFTER_S = int(os.environ.get("MODEL_RETRY_AFTER_S", "5"))
+
+# Model registry / admin
+MODEL_HISTORY_MAX = int(os.environ.get("MODEL_HISTORY_MAX", "20"))
+ADMIN_TOKEN = os.environ.get("ADMIN_TOKEN", "")  # admin endpoints are disabled when empty
+# /admin/reload only loads directories directly under this one (default: MODEL_DIR's parent)
+MODELS_ROOT = os.path.abspath(os.environ.get("MODELS_ROOT", "") or os.path.dirname(os.path.abspath(ARTS_DIR)))
+
+# Inference execution: worker processes (0 = in-process threads), how they start, and load shedding
+# Each worker holds a private model copy: budget about one loaded model's RSS per worker
+# on top of the API process (benchmarks/bench_api.py reports it as `memory`).
+INFER_WORKERS = int(os.environ.get("INFER_WORKERS", "0"))
+INFER_START_METHOD = os.environ.get("INFER_START_METHOD", "forkserver").lower()  # forkserver | spawn
+INFER_THREADS = int(os.environ.get("INFER_THREADS", "4"))
+INFER_QUEUE_MAX = int(os.environ.get("INFER_QUEUE_MAX", "256"))
+OVERLOAD_RETRY_AFTER_S = int(os.environ.get("OVERLOAD_RETRY_AFTER_S", "1"))
+
+# Observability: Prometheus /metrics and per-request Server-Timing headers
+METRICS_ON = os.environ.get("METRICS", "on").lower() in ("1", "true", "on", "yes")
+SERVER_TIMING_ON = os.environ.get("SERVER_TIMING", "off").lower() in ("1", "true", "on", "yes")
+
+# Reply-suggestion rules and language detection
+SUGGEST_RULES_PATH = os.environ.get("SUGGEST_RULES_PATH", "")  # JSON rule table; built-in rules when empty
+RULES_SCAN_CHARS = int(os.environ.get("RULES_SCAN_CHARS", "4096"))  # 0 = scan whole text
+
+# Idempotency-Key handling for /classify and /classify_batch
+IDEMPOTENCY_ON = os.environ.get("IDEMPOTENCY", "on").lower() in ("1", "true", "on", "yes")
+IDEMPOTENCY_MAX_ITEMS = int(os.environ.get("IDEMPOTENCY_MAX_ITEMS", "100000"))
+IDEMPOTENCY_TTL_S = float(os.environ.get("IDEMPOTENCY_TTL_S", "86400"))  # 0 = keep until evicted
+IDEMPOTENCY_DB_ON = os.environ.get("IDEMPOTENCY_DB", "off").lower() in ("1", "true", "on", "yes")  # share keys across workers via DATABASE_URL
+IDEMPOTENCY_KEY_MAX_LEN = 255
+
+# Telemetry partitions, rollups and retention (python -m app.cli.telemetry_maintenance)
+TELEMETRY_PARTITIONS_AHEAD = int(os.environ.get("TELEMETRY_PARTITIONS_AHEAD", "3"))  # months created in advance
+TELEMETRY_RETENTION_MONTHS = int(os.environ.get("TELEMETRY_RETENTION_MONTHS", "0"))  # 0 = keep forever; deleting is opt-in
+TELEMETRY_ROLLUP_HOURS = int(os.environ.get("TELEMETRY_ROLLUP_HOURS", "48"))  # recomputed each run, so late feedback counts
+
+# Database connection pools (sync engine: migrations, CLIs, telemetry writer thread;
+# async engine: request-path queries)
+DB_ASYNC_ON = os.environ.get("DB_ASYNC", "on").lower() in ("1", "true", "on", "yes")
+DB_POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.environ.get("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT_S = float(os.environ.get("DB_POOL_TIMEOUT_S", "10"))  # max wait for a free connection
+DB_POOL_RECYCLE_S = int(os.environ.get("DB_POOL_RECYCLE_S", "1800"))  # -1 = never
+# drops connections the server or a proxy closed (restarts, idle timeouts) before use; "off" saves a round-trip per checkout
+DB_PRE_PING = os.environ.get("DB_PRE_PING", "on").lower() in ("1", "true", "on", "yes")
+DB_STATEMENT_TIMEOUT_MS = int(os.environ.get("DB_STATEMENT_TIMEOUT_MS", "5000"))  # Postgres only; 0 = none
+
+# Embedding store: every classification's embedding, appended to memory-mapped files
+# under EMBED_STORE_DIR (empty = off), searched by /similar
+EMBED_STORE_DIR = os.environ.get("EMBED_STORE_DIR", "")
+EMBED_STORE_DTYPE = os.environ.get("EMBED_STORE_DTYPE", "float32").lower()  # float32 | int8 (4x smaller)
+EMBED_STORE_QUEUE_MAX = int(os.environ.get("EMBED_STORE_QUEUE_MAX", "10000"))
+EMBED_STORE_FLUSH_ROWS = int(os.environ.get("EMBED_STORE_FLUSH_ROWS", "1024"))
+EMBED_STORE_FLUSH_MS = float(os.environ.get("EMBED_STORE_FLUSH_MS", "1000"))
+EMBED_STORE_NPROBE = int(os.environ.get("EMBED_STORE_NPROBE", "16"))  # IVF lists scanned per query
+SIMILAR_K_MAX = int(os.environ.get("SIMILAR_K_MAX", "50"))
+
+# Recalibrated decision threshold, written to MODEL_DIR by python -m app.cli.recalibrate and
+# used on (re)load when it names the loaded model; THRESHOLD still wins ("" = ignore the file)
+THRESHOLD_FILE = os.environ.get("THRESHOLD_FILE", "threshold.json")
+
+# Request deadlines for /classify, /classify_batch and each /classify_stream chunk:
+# X-Request-Timeout-Ms header (capped at REQUEST_TIMEOUT_MAX_MS), else REQUEST_TIMEOUT_MS (0 = none);
+# inference queued or running for an expired or disconnected request is dropped
+REQUEST_TIMEOUT_MS = int(os.environ.get("REQUEST_TIMEOUT_MS", "0"))
+REQUEST_TIMEOUT_MAX_MS = int(os.environ.get("REQUEST_TIMEOUT_MAX_MS", "60000"))  # 0 = no cap on the header
+DISCONNECT_POLL_MS = float(os.environ.get("DISCONNECT_POLL_MS", "100"))  # 0 = don't watch for disconnects
+DEADLINE_STATUS = int(os.environ.get("DEADLINE_STATUS", "504"))  # fast-fail status for expired requests
@@ -0,0 +1,164 @@
+# app/core/deadline.py
+"""Per-request deadlines and cancellation for inference work.
+
+A `Deadline` travels with a request from the route through the services
+into `encode_texts`, which calls `check()` before every encode sub-batch;
+the worker pool and micro-batcher check it before starting queued work. A
+request whose budget ran out, or whose client disconnected, raises
+`DeadlineExceeded` at the next check instead of finishing work nobody will
+read. `DEADLINES` counts failed requests per reason and stage, and the
+inference items that were dropped before being scored.
+
+`run_within` is the request-side half: it awaits the handler's work until
+it finishes, the deadline passes or the client disconnects, and in the
+latter two cases cancels the deadline and the work.
+"""
+import asyncio
+import threading
+import time
+from typing import Awaitable, Callable, Dict, Iterable, Optional, TypeVar
+
+from app.core.metrics import EVENTS
+
+T = TypeVar("T")
+
+STAGES = ("queued", "encode", "postprocess", "waiting")
+
+
+class DeadlineExceeded(RuntimeError):
+    """The request's deadline passed (`expired`) or its client went away (`cancelled`)."""
+
+    def __init__(self, reason: str, stage: str):
+        super().__init__(reason, stage)
+        self.reason = reason
+        self.stage = stage
+
+    def __str__(self) -> str:
+        return f"request {self.reason} during {self.stage}"
+
+
+class Deadline:
+    """Absolute time budget (None = unlimited) plus a cancel flag.
+
+    Pickles to its expiry time only, so inference worker processes still
+    honour the time budget (a disconnect is only seen in-process).
+    """
+
+    def __init__(self, timeout_s: Optional[float] = None):
+        self.expires_at = time.monotonic() + timeout_s if timeout_s else None
+        self._cancelled = threading.Event()
+
+    def __getstate__(self):
+        return {"expires_at": self.expires_at}
+
+    def __setstate__(self, state):
+        self.expires_at = state["expires_at"]
+        self._cancelled = threading.Event()
+
+    def cancel(self) -> None:
+        self._cancelled.set()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._cancelled.is_set()
+
+    def remaining(self) -> Optional[float]:
+        return None if self.expires_at is None else self.expires_at - time.monotonic()
+
+    def check(self, stage: str) -> None:
+        if self._cancelled.is_set():
+            raise DeadlineExceeded("cancelled", stage)
+        if self.expires_at is not None and time.monotonic() >= self.expires_at:
+            raise DeadlineExceeded("expired", stage)
+
+
+class DeadlineGroup:
+    """Work shared by several requests (a micro-batch): dead only once every member is."""
+
+    def __init__(self, members: Iterable[Deadline]):
+        self.members = list(members)
+
+    def check(self, stage: str) -> None:
+        error = None
+        for d in self.members:
+            try:
+                d.check(stage)
+                return
+            except DeadlineExceeded as e:
+                error = e
+        if error is not None:
+            raise error
+
+
+def check(deadline, stage: str) -> None:
+    """`deadline.check(stage)`, for code paths where the deadline is optional."""
+    if deadline is not None:
+        deadline.check(stage)
+
+
+async def _watch(disconnected: Callable[[], Awaitable[bool]], poll_s: float) -> None:
+    while not await disconnected():
+        await asyncio.sleep(poll_s)
+
+
+async def run_within(deadline: Deadline, work: Awaitable[T],
+                     disconnected: Optional[Callable[[], Awaitable[bool]]] = None, poll_s: float = 0.1) -> T:
+    """Result of `work`, or DeadlineExceeded(..., "waiting") once the deadline or the client is gone.
+
+    `disconnected` (e.g. `request.is_disconnected`) is polled every `poll_s`
+    seconds. Counts every DeadlineExceeded it raises in `DEADLINES`.
+    """
+    task = asyncio.ensure_future(work)
+    watch = asyncio.ensure_future(_watch(disconnected, poll_s)) if disconnected and poll_s > 0 else None
+    try:
+        remaining = deadline.remaining()
+        done, _ = await asyncio.wait([f for f in (task, watch) if f is not None],
+                                     timeout=None if remaining is None else max(remaining, 0.0),
+                                     return_when=asyncio.FIRST_COMPLETED)
+        if task in done:
+            return task.result()
+        if watch is not None and watch in done:
+            deadline.cancel()
+            raise DeadlineExceeded("cancelled", "waiting")
+        raise DeadlineExceeded("expired", "waiting")
+    except DeadlineExceeded as e:
+        DEADLINES.note(e)
+        raise
+    finally:
+        if watch is not None:
+            watch.cancel()
+        if not task.done():
+            deadline.cancel()  # also stops inference already handed to a worker
+            task.cancel()
+
+
+class DeadlineStats:
+    """Requests failed by reason x stage, and inference items dropped unscored (queued / mid-encode)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counts: Dict[str, Dict[str, int]] = {r: {s: 0 for s in STAGES} for r in ("expired", "cancelled")}
+        self.dropped: Dict[str, int] = {"queued": 0, "encode": 0}
+
+    def note(self, e: DeadlineExceeded) -> None:
+        with self._lock:
+            by_stage = self.counts[e.reason]
+            by_stage[e.stage] = by_stage.get(e.stage, 0) + 1
+
+    def note_dropped(self, stage: str, items: int) -> None:
+        with self._lock:
+            self.dropped[stage] = self.dropped.get(stage, 0) + items
+
+    def stats(self) -> dict:
+        with self._lock:
+            out = {reason: {"total": sum(by_stage.values()), **by_stage} for reason, by_stage in self.counts.items()}
+            out["items_dropped"] = dict(self.dropped)
+            return out
+
+
+DEADLINES = DeadlineStats()
+for _reason in ("expired", "cancelled"):
+    for _stage in STAGES:
+        EVENTS.add(lambda r=_reason, s=_stage: DEADLINES.counts[r][s], "deadline", f"{_reason}_{_stage}")
+for _stage in ("queued", "encode"):
+    EVENTS.add(lambda s=_stage: DEADLINES.dropped[s], "deadline", f"dropped_{_stage}")
@@ -0,0 +1,275 @@
+# app/core/metrics.py
+"""In-process metrics in the Prometheus text format (0.0.4), no client library needed.
+
+Stage durations all go to `autou_stage_seconds{stage=...}`. While a request
+is being handled they are also summed in a context-local `RequestTimings`,
+which `MetricsMiddleware` turns into a `Server-Timing` header. Stages that
+run outside a request (telemetry commits, worker processes) only feed the
+histogram.
+"""
+import functools
+import inspect
+import math
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, List, Optional, Sequence, Tuple, Union
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64, 128, 256)
+
+
+def _num(v: float) -> str:
+    if v == math.inf:
+        return "+Inf"
+    return repr(float(v))
+
+
+def _escape(v: str) -> str:
+    return v.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class _Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _labels(self, values: Tuple, extra: Tuple[Tuple[str, str], ...] = ()) -> str:
+        pairs = list(zip(self.labelnames, values)) + list(extra)
+        if not pairs:
+            return ""
+        return "{" + ",".join(f'{k}="{_escape(str(v))}"' for k, v in pairs) + "}"
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._series: Dict[Tuple, List[float]] = {}  # labels -> bucket counts + [sum, count]
+
+    def observe(self, value: float, *labels) -> None:
+        with self._lock:
+            s = self._series.get(labels)
+            if s is None:
+                s = self._series[labels] = [0.0] * (len(self.buckets) + 2)
+            for i, b in enumerate(self.buckets):
+                if value <= b:
+                    s[i] += 1
+                    break
+            s[-2] += value
+            s[-1] += 1
+
+    def render(self) -> List[str]:
+        lines = super().render()
+        with self._lock:
+            series = {k: list(v) for k, v in self._series.items()}
+        for labels, s in sorted(series.items()):
+            cumulative = 0.0
+            for b, n in zip(self.buckets, s):
+                cumulative += n
+                lines.append(f"{self.name}_bucket{self._labels(labels, (('le', _num(b)),))} {_num(cumulative)}")
+            lines.append(f"{self.name}_bucket{self._labels(labels, (('le', '+Inf'),))} {_num(s[-1])}")
+            lines.append(f"{self.name}_sum{self._labels(labels)} {_num(s[-2])}")
+            lines.append(f"{self.name}_count{self._labels(labels)} {_num(s[-1])}")
+        return lines
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, help, labelnames)
+        self._values: Dict[Tuple, float] = {}
+
+    def set(self, value: float, *labels) -> None:
+        with self._lock:
+            self._values[labels] = value
+
+    def render(self) -> List[str]:
+        lines = super().render()
+        with self._lock:
+            values = dict(self._values)
+        lines += [f"{self.name}{self._labels(k)} {_num(v)}" for k, v in sorted(values.items())]
+        return lines
+
+
+class Collected(_Metric):
+    """Gauge or counter read at scrape time from callbacks, one per label set.
+
+    Lets components keep their plain counters (the ones `/healthz` reports)
+    and expose them here without double bookkeeping.
+    """
+
+    def __init__(self, name: str, help: str, kind: str = "gauge", labelnames: Sequence[str] = ()):
+        super().__init__(name, help, labelnames)
+        self.kind = kind
+        self._sources: Dict[Tuple, Callable[[], Union[int, float]]] = {}
+
+    def add(self, fn: Callable[[], Union[int, float]], *labels) -> None:
+        self._sources[labels] = fn
+
+    def render(self) -> List[str]:
+        lines = super().render()
+        for labels, fn in sorted(self._sources.items()):
+            try:
+                value = float(fn())
+            except Exception:
+                continue
+            lines.append(f"{self.name}{self._labels(labels)} {_num(value)}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for m in self._metrics:
+            lines += m.render()
+        return "\n".join(lines) + "\n"
+
+
+METRICS = MetricsRegistry()
+
+STAGE_SECONDS = METRICS.register(Histogram(
+    "autou_stage_seconds", "Time spent per processing stage", ("stage",)))
+REQUEST_SECONDS = METRICS.register(Histogram(
+    "autou_request_seconds", "End-to-end HTTP request latency", ("method", "path", "status")))
+BATCH_SIZE = METRICS.register(Histogram(
+    "autou_inference_batch_size", "Texts per encode + predict_proba call", (), SIZE_BUCKETS))
+LAST_BATCH_SIZE = METRICS.register(Gauge(
+    "autou_inference_last_batch_size", "Texts in the most recent encode + predict_proba call"))
+QUEUE_DEPTH = METRICS.register(Collected(
+    "autou_queue_depth", "Items currently waiting in each internal queue", "gauge", ("queue",)))
+EVENTS = METRICS.register(Collected(
+    "autou_events_total", "Cumulative counters of the batcher, cache, inference pool and telemetry writer",
+    "counter", ("component", "event")))
+DB_POOL_WAIT = METRICS.register(Histogram(
+    "autou_db_pool_wait_seconds", "Time to get a connection from the pool (incl. opening a new one)", ("engine",)))
+DB_POOL_CONNECTIONS = METRICS.register(Collected(
+    "autou_db_pool_connections", "Connections per pool and state", "gauge", ("engine", "state")))
+
+
+# ================== Per-request stage timings ==================
+class RequestTimings:
+    __slots__ = ("stages", "handler_start", "handler_end")
+
+    def __init__(self):
+        self.stages: Dict[str, float] = {}
+        self.handler_start: Optional[float] = None
+        self.handler_end: Optional[float] = None
+
+
+_TIMINGS: ContextVar[Optional[RequestTimings]] = ContextVar("autou_request_timings", default=None)
+
+
+def note_stage(name: str, seconds: float) -> None:
+    """Add to the current request's Server-Timing only (already observed elsewhere)."""
+    rt = _TIMINGS.get()
+    if rt is not None:
+        rt.stages[name] = rt.stages.get(name, 0.0) + seconds
+
+
+def observe_stage(name: str, seconds: float) -> None:
+    STAGE_SECONDS.observe(seconds, name)
+
+
+@contextmanager
+def stage(name: str):
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        dt = time.perf_counter() - t0
+        STAGE_SECONDS.observe(dt, name)
+        note_stage(name, dt)
+
+
+def timed_handler(fn):
+    """Mark when the endpoint body starts/ends, so the middleware can split out
+    request parsing + validation (before) and response serialization (after)."""
+    def _mark(attr: str) -> None:
+        rt = _TIMINGS.get()
+        if rt is not None:
+            setattr(rt, attr, time.perf_counter())
+
+    if inspect.iscoroutinefunction(fn):
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            _mark("handler_start")
+            try:
+                return await fn(*args, **kwargs)
+            finally:
+                _mark("handler_end")
+    else:
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            _mark("handler_start")
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                _mark("handler_end")
+    return wrapper
+
+
+class MetricsMiddleware:
+    """Pure ASGI middleware: request latency histogram, validation/serialization
+    stages and (optionally) a `Server-Timing` response header."""
+
+    def __init__(self, app, server_timing: bool = False):
+        self.app = app
+        self.server_timing = server_timing
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        rt = RequestTimings()
+        token = _TIMINGS.set(rt)
+        t0 = time.perf_counter()
+        status_code = 500
+
+        async def _send(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+                now = time.perf_counter()
+                if rt.handler_start is not None:
+                    observe_stage("validation", rt.handler_start - t0)
+                    rt.stages["validation"] = rt.handler_start - t0
+                if rt.handler_end is not None:
+                    observe_stage("serialization", now - rt.handler_end)
+                    rt.stages["serialization"] = now - rt.handler_end
+                if self.server_timing:
+                    parts = [f"{k};dur={v * 1000:.2f}" for k, v in rt.stages.items()]
+                    parts.append(f"total;dur={(now - t0) * 1000:.2f}")
+                    message["headers"] = list(message.get("headers", [])) + [
+                        (b"server-timing", ", ".join(parts).encode("latin-1"))]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, _send)
+        finally:
+            _TIMINGS.reset(token)
+            route = scope.get("route")
+            # route templates only, so label cardinality stays bounded
+            path = getattr(route, "path", None) or "unmatched"
+            REQUEST_SECONDS.observe(time.perf_counter() - t0, scope["method"], path, str(status_code))
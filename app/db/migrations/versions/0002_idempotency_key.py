@@ -0,0 +1,21 @@
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "0002_idempotency_key"
+down_revision = "0001_init_telemetry"
+branch_labels = None
+depends_on = None
+
+def upgrade():
+    op.execute("""
+    CREATE TABLE IF NOT EXISTS idempotency_key (
+      key          TEXT PRIMARY KEY,
+      request_hash TEXT        NOT NULL,
+      response     JSONB       NOT NULL,
+      created_at   TIMESTAMPTZ NOT NULL DEFAULT NOW()
+    );
+    """)
+    op.execute("CREATE INDEX IF NOT EXISTS ix_idempotency_key_created_at ON idempotency_key (created_at);")
+
+def downgrade():
+    op.execute("DROP TABLE IF EXISTS idempotency_key;")
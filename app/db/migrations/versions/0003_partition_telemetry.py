@@ -0,0 +1,135 @@
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = "0003_partition_telemetry"
+down_revision = "0002_idempotency_key"
+branch_labels = None
+depends_on = None
+
+# Monthly partitions named classification_YYYY_MM, bounds in UTC. Rows outside
+# every partition land in classification_default until the maintenance job
+# (app/cli/telemetry_maintenance.py) creates their month and moves them. The
+# horizon is fixed here so the migration's DDL never depends on runtime config;
+# the job extends it to TELEMETRY_PARTITIONS_AHEAD.
+_INITIAL_MONTHS_AHEAD = 3
+_CREATE_PARTITIONS = """
+DO $$
+DECLARE m timestamp;
+BEGIN
+  FOR m IN SELECT generate_series(
+      date_trunc('month', COALESCE((SELECT min(ts_utc) FROM classification_legacy), now()) AT TIME ZONE 'UTC'),
+      date_trunc('month', now() AT TIME ZONE 'UTC') + make_interval(months => {months_ahead}),
+      interval '1 month')
+  LOOP
+    EXECUTE format(
+      'CREATE TABLE IF NOT EXISTS %I PARTITION OF classification FOR VALUES FROM (%L) TO (%L)',
+      'classification_' || to_char(m, 'YYYY_MM'),
+      m AT TIME ZONE 'UTC',
+      (m + interval '1 month') AT TIME ZONE 'UTC');
+  END LOOP;
+END $$;
+"""
+
+def upgrade():
+    op.execute("""
+    CREATE TABLE IF NOT EXISTS model_version (
+      model_id        SMALLINT GENERATED BY DEFAULT AS IDENTITY PRIMARY KEY,
+      model_version   TEXT        NOT NULL,
+      embedding_model TEXT        NOT NULL,
+      created_at      TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+      CONSTRAINT uq_model_version UNIQUE (model_version, embedding_model)
+    );
+    """)
+
+    # A foreign key to a partitioned table must include the partition key;
+    # feedback writes check the id with a join instead.
+    op.execute("ALTER TABLE feedback DROP CONSTRAINT IF EXISTS feedback_classification_id_fkey;")
+    op.execute("ALTER TABLE classification RENAME TO classification_legacy;")
+    op.execute("ALTER TABLE classification_legacy RENAME CONSTRAINT classification_pkey TO classification_legacy_pkey;")
+
+    # template_code is no longer a fixed list: rules can come from SUGGEST_RULES_PATH
+    op.execute("""
+    CREATE TABLE classification (
+      classification_id UUID        NOT NULL,
+      ts_utc            TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+      model_id          SMALLINT    NOT NULL REFERENCES model_version(model_id),
+      threshold_used    REAL        NOT NULL CONSTRAINT ck_threshold CHECK (threshold_used > 0 AND threshold_used <= 1),
+      label             TEXT        NOT NULL CHECK (label IN ('Produtivo','Improdutivo')),
+      score_produtivo   REAL        NOT NULL CONSTRAINT ck_score CHECK (score_produtivo >= 0 AND score_produtivo <= 1),
+      template_code     TEXT        NOT NULL,
+      text_length_chars INT         NOT NULL CONSTRAINT ck_text_len CHECK (text_length_chars >= 0),
+      latency_ms        INT         NOT NULL CONSTRAINT ck_latency CHECK (latency_ms >= 0),
+      language          TEXT        NOT NULL,
+      PRIMARY KEY (classification_id, ts_utc)
+    ) PARTITION BY RANGE (ts_utc);
+    """)
+    op.execute("CREATE TABLE classification_default PARTITION OF classification DEFAULT;")
+    op.execute(_CREATE_PARTITIONS.format(months_ahead=_INITIAL_MONTHS_AHEAD))
+    # rows arrive in time order, so a BRIN index stays tiny and prunes time-range scans
+    op.execute("CREATE INDEX ix_classification_ts_brin ON classification USING BRIN (ts_utc);")
+
+    op.execute("""
+    INSERT INTO model_version (model_version, embedding_model)
+    SELECT DISTINCT model_version, embedding_model FROM classification_legacy
+    ON CONFLICT (model_version, embedding_model) DO NOTHING;
+    """)
+    op.execute("""
+    INSERT INTO classification
+    SELECT l.classification_id, l.ts_utc, m.model_id, l.threshold_used, l.label, l.score_produtivo,
+           l.template_code, l.text_length_chars, l.latency_ms, l.language
+    FROM classification_legacy l
+    JOIN model_version m USING (model_version, embedding_model);
+    """)
+    op.execute("DROP TABLE classification_legacy;")
+
+    op.execute("""
+    CREATE TABLE IF NOT EXISTS classification_hourly (
+      bucket          TIMESTAMPTZ NOT NULL,
+      model_id        SMALLINT    NOT NULL REFERENCES model_version(model_id),
+      n               INT         NOT NULL,
+      n_produtivo     INT         NOT NULL,
+      score_mean      REAL        NOT NULL,
+      latency_p50_ms  REAL        NOT NULL,
+      latency_p95_ms  REAL        NOT NULL,
+      latency_p99_ms  REAL        NOT NULL,
+      template_counts JSONB       NOT NULL,
+      feedback_n      INT         NOT NULL,
+      helpful_n       INT         NOT NULL,
+      updated_at      TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+      PRIMARY KEY (bucket, model_id)
+    );
+    """)
+
+def downgrade():
+    op.execute("DROP TABLE IF EXISTS classification_hourly;")
+    op.execute("ALTER TABLE classification RENAME TO classification_partitioned;")
+    op.execute("""
+    CREATE TABLE classification (
+      classification_id UUID PRIMARY KEY,
+      ts_utc            TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+      model_version     TEXT        NOT NULL,
+      embedding_model   TEXT        NOT NULL,
+      threshold_used    NUMERIC(5,4) NOT NULL CHECK (threshold_used > 0 AND threshold_used <= 1),
+      label             TEXT        NOT NULL CHECK (label IN ('Produtivo','Improdutivo')),
+      score_produtivo   NUMERIC(5,4) NOT NULL CHECK (score_produtivo >= 0 AND score_produtivo <= 1),
+      template_code     TEXT        NOT NULL,
+      text_length_chars INT         NOT NULL CHECK (text_length_chars >= 0),
+      latency_ms        INT         NOT NULL CHECK (latency_ms >= 0),
+      language          TEXT        NOT NULL
+    );
+    """)
+    op.execute("""
+    INSERT INTO classification
+    SELECT p.classification_id, p.ts_utc, m.model_version, m.embedding_model,
+           round(p.threshold_used::numeric, 4), p.label, round(p.score_produtivo::numeric, 4),
+           p.template_code, p.text_length_chars, p.latency_ms, p.language
+    FROM classification_partitioned p
+    JOIN model_version m USING (model_id);
+    """)
+    op.execute("DROP TABLE classification_partitioned;")
+    op.execute("DROP TABLE model_version;")
+    op.execute("DELETE FROM feedback f WHERE NOT EXISTS (SELECT 1 FROM classification c WHERE c.classification_id = f.classification_id);")
+    op.execute("""
+    ALTER TABLE feedback ADD CONSTRAINT feedback_classification_id_fkey
+      FOREIGN KEY (classification_id) REFERENCES classification(classification_id);
+    """)
@@ -9,7 +9,29 @@ from sqlalchemy.dialects.postgresql import UUID as PGUUID
 
 Base = declarative_base()
 
+# SMALLINT on Postgres; sqlite only autoincrements INTEGER primary keys
+SmallId = sa.SmallInteger().with_variant(sa.Integer(), "sqlite")
+
+class ModelVersion(Base):
+    """Lookup table, so each classification row stores a 2-byte model id instead of two strings."""
+    __tablename__ = "model_version"
+
+    model_id: Mapped[int]        = mapped_column(SmallId, primary_key=True, autoincrement=True)
+    model_version: Mapped[str]   = mapped_column(sa.Text, nullable=False)
+    embedding_model: Mapped[str] = mapped_column(sa.Text, nullable=False)
+    created_at: Mapped[datetime] = mapped_column(
+        sa.DateTime(timezone=True),
+        server_default=sa.func.now(),
+        nullable=False,
+    )
+
+    __table_args__ = (
+        sa.UniqueConstraint("model_version", "embedding_model", name="uq_model_version"),
+    )
+
+
 class Classification(Base):
+    """Range-partitioned by month on ts_utc in Postgres (see 0003_partition_telemetry)."""
     __tablename__ = "classification"
 
     # Use Postgres UUID + real uuid.UUID values
@@ -18,17 +40,18 @@ class Classification(Base):
         primary_key=True,
         default=uuid.uuid4,  # returns uuid.UUID
     )
+    # part of the primary key: Postgres requires the partition key in it
     ts_utc: Mapped[datetime] = mapped_column(
         sa.DateTime(timezone=True),
-        server_default=sa.text("NOW()"),
+        primary_key=True,
+        server_default=sa.func.now(),
         nullable=False,
     )
-    model_version: Mapped[str]    = mapped_column(sa.Text, nullable=False)
-    embedding_model: Mapped[str]  = mapped_column(sa.Text, nullable=False)
-    threshold_used: Mapped[float] = mapped_column(sa.Numeric(5, 4), nullable=False)
+    model_id: Mapped[int]         = mapped_column(SmallId, sa.ForeignKey("model_version.model_id"), nullable=False)
+    threshold_used: Mapped[float] = mapped_column(sa.REAL, nullable=False)
     label: Mapped[str]            = mapped_column(sa.Text, nullable=False)   # 'Produtivo' | 'Improdutivo'
-    score_produtivo: Mapped[float]= mapped_column(sa.Numeric(5, 4), nullable=False)
-    template_code: Mapped[str]    = mapped_column(sa.Text, nullable=False)   # 'status' | 'error' | ...
+    score_produtivo: Mapped[float]= mapped_column(sa.REAL, nullable=False)
+    template_code: Mapped[str]    = mapped_column(sa.Text, nullable=False)   # 'status' | 'error' | ... (see SUGGEST_RULES_PATH)
     text_length_chars: Mapped[int]= mapped_column(sa.Integer, nullable=False)
     latency_ms: Mapped[int]       = mapped_column(sa.Integer, nullable=False)
     language: Mapped[str]         = mapped_column(sa.Text, nullable=False)
@@ -38,9 +61,16 @@ class Classification(Base):
         sa.CheckConstraint("score_produtivo >= 0 AND score_produtivo <= 1", name="ck_score"),
         sa.CheckConstraint("text_length_chars >= 0", name="ck_text_len"),
         sa.CheckConstraint("latency_ms >= 0", name="ck_latency"),
+        sa.Index("ix_classification_ts_brin", "ts_utc", postgresql_using="brin"),
     )
 
-    feedback: Mapped["Feedback"] = relationship(back_populates="classification", uselist=False)
+    model: Mapped[ModelVersion] = relationship()
+    feedback: Mapped[Optional["Feedback"]] = relationship(
+        primaryjoin="Classification.classification_id == foreign(Feedback.classification_id)",
+        back_populates="classification",
+        uselist=False,
+        viewonly=True,
+    )
 
 
 class Feedback(Base):
@@ -53,16 +83,57 @@ class Feedback(Base):
     )
     ts_utc: Mapped[datetime] = mapped_column(
         sa.DateTime(timezone=True),
-        server_default=sa.text("NOW()"),
+        server_default=sa.func.now(),
         nullable=False,
     )
+    # No FK: classification is partitioned (its key includes ts_utc). Writes
+    # check the id with a join instead (see upsert_feedback_rows).
     classification_id: Mapped[uuid.UUID] = mapped_column(
         PGUUID(as_uuid=True),
-        sa.ForeignKey("classification.classification_id"),
         unique=True,
         nullable=False,
     )
     helpful: Mapped[bool]           = mapped_column(sa.Boolean, nullable=False)
     reason_code: Mapped[Optional[str]] = mapped_column(sa.Text)
 
-    classification: Mapped[Classification] = relationship(back_populates="feedback")
+    classification: Mapped[Optional[Classification]] = relationship(
+        primaryjoin="Classification.classification_id == foreign(Feedback.classification_id)",
+        back_populates="feedback",
+        viewonly=True,
+    )
+
+
+class ClassificationHourly(Base):
+    """Hourly rollup per model, maintained by `python -m app.cli.telemetry_maintenance`."""
+    __tablename__ = "classification_hourly"
+
+    bucket: Mapped[datetime]      = mapped_column(sa.DateTime(timezone=True), primary_key=True)
+    model_id: Mapped[int]         = mapped_column(SmallId, sa.ForeignKey("model_version.model_id"), primary_key=True)
+    n: Mapped[int]                = mapped_column(sa.Integer, nullable=False)
+    n_produtivo: Mapped[int]      = mapped_column(sa.Integer, nullable=False)
+    score_mean: Mapped[float]     = mapped_column(sa.REAL, nullable=False)
+    latency_p50_ms: Mapped[float] = mapped_column(sa.REAL, nullable=False)
+    latency_p95_ms: Mapped[float] = mapped_column(sa.REAL, nullable=False)
+    latency_p99_ms: Mapped[float] = mapped_column(sa.REAL, nullable=False)
+    template_counts: Mapped[dict] = mapped_column(sa.JSON, nullable=False)  # template_code -> rows
+    feedback_n: Mapped[int]       = mapped_column(sa.Integer, nullable=False)
+    helpful_n: Mapped[int]        = mapped_column(sa.Integer, nullable=False)
+    updated_at: Mapped[datetime]  = mapped_column(
+        sa.DateTime(timezone=True),
+        server_default=sa.func.now(),
+        nullable=False,
+    )
+
+
+class IdempotencyRecord(Base):
+    __tablename__ = "idempotency_key"
+
+    key: Mapped[str]          = mapped_column(sa.Text, primary_key=True)
+    request_hash: Mapped[str] = mapped_column(sa.Text, nullable=False)  # sha256 of the text the key was first used with
+    response: Mapped[dict]    = mapped_column(sa.JSON, nullable=False)  # ClassificationOut fields
+    created_at: Mapped[datetime] = mapped_column(
+        sa.DateTime(timezone=True),
+        server_default=sa.func.now(),
+        nullable=False,
+        index=True,
+    )
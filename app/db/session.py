@@ -1,10 +1,161 @@
-from sqlalchemy import create_engine
+import time
+from typing import Optional
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.exc import TimeoutError as PoolTimeout
 from sqlalchemy.orm import sessionmaker
-from app.core.config import DATABASE_URL
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+
+from app.core.config import (
+    DATABASE_URL, DB_ASYNC_ON, DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_TIMEOUT_S, DB_POOL_RECYCLE_S,
+    DB_PRE_PING, DB_STATEMENT_TIMEOUT_MS,
+)
+from app.core.metrics import DB_POOL_CONNECTIONS, DB_POOL_WAIT, EVENTS
+
+# Backends the repositories support: their upserts need INSERT ... ON CONFLICT
+SUPPORTED_BACKENDS = ("postgresql", "sqlite")
+
+
+def check_backend(url: str) -> None:
+    """Fail at startup, not on the first upsert, when DATABASE_URL points at an unsupported database."""
+    backend = make_url(url).get_backend_name()
+    if backend not in SUPPORTED_BACKENDS:
+        raise RuntimeError(
+            f"DATABASE_URL uses {backend!r}; telemetry, feedback and IDEMPOTENCY_DB need postgresql "
+            f"(or sqlite for local runs), since they upsert with INSERT ... ON CONFLICT"
+        )
+
+
+class PoolStats:
+    """Checkout counters for one engine's pool (see `instrument_pool`)."""
+
+    def __init__(self, name: str):
+        self.name = name
+        self.engine: Optional[Engine] = None
+        self.checkouts = 0
+        self.connects = 0
+        self.timeouts = 0
+        self.invalidated = 0
+        self.wait_s = 0.0
+
+    def _pool(self, attr: str) -> int:
+        # only QueuePool-style pools keep these counts (not sqlite's default pools);
+        # read through the engine, since dispose() replaces its pool
+        fn = getattr(self.engine.pool, attr, None) if self.engine is not None else None
+        return max(0, fn()) if fn is not None else 0
+
+    def stats(self) -> dict:
+        return {
+            "size": self._pool("size"),
+            "checked_out": self._pool("checkedout"),
+            "idle": self._pool("checkedin"),
+            "overflow": self._pool("overflow"),
+            "checkouts": self.checkouts,
+            "connects": self.connects,
+            "timeouts": self.timeouts,
+            "invalidated": self.invalidated,
+            "avg_wait_ms": round(self.wait_s * 1000 / attempts, 3) if (attempts := self.checkouts + self.timeouts) else 0.0,
+        }
+
+
+def _timed_pool(base: type, pool_stats: PoolStats) -> type:
+    """`base` with the time `connect()` takes recorded.
+
+    That is the public checkout entry point: waiting for a free connection,
+    opening a new one and the pre-ping. Pools have no event before a checkout
+    starts, so the wait can't be timed from the `checkout`/`connect` events.
+    """
+    class TimedPool(base):
+        def connect(self):
+            t0 = time.perf_counter()
+            try:
+                return super().connect()
+            except PoolTimeout:
+                pool_stats.timeouts += 1
+                raise
+            finally:
+                dt = time.perf_counter() - t0
+                pool_stats.wait_s += dt
+                DB_POOL_WAIT.observe(dt, pool_stats.name)
+    return TimedPool
+
+
+def instrument_pool(sync_engine: Engine, pool_stats: PoolStats) -> None:
+    pool_stats.engine = sync_engine
+    event.listen(sync_engine, "checkout", lambda *a: setattr(pool_stats, "checkouts", pool_stats.checkouts + 1))
+    event.listen(sync_engine, "connect", lambda *a: setattr(pool_stats, "connects", pool_stats.connects + 1))
+    event.listen(sync_engine, "invalidate", lambda *a: setattr(pool_stats, "invalidated", pool_stats.invalidated + 1))
+    DB_POOL_CONNECTIONS.add(lambda: pool_stats._pool("checkedout"), pool_stats.name, "checked_out")
+    DB_POOL_CONNECTIONS.add(lambda: pool_stats._pool("checkedin"), pool_stats.name, "idle")
+    for ev in ("checkouts", "connects", "timeouts", "invalidated"):
+        EVENTS.add(lambda e=ev: getattr(pool_stats, e), f"db_{pool_stats.name}", ev)
+
+
+def engine_kwargs(url: str, pool_class: type, pool_stats: PoolStats) -> dict:
+    """Pool + timeout settings from config; sqlite keeps SQLAlchemy's defaults."""
+    u = make_url(url)
+    if u.get_backend_name() == "sqlite":
+        return {}
+    kwargs = {
+        "poolclass": _timed_pool(pool_class, pool_stats),
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT_S,
+        "pool_recycle": DB_POOL_RECYCLE_S,
+        "pool_pre_ping": DB_PRE_PING,
+    }
+    if u.get_backend_name() == "postgresql" and DB_STATEMENT_TIMEOUT_MS > 0:
+        kwargs["connect_args"] = {"options": f"-c statement_timeout={DB_STATEMENT_TIMEOUT_MS}"}
+    return kwargs
+
+
+def async_url(url: str) -> Optional[str]:
+    """Same database through an asyncio driver, or None if there is none for it."""
+    u = make_url(url)
+    if u.get_backend_name() == "postgresql":
+        # psycopg 3 serves both; SQLAlchemy picks its async dialect under create_async_engine
+        return u.set(drivername="postgresql+psycopg").render_as_string(hide_password=False)
+    if u.get_backend_name() == "sqlite":
+        try:
+            import aiosqlite  # noqa: F401
+        except ImportError:
+            return None
+        return u.set(drivername="sqlite+aiosqlite").render_as_string(hide_password=False)
+    return None
+
+
+SYNC_POOL = PoolStats("sync")
+ASYNC_POOL = PoolStats("async")
 
 if not DATABASE_URL:
     engine = None
     SessionLocal = None
 else:
-    engine = create_engine(DATABASE_URL, pool_pre_ping=True, future=True)
+    check_backend(DATABASE_URL)
+    engine = create_engine(DATABASE_URL, future=True, **engine_kwargs(DATABASE_URL, QueuePool, SYNC_POOL))
     SessionLocal = sessionmaker(bind=engine, autoflush=False, autocommit=False, future=True)
+    instrument_pool(engine, SYNC_POOL)
+
+# Request-path queries use this when available, so they don't hold a threadpool thread
+async_engine = None
+AsyncSessionLocal = None
+_url = async_url(DATABASE_URL) if DATABASE_URL and DB_ASYNC_ON else None
+if _url:
+    try:
+        from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+    except ImportError:  # needs greenlet: pip install "sqlalchemy[asyncio]"
+        _url = None
+if _url:
+    async_engine = create_async_engine(_url, **engine_kwargs(_url, AsyncAdaptedQueuePool, ASYNC_POOL))
+    AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+    instrument_pool(async_engine.sync_engine, ASYNC_POOL)
+
+
+def pool_stats() -> dict:
+    out = {}
+    if engine is not None:
+        out["sync"] = SYNC_POOL.stats()
+    if async_engine is not None:
+        out["async"] = ASYNC_POOL.stats()
+    return out
@@ -1,13 +1,42 @@
 import os
+from contextlib import asynccontextmanager
+
 import uvicorn
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
-from app.core.config import ORIGINS
+from app.core.config import ORIGINS, MICRO_BATCH_ON, METRICS_ON, SERVER_TIMING_ON
+from app.core.metrics import MetricsMiddleware
 from app.api.v1.routes import router 
+from app.db.session import async_engine
+from app.ml.batcher import BATCHER
+from app.ml.embedding_store import EMBEDDING_STORE
+from app.ml.registry import REGISTRY
+from app.ml.worker_pool import INFERENCE
+from app.services.telemetry_writer import TELEMETRY_WRITER
+
+# ================== Lifespan ==================
+@asynccontextmanager
+async def lifespan(_app: FastAPI):
+    # Bind the port right away; /readyz turns 200 once the model is loaded and warm
+    # (including the inference worker processes, when INFER_WORKERS > 0)
+    REGISTRY.add_prepare_hook(INFERENCE.prepare)
+    REGISTRY.reload_in_background()
+    if MICRO_BATCH_ON:
+        BATCHER.start()
+    TELEMETRY_WRITER.start()
+    EMBEDDING_STORE.start()
+    yield
+    BATCHER.stop()
+    INFERENCE.shutdown()
+    # drain queued telemetry rows before the process exits
+    TELEMETRY_WRITER.stop()
+    EMBEDDING_STORE.stop()
+    if async_engine is not None:
+        await async_engine.dispose()
 
 # ================== FastAPI app ==================
-app = FastAPI(title="AutoU Email Classifier API", version="1.0.0")
+app = FastAPI(title="AutoU Email Classifier API", version="1.0.0", lifespan=lifespan)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=ORIGINS,
@@ -16,9 +45,13 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+if METRICS_ON:
+    # outermost, so request latency includes CORS handling and Server-Timing reaches the client
+    app.add_middleware(MetricsMiddleware, server_timing=SERVER_TIMING_ON)
+
 # Include routes
 app.include_router(router)
 
 # ================== Local serve ==================
 if __name__ == "__main__":
-    uvicorn.run("main:app", host="0.0.0.0", port=int(os.environ.get("PORT", "8000")), reload=False)
\ No newline at end of file
+    uvicorn.run("main:app", host="0.0.0.0", port=int(os.environ.get("PORT", "8000")), reload=False)
@@ -0,0 +1,136 @@
+import threading
+import time
+from concurrent.futures import Future
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from app.core.background import BackgroundQueue
+from app.core.config import BATCH_MAX_SIZE, BATCH_MAX_WAIT_MS
+from app.core.deadline import DEADLINES, Deadline, DeadlineExceeded, DeadlineGroup
+from app.core.metrics import EVENTS, observe_stage
+from app.ml.model_loader import ModelBundle
+from app.ml.worker_pool import INFERENCE
+
+Item = Tuple[str, ModelBundle, Future, float, Optional[Deadline]]  # (text, bundle, future, queued at, deadline)
+
+
+class MicroBatcher:
+    """Collects concurrent single-text requests and scores them in one forward pass.
+
+    Callers get a future from `submit()` while a background thread gathers up
+    to `max_batch_size` texts, hands them to the inference pool as one batch
+    and fans the results back out. The wait is adaptive: while an inference
+    slot is free, a batch is just what is already queued and goes out at once,
+    so a lone request never waits; only while every slot is busy with earlier
+    batches (the request would queue anyway) does it wait up to `max_wait_ms`
+    for company. The thread never waits on the model, so the next batch can
+    form while the pool is busy.
+    Items are grouped by the bundle they were submitted with, so a batch never
+    mixes model versions. Items whose future was cancelled or whose deadline
+    passed while they waited are dropped before dispatch; the batch itself
+    carries a `DeadlineGroup`, so it only stops early once all of its
+    callers are gone.
+    """
+
+    def __init__(self, max_batch_size: int = BATCH_MAX_SIZE, max_wait_ms: float = BATCH_MAX_WAIT_MS):
+        # a free slot means waiting would only add latency: dispatch what is queued
+        self.queue = BackgroundQueue("micro-batcher", self._run_batch, max_batch=max_batch_size,
+                                     max_wait_ms=max_wait_ms, hold=lambda: self.inflight >= INFERENCE.slots)
+        self._lock = threading.Lock()
+        self.inflight = 0  # batches handed to the pool and not finished yet
+        self.batches = 0
+        self.items = 0
+
+    def start(self) -> None:
+        self.queue.start()
+
+    def stop(self, timeout: float = 5.0) -> None:
+        self.queue.stop(timeout)
+
+    def submit(self, text: str, bundle: ModelBundle,
+               deadline: Optional[Deadline] = None) -> "Future[Tuple[np.ndarray, float, Dict[str, float]]]":
+        """Future of (embedding, score_produtivo, stage seconds) for a single text."""
+        fut: Future = Future()
+        self.queue.put((text, bundle, fut, time.perf_counter(), deadline))
+        if not self.queue.started:
+            self.start()
+        return fut
+
+    def stats(self) -> dict:
+        return {
+            "batches": self.batches,
+            "items": self.items,
+            "avg_batch_size": round(self.items / self.batches, 2) if self.batches else 0.0,
+            "pending": self.queue.qsize(),
+            "inflight": self.inflight,
+        }
+
+    def _run_batch(self, batch: List[Item]) -> None:
+        groups: Dict[int, List[Item]] = {}
+        for item in batch:
+            groups.setdefault(id(item[1]), []).append(item)
+        for group in groups.values():
+            self._run_group(group)
+
+    @staticmethod
+    def _live(group: List[Item]) -> List[Item]:
+        live = []
+        for item in group:
+            fut, deadline = item[2], item[4]
+            if not fut.set_running_or_notify_cancel():
+                DEADLINES.note_dropped("queued", 1)  # its request gave up while it waited
+                continue
+            try:
+                if deadline is not None:
+                    deadline.check("queued")
+            except DeadlineExceeded as e:
+                DEADLINES.note_dropped("queued", 1)
+                fut.set_exception(e)
+                continue
+            live.append(item)
+        return live
+
+    def _run_group(self, group: List[Item]) -> None:
+        group = self._live(group)
+        if not group:
+            return
+        dispatched = time.perf_counter()
+        waits = [dispatched - queued for _, _, _, queued, _ in group]
+        for w in waits:
+            observe_stage("micro_batch_wait", w)
+        deadlines = [d for *_, d in group]
+        deadline = None if any(d is None for d in deadlines) else DeadlineGroup(deadlines)
+
+        def _fan_out(done: Future) -> None:
+            with self._lock:
+                self.inflight -= 1
+            try:
+                X, probs, timings = done.result()
+            except BaseException as e:
+                for _, _, fut, _, _ in group:
+                    fut.set_exception(e)
+                return
+            for (_, _, fut, _, _), x, p, w in zip(group, X, probs, waits):
+                fut.set_result((x, float(p), {"micro_batch_wait": w, **timings}))
+
+        with self._lock:
+            self.batches += 1
+            self.items += len(group)
+            self.inflight += 1
+        try:
+            inner = INFERENCE.submit([t for t, *_ in group], group[0][1], deadline)
+        except Exception as e:
+            # e.g. a broken or shut-down pool: fail these callers, keep the batcher thread alive
+            with self._lock:
+                self.inflight -= 1
+            for _, _, fut, _, _ in group:
+                fut.set_exception(e)
+            return
+        inner.add_done_callback(_fan_out)
+
+
+BATCHER = MicroBatcher()
+BATCHER.queue.register_metrics("micro_batch", "micro_batcher")
+EVENTS.add(lambda: BATCHER.batches, "micro_batcher", "batches")
+EVENTS.add(lambda: BATCHER.items, "micro_batcher", "items")
@@ -0,0 +1,255 @@
+import hashlib
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+
+from app.core.config import (
+    CACHE_ON, CACHE_MAX_ITEMS, CACHE_TTL_S, CACHE_BACKEND, CACHE_SQLITE_PATH
+)
+from app.core.metrics import EVENTS
+
+_RE_WS = re.compile(r"\s+")
+
+
+class CacheEntry(NamedTuple):
+    embedding: np.ndarray
+    score: float
+
+
+class LRUTTLCache:
+    """In-process LRU with per-entry TTL. Thread-safe."""
+
+    def __init__(self, max_items: int, ttl_s: float):
+        self.max_items = max(1, max_items)
+        self.ttl_s = ttl_s
+        self._data: "OrderedDict[str, tuple[float, CacheEntry]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.evictions = 0
+        self.expirations = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: str) -> Optional[CacheEntry]:
+        now = time.monotonic()
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            stored_at, entry = item
+            if self.ttl_s > 0 and now - stored_at > self.ttl_s:
+                del self._data[key]
+                self.expirations += 1
+                return None
+            self._data.move_to_end(key)
+            return entry
+
+    def put(self, key: str, entry: CacheEntry) -> None:
+        with self._lock:
+            self._data[key] = (time.monotonic(), entry)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_items:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+
+class SqliteCache:
+    """On-disk store shared by several uvicorn workers on the same host.
+
+    Rows carry a wall-clock timestamp; expired rows are ignored on read and
+    purged (together with the oldest rows beyond `max_items`) every
+    `prune_every` writes.
+    """
+
+    def __init__(self, path: str, max_items: int, ttl_s: float, prune_every: int = 500):
+        self.path = path
+        self.max_items = max(1, max_items)
+        self.ttl_s = ttl_s
+        self.prune_every = prune_every
+        self._local = threading.local()
+        self._writes = 0
+        self._lock = threading.Lock()
+        db = self._conn()
+        db.execute(
+            "CREATE TABLE IF NOT EXISTS score_cache ("
+            " key TEXT PRIMARY KEY, ts REAL NOT NULL, score REAL NOT NULL, embedding BLOB NOT NULL)"
+        )
+        db.execute("CREATE INDEX IF NOT EXISTS ix_score_cache_ts ON score_cache (ts)")
+        db.commit()
+
+    def _conn(self) -> sqlite3.Connection:
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=5.0, check_same_thread=False)
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            self._local.db = db
+        return db
+
+    def get(self, key: str) -> Optional[CacheEntry]:
+        try:
+            row = self._conn().execute(
+                "SELECT ts, score, embedding FROM score_cache WHERE key = ?", (key,)
+            ).fetchone()
+        except sqlite3.Error:
+            return None
+        if row is None:
+            return None
+        ts, score, blob = row
+        if self.ttl_s > 0 and time.time() - ts > self.ttl_s:
+            return None
+        return CacheEntry(np.frombuffer(blob, dtype=np.float32), float(score))
+
+    def get_many(self, keys: Sequence[str]) -> Dict[str, CacheEntry]:
+        """Live entries for `keys` (missing and expired keys are left out), in one query per 500 keys."""
+        out: Dict[str, CacheEntry] = {}
+        cutoff = time.time() - self.ttl_s if self.ttl_s > 0 else None
+        try:
+            db = self._conn()
+            for i in range(0, len(keys), 500):
+                part = keys[i:i + 500]
+                rows = db.execute(
+                    f"SELECT key, ts, score, embedding FROM score_cache WHERE key IN ({','.join('?' * len(part))})",
+                    part,
+                ).fetchall()
+                for key, ts, score, blob in rows:
+                    if cutoff is None or ts >= cutoff:
+                        out[key] = CacheEntry(np.frombuffer(blob, dtype=np.float32), float(score))
+        except sqlite3.Error:
+            pass
+        return out
+
+    def put(self, key: str, entry: CacheEntry) -> None:
+        self.put_many([(key, entry)])
+
+    def put_many(self, items: Sequence[Tuple[str, CacheEntry]]) -> None:
+        """Upsert all items in one transaction."""
+        if not items:
+            return
+        now = time.time()
+        try:
+            db = self._conn()
+            with db:
+                db.executemany(
+                    "INSERT OR REPLACE INTO score_cache (key, ts, score, embedding) VALUES (?, ?, ?, ?)",
+                    [(key, now, e.score, np.asarray(e.embedding, dtype=np.float32).tobytes()) for key, e in items],
+                )
+            with self._lock:
+                before = self._writes
+                self._writes += len(items)
+                prune = self._writes // self.prune_every > before // self.prune_every
+            if prune:
+                self._prune(db)
+        except sqlite3.Error:
+            # cache errors never fail a request
+            pass
+
+    def _prune(self, db: sqlite3.Connection) -> None:
+        if self.ttl_s > 0:
+            db.execute("DELETE FROM score_cache WHERE ts < ?", (time.time() - self.ttl_s,))
+        db.execute(
+            "DELETE FROM score_cache WHERE key IN ("
+            " SELECT key FROM score_cache ORDER BY ts DESC LIMIT -1 OFFSET ?)",
+            (self.max_items,),
+        )
+        db.commit()
+
+
+class ScoreCache:
+    """Content-addressed cache of (embedding, score_produtivo) per model version.
+
+    Callers pass the serving bundle's `cache_namespace`, so entries from
+    another model version, backend or long-text strategy never match. Lookups hit the in-process LRU first and, when configured, fall back to the
+    shared sqlite store (promoting hits into the LRU). With the sqlite store,
+    `blocking` is true: calls do file I/O and belong off the event loop.
+    """
+
+    def __init__(self, enabled: bool, max_items: int, ttl_s: float, backend: str = "memory",
+                 sqlite_path: Optional[str] = None):
+        self.enabled = enabled
+        self.memory = LRUTTLCache(max_items, ttl_s)
+        self.shared = SqliteCache(sqlite_path, max_items, ttl_s) if enabled and backend == "sqlite" and sqlite_path else None
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def blocking(self) -> bool:
+        return self.shared is not None
+
+    @staticmethod
+    def key(text: str, namespace: str) -> str:
+        normalized = _RE_WS.sub(" ", text).strip()
+        return hashlib.sha256((namespace + normalized).encode("utf-8")).hexdigest()
+
+    def get(self, text: str, namespace: str) -> Optional[CacheEntry]:
+        if not self.enabled:
+            return None
+        k = self.key(text, namespace)
+        entry = self.memory.get(k)
+        if entry is None and self.shared is not None:
+            entry = self.shared.get(k)
+            if entry is not None:
+                self.memory.put(k, entry)
+        if entry is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return entry
+
+    def get_many(self, texts: Sequence[str], namespace: str) -> List[Optional[CacheEntry]]:
+        if not self.enabled:
+            return [None] * len(texts)
+        keys = [self.key(t, namespace) for t in texts]
+        entries = [self.memory.get(k) for k in keys]
+        if self.shared is not None:
+            found = self.shared.get_many(list({k for k, e in zip(keys, entries) if e is None}))
+            for k, e in found.items():
+                self.memory.put(k, e)
+            entries = [e if e is not None else found.get(k) for k, e in zip(keys, entries)]
+        hits = sum(e is not None for e in entries)
+        self.hits += hits
+        self.misses += len(entries) - hits
+        return entries
+
+    def put(self, text: str, embedding: np.ndarray, score: float, namespace: str) -> None:
+        if not self.enabled:
+            return
+        k = self.key(text, namespace)
+        # copy so a cached row does not pin the whole batch matrix in memory
+        entry = CacheEntry(np.array(embedding, dtype=np.float32, copy=True), float(score))
+        self.memory.put(k, entry)
+        if self.shared is not None:
+            self.shared.put(k, entry)
+
+    def put_many(self, texts: Sequence[str], X: np.ndarray, scores: Sequence[float], namespace: str) -> None:
+        if not self.enabled:
+            return
+        items = [(self.key(t, namespace), CacheEntry(np.array(x, dtype=np.float32, copy=True), float(p)))
+                 for t, x, p in zip(texts, X, scores)]
+        for k, entry in items:
+            self.memory.put(k, entry)
+        if self.shared is not None:
+            self.shared.put_many(items)
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "enabled": self.enabled,
+            "backend": "sqlite" if self.shared is not None else "memory",
+            "size": len(self.memory),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.memory.evictions,
+            "expirations": self.memory.expirations,
+        }
+
+
+SCORE_CACHE = ScoreCache(CACHE_ON, CACHE_MAX_ITEMS, CACHE_TTL_S, CACHE_BACKEND, CACHE_SQLITE_PATH)
+EVENTS.add(lambda: SCORE_CACHE.hits, "cache", "hits")
+EVENTS.add(lambda: SCORE_CACHE.misses, "cache", "misses")
@@ -0,0 +1,474 @@
+# app/ml/embedding_store.py
+"""Append-only, memory-mapped store of classification embeddings.
+
+One directory per embedding space (embedder + backend + long-text strategy)
+under EMBED_STORE_DIR:
+
+    meta.json          dim, dtype and the embedder the vectors come from
+    vectors.bin        row-major unit vectors, float32 or int8 (x127)
+    ids.bin            16-byte classification_id per row
+    ivf_centroids.npy  optional coarse quantizer (see build-index below)
+    ivf_assign.bin     int32 IVF list per row, extended by appends once the index exists
+
+Rows are appended in bulk by a background thread, under an flock so several
+uvicorn workers can share a directory. `ids.bin` is written last, so its
+length is the committed row count; readers memory-map that many rows and
+never load the files into RAM. Queries scan everything in chunks until an
+IVF index is built, then only the `nprobe` closest lists. Lookups by
+classification_id go through an in-memory index of the ids sorted by their
+first 8 bytes, rebuilt as the store grows (rows appended since are scanned).
+
+    python -m app.ml.embedding_store stats
+    python -m app.ml.embedding_store build-index [--nlist 1024]   # rerun as the store grows
+"""
+import argparse
+import fcntl
+import hashlib
+import json
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from app.core.background import BackgroundQueue
+from app.core.config import (
+    EMBED_STORE_DIR, EMBED_STORE_DTYPE, EMBED_STORE_QUEUE_MAX, EMBED_STORE_FLUSH_ROWS,
+    EMBED_STORE_FLUSH_MS, EMBED_STORE_NPROBE, LONG_TEXT_STRATEGY,
+)
+from app.core.metrics import EVENTS
+
+_INT8_SCALE = 127.0  # unit vectors: every component is in [-1, 1]
+_SCAN_ROWS = 65536   # rows per matmul when scanning
+_ASSIGN_ROWS = 8192  # rows per (rows x nlist) matmul when assigning IVF lists
+_REINDEX_ROWS = 10000  # new rows before the inverted lists / id index are rebuilt (or 10%, if more)
+
+
+def space_key(emb_id: str, emb_backend: str, strategy: str = LONG_TEXT_STRATEGY) -> str:
+    """Directory name of an embedding space; vectors from different spaces aren't comparable."""
+    return hashlib.sha1(f"{emb_id}\0{emb_backend}\0{strategy}".encode("utf-8")).hexdigest()[:16]
+
+
+class VectorStore:
+    """One embedding space's files. Appends take the directory lock; reads don't.
+
+    The memory maps, IVF lists and id index cached for readers are shared by
+    concurrent requests and the append thread, so they are built under
+    `self._lock`; queries hold the lock only while a cache is (re)built.
+    """
+
+    def __init__(self, path: str, dim: Optional[int] = None, dtype: str = EMBED_STORE_DTYPE,
+                 info: Optional[Dict[str, Any]] = None):
+        self.path = path
+        os.makedirs(path, exist_ok=True)
+        with self._locked():
+            meta_path = self._file("meta.json")
+            if os.path.exists(meta_path):
+                with open(meta_path, "r", encoding="utf-8") as f:
+                    self.meta = json.load(f)
+                if dim is not None and self.meta["dim"] != dim:
+                    raise ValueError(f"{path} holds {self.meta['dim']}-d vectors, got {dim}-d")
+            elif dim is None:
+                raise FileNotFoundError(meta_path)
+            else:
+                if dtype not in ("float32", "int8"):
+                    raise ValueError(f"EMBED_STORE_DTYPE must be float32 or int8, got {dtype!r}")
+                self.meta = {"dim": dim, "dtype": dtype, **(info or {})}
+                with open(meta_path + ".tmp", "w", encoding="utf-8") as f:
+                    json.dump(self.meta, f, indent=2)
+                os.replace(meta_path + ".tmp", meta_path)
+        self.dim = int(self.meta["dim"])
+        self.dtype = np.dtype(self.meta["dtype"])
+        self._lock = threading.RLock()
+        self._maps: Dict[str, Tuple[int, np.ndarray]] = {}
+        self._ivf: Optional[Tuple[int, np.ndarray]] = None  # (mtime_ns, centroids)
+        self._lists: Optional[tuple] = None  # (rows covered, centroids, row order, list offsets)
+        self._id_index: Optional[tuple] = None  # (rows covered, sorted first id words, row order)
+
+    # ---- files ----
+    def _file(self, name: str) -> str:
+        return os.path.join(self.path, name)
+
+    def _rows_in(self, name: str, row_bytes: int) -> int:
+        try:
+            return os.path.getsize(self._file(name)) // row_bytes
+        except FileNotFoundError:
+            return 0
+
+    @contextmanager
+    def _locked(self):
+        with open(self._file(".lock"), "a") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def __len__(self) -> int:
+        return self._rows_in("ids.bin", 16)
+
+    def _map(self, name: str, dtype, width: int, rows: int) -> np.ndarray:
+        """Read-only view of the first `rows` rows; the file is remapped only after it has grown."""
+        shape = (rows, width) if width else (rows,)
+        if rows == 0:
+            return np.empty(shape, dtype=dtype)
+        cached = self._maps.get(name)
+        if cached is None or cached[0] < rows:
+            with self._lock:
+                cached = self._maps.get(name)
+                if cached is None or cached[0] < rows:
+                    cached = (rows, np.memmap(self._file(name), dtype=dtype, mode="r", shape=shape))
+                    self._maps[name] = cached
+        return cached[1][:rows]
+
+    def vectors(self, rows: int) -> np.ndarray:
+        return self._map("vectors.bin", self.dtype, self.dim, rows)
+
+    def ids(self, rows: int) -> np.ndarray:
+        """classification_ids as (rows, 2) uint64, i.e. their 16 raw bytes."""
+        return self._map("ids.bin", np.uint64, 2, rows)
+
+    def _encode(self, X: np.ndarray) -> np.ndarray:
+        if self.dtype == np.int8:
+            return np.clip(np.rint(X * _INT8_SCALE), -127, 127).astype(np.int8)
+        return np.ascontiguousarray(X, dtype=np.float32)
+
+    def _decode(self, V: np.ndarray) -> np.ndarray:
+        if self.dtype == np.int8:
+            return V.astype(np.float32) / _INT8_SCALE
+        return np.asarray(V)
+
+    def _scores(self, V: np.ndarray, q: np.ndarray) -> np.ndarray:
+        if self.dtype == np.int8:
+            return V.astype(np.float32) @ (q / _INT8_SCALE)
+        return V @ q
+
+    # ---- writes ----
+    def _repair(self) -> int:
+        """Cut vectors/assignments left past the committed row count by an interrupted append."""
+        n = len(self)
+        for name, row_bytes in (("vectors.bin", self.dim * self.dtype.itemsize), ("ivf_assign.bin", 4)):
+            if os.path.exists(self._file(name)) and os.path.getsize(self._file(name)) > n * row_bytes:
+                os.truncate(self._file(name), n * row_bytes)
+        return n
+
+    def append(self, ids: List[uuid.UUID], X: np.ndarray) -> int:
+        """Append rows in one write per file. Returns the new row count."""
+        X = np.asarray(X, dtype=np.float32).reshape(len(ids), self.dim)
+        with self._locked():
+            n = self._repair()
+            C = self._centroids()
+            with open(self._file("vectors.bin"), "ab") as f:
+                f.write(self._encode(X).tobytes())
+            # rows past the end of ivf_assign.bin (if it ever falls behind) are scanned in full
+            if C is not None and self._rows_in("ivf_assign.bin", 4) == n:
+                with open(self._file("ivf_assign.bin"), "ab") as f:
+                    f.write(_assign(C, X).tobytes())
+            with open(self._file("ids.bin"), "ab") as f:
+                f.write(b"".join(cid.bytes for cid in ids))
+        return n + len(ids)
+
+    # ---- reads ----
+    def _centroids(self) -> Optional[np.ndarray]:
+        try:
+            mtime = os.stat(self._file("ivf_centroids.npy")).st_mtime_ns
+        except FileNotFoundError:
+            self._ivf = None
+            return None
+        ivf = self._ivf
+        if ivf is None or ivf[0] != mtime:
+            with self._lock:
+                ivf = self._ivf
+                if ivf is None or ivf[0] != mtime:
+                    # a rebuild replaces ivf_assign.bin too; drop the map of the old file
+                    self._maps.pop("ivf_assign.bin", None)
+                    self._lists = None
+                    ivf = self._ivf = (mtime, np.load(self._file("ivf_centroids.npy")))
+        return ivf[1]
+
+    def _inverted_lists(self, C: np.ndarray, n: int) -> tuple:
+        """Rows grouped by IVF list, rebuilt when the centroids change or ~10% new rows came in."""
+        lists = self._lists
+        if _stale(lists, n) or lists[1] is not C:
+            with self._lock:
+                lists = self._lists
+                if _stale(lists, n) or lists[1] is not C:
+                    m = min(n, self._rows_in("ivf_assign.bin", 4))
+                    A = self._map("ivf_assign.bin", np.int32, 0, m)
+                    order = np.argsort(A, kind="stable")
+                    offsets = np.concatenate([[0], np.cumsum(np.bincount(A, minlength=len(C)))])
+                    lists = self._lists = (m, C, order, offsets)
+        return lists
+
+    def _candidates(self, C: np.ndarray, q: np.ndarray, n: int, nprobe: int) -> np.ndarray:
+        m, _, order, offsets = self._inverted_lists(C, n)
+        probes = np.argpartition(-(C @ q), nprobe - 1)[:nprobe]
+        parts = [order[offsets[c]:offsets[c + 1]] for c in probes]
+        # rows appended since the lists were built: filter by their stored assignment
+        tail = min(n, self._rows_in("ivf_assign.bin", 4))
+        if tail > m:
+            A = self._map("ivf_assign.bin", np.int32, 0, tail)[m:]
+            parts.append(m + np.flatnonzero(np.isin(A, probes)))
+        parts.append(np.arange(tail, n))  # not assigned at all (index being rebuilt)
+        rows = np.sort(np.concatenate(parts))  # sorted: sequential page access
+        return rows[:np.searchsorted(rows, n)]  # lists built by a caller that saw more rows
+
+    def search(self, q: np.ndarray, k: int, nprobe: int = EMBED_STORE_NPROBE) -> List[Tuple[uuid.UUID, float]]:
+        """Top-k (classification_id, cosine similarity), best first."""
+        q = np.asarray(q, dtype=np.float32).ravel()
+        n = len(self)
+        if n == 0 or k <= 0:
+            return []
+        V = self.vectors(n)
+        C = self._centroids()
+        if C is not None and 0 < nprobe < len(C):
+            rows = self._candidates(C, q, n, nprobe)
+            scores = self._scores(V[rows], q)
+        else:
+            rows = None
+            scores = np.empty(n, dtype=np.float32)
+            for lo in range(0, n, _SCAN_ROWS):
+                scores[lo:lo + _SCAN_ROWS] = self._scores(V[lo:lo + _SCAN_ROWS], q)
+        k = min(k, len(scores))
+        if k == 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top], kind="stable")]
+        I = self.ids(n)[top if rows is None else rows[top]]
+        return [(uuid.UUID(bytes=I[i].tobytes()), float(scores[t])) for i, t in enumerate(top)]
+
+    def vector(self, cid: uuid.UUID) -> Optional[np.ndarray]:
+        """Stored embedding of a classification (newest row if repeated), or None."""
+        n = len(self)
+        a, b = np.frombuffer(cid.bytes, dtype=np.uint64)
+        I = self.ids(n)
+        m, keys, order = self._ids_index(n)
+        # rows appended since the index was built are newer than any indexed row
+        hit = np.flatnonzero((I[m:n, 0] == a) & (I[m:n, 1] == b))
+        if len(hit):
+            row = m + hit[-1]
+        else:
+            rows = order[np.searchsorted(keys, a, "left"):np.searchsorted(keys, a, "right")]
+            rows = rows[rows < n]  # index built by a caller that saw more rows
+            rows = rows[I[rows, 1] == b]
+            if not len(rows):
+                return None
+            row = rows.max()
+        return self._decode(self.vectors(n)[row][None])[0]
+
+    def _ids_index(self, n: int) -> tuple:
+        """Row order sorting ids by their first 8 bytes, rebuilt once ~10% new rows came in."""
+        index = self._id_index
+        if _stale(index, n):
+            with self._lock:
+                index = self._id_index
+                if _stale(index, n):
+                    first = self.ids(n)[:, 0]
+                    order = np.argsort(first, kind="stable")
+                    index = self._id_index = (n, first[order], order)
+        return index
+
+    def iter_chunks(self, rows: int = _SCAN_ROWS) -> Iterator[Tuple[List[uuid.UUID], np.ndarray]]:
+        """(classification_ids, float32 embeddings) in storage order, e.g. to re-score with a new head."""
+        n = len(self)
+        V, I = self.vectors(n), self.ids(n)
+        for lo in range(0, n, rows):
+            yield [uuid.UUID(bytes=r.tobytes()) for r in I[lo:lo + rows]], self._decode(V[lo:lo + rows])
+
+    # ---- IVF index ----
+    def build_index(self, nlist: int = 0, sample: int = 0, iters: int = 10, seed: int = 0) -> Dict[str, Any]:
+        """Spherical k-means on a sample, then assign every row. Appends keep going meanwhile.
+
+        Defaults: sqrt(rows) lists, trained on 50 rows per list.
+        """
+        n0 = len(self)
+        nlist = nlist or int(min(65536, max(16, np.sqrt(n0))))
+        sample = sample or 50 * nlist
+        if n0 < nlist:
+            raise ValueError(f"need at least {nlist} rows for {nlist} lists, have {n0}")
+        t0 = time.perf_counter()
+        V = self.vectors(n0)
+        rng = np.random.default_rng(seed)
+        S = self._decode(V[np.sort(rng.choice(n0, size=min(sample, n0), replace=False))])
+        C = S[rng.choice(len(S), size=nlist, replace=False)].copy()
+        for _ in range(iters):
+            a = _assign(C, S)
+            counts = np.bincount(a, minlength=nlist)
+            order = np.argsort(a, kind="stable")
+            starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+            sums = S[rng.choice(len(S), size=nlist, replace=False)]  # reseeds lists that came out empty
+            sums[counts > 0] = np.add.reduceat(S[order], starts[counts > 0])
+            C = sums / np.clip(np.linalg.norm(sums, axis=1, keepdims=True), 1e-12, None)
+        C = C.astype(np.float32)
+
+        # assign what exists now without blocking appends; the lock covers only the catch-up
+        tmp = self._file("ivf_assign.bin.tmp")
+        with open(tmp, "wb") as f:
+            for lo in range(0, n0, _SCAN_ROWS):
+                f.write(_assign(C, self._decode(V[lo:lo + _SCAN_ROWS])).tobytes())
+        with self._locked():
+            n1 = self._repair()
+            V1 = self.vectors(n1)
+            with open(tmp, "ab") as f:
+                for lo in range(n0, n1, _SCAN_ROWS):
+                    f.write(_assign(C, self._decode(V1[lo:min(n1, lo + _SCAN_ROWS)])).tobytes())
+            os.replace(tmp, self._file("ivf_assign.bin"))
+            np.save(self._file("ivf_centroids.tmp.npy"), C)
+            os.replace(self._file("ivf_centroids.tmp.npy"), self._file("ivf_centroids.npy"))
+        return {"rows": n1, "nlist": nlist, "seconds": round(time.perf_counter() - t0, 2)}
+
+    def stats(self) -> Dict[str, Any]:
+        C = self._centroids()
+        return {"rows": len(self), "dim": self.dim, "dtype": self.dtype.name,
+                "ivf_lists": 0 if C is None else len(C)}
+
+
+def _stale(cached: Optional[tuple], n: int) -> bool:
+    """A row-covering cache (rows covered first) is missing or ~10% of `n` rows behind."""
+    return cached is None or n - cached[0] > max(_REINDEX_ROWS, cached[0] // 10)
+
+
+def _assign(C: np.ndarray, X: np.ndarray) -> np.ndarray:
+    """Closest centroid (max dot product) per row, as int32."""
+    out = np.empty(len(X), dtype=np.int32)
+    for lo in range(0, len(X), _ASSIGN_ROWS):
+        out[lo:lo + _ASSIGN_ROWS] = np.argmax(X[lo:lo + _ASSIGN_ROWS] @ C.T, axis=1)
+    return out
+
+
+class EmbeddingStore:
+    """Bounded queue of (bundle, classification_id, embedding) appended by a background thread.
+
+    Rows are appended to their bundle's embedding space every `flush_rows`
+    rows or `flush_ms` milliseconds; when the queue is full, rows are dropped
+    (and counted) rather than slowing requests down.
+    """
+
+    def __init__(self, root: str, dtype: str = EMBED_STORE_DTYPE, max_queue: int = EMBED_STORE_QUEUE_MAX,
+                 flush_rows: int = EMBED_STORE_FLUSH_ROWS, flush_ms: float = EMBED_STORE_FLUSH_MS):
+        self.root = root
+        self.dtype = dtype
+        self.queue = BackgroundQueue("embedding-store", self._flush, max_queue=max(1, max_queue),
+                                     max_batch=flush_rows, max_wait_ms=max(1.0, flush_ms))
+        self._stores: Dict[str, VectorStore] = {}
+        self._lock = threading.Lock()
+        self.queued = 0
+        self.written = 0
+        self.dropped = 0
+        self.failed = 0
+        self.flushes = 0
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.root)
+
+    def _open(self, bundle, dim: Optional[int] = None) -> Optional[VectorStore]:
+        key = space_key(bundle.emb_id, bundle.emb_backend)
+        with self._lock:
+            store = self._stores.get(key)
+            if store is None:
+                path = os.path.join(self.root, key)
+                if dim is None and not os.path.exists(os.path.join(path, "meta.json")):
+                    return None
+                store = VectorStore(path, dim, self.dtype, info={
+                    "embedding_model": bundle.emb_id, "embedding_backend": bundle.emb_backend,
+                    "long_text_strategy": LONG_TEXT_STRATEGY,
+                })
+                self._stores[key] = store
+            return store
+
+    def store(self, bundle) -> Optional[VectorStore]:
+        """The bundle's embedding space, or None if nothing was stored for it yet."""
+        return self._open(bundle) if self.enabled else None
+
+    def start(self) -> None:
+        if self.enabled:
+            self.queue.start()
+
+    def stop(self, timeout: float = 10.0) -> None:
+        """Append whatever is queued and stop the writer thread."""
+        self.queue.stop(timeout)
+
+    def enqueue(self, bundle, cid: uuid.UUID, x: np.ndarray) -> bool:
+        """Queue one classification's embedding. Never raises."""
+        if not self.enabled:
+            return False
+        if not self.queue.started:
+            self.start()
+        if not self.queue.put((bundle, cid, x)):
+            self.dropped += 1
+            return False
+        self.queued += 1
+        return True
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "dtype": self.dtype,
+            "queue_depth": self.queue.qsize(),
+            "queued": self.queued,
+            "written": self.written,
+            "dropped": self.dropped,
+            "failed": self.failed,
+            "flushes": self.flushes,
+            "spaces": {key: store.stats() for key, store in list(self._stores.items())},
+        }
+
+    def _flush(self, items: list) -> None:
+        if not items:
+            return
+        groups: Dict[int, list] = {}
+        for item in items:
+            groups.setdefault(id(item[0]), []).append(item)
+        for group in groups.values():
+            try:
+                X = np.stack([x for _, _, x in group])
+                self._open(group[0][0], X.shape[1]).append([cid for _, cid, _ in group], X)
+                self.written += len(group)
+            except Exception:
+                # the store is best-effort, like telemetry; count and move on
+                self.failed += len(group)
+        self.flushes += 1
+
+
+EMBEDDING_STORE = EmbeddingStore(EMBED_STORE_DIR)
+EMBEDDING_STORE.queue.register_metrics("embedding_store", "embedding_store")
+for _event in ("queued", "written", "dropped", "failed", "flushes"):
+    EVENTS.add(lambda e=_event: getattr(EMBEDDING_STORE, e), "embedding_store", _event)
+
+
+def _spaces(root: str, only: Optional[str]) -> List[VectorStore]:
+    keys = [only] if only else sorted(k for k in os.listdir(root) if os.path.exists(os.path.join(root, k, "meta.json")))
+    return [VectorStore(os.path.join(root, k)) for k in keys]
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    ap = argparse.ArgumentParser(prog="python -m app.ml.embedding_store")
+    ap.add_argument("--dir", default=EMBED_STORE_DIR, help="store root (default: EMBED_STORE_DIR)")
+    ap.add_argument("--space", help="one embedding space directory name (default: all)")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    sub.add_parser("stats", help="rows, dtype and index size per embedding space")
+    idx = sub.add_parser("build-index", help="(re)build the IVF index of each space")
+    idx.add_argument("--nlist", type=int, default=0, help="IVF lists (default: sqrt(rows))")
+    idx.add_argument("--sample", type=int, default=0, help="rows used to train the centroids (default: 50 per list)")
+    idx.add_argument("--iters", type=int, default=10)
+    args = ap.parse_args(argv)
+
+    if not args.dir:
+        raise SystemExit("set EMBED_STORE_DIR or pass --dir")
+    report = {}
+    for store in _spaces(args.dir, args.space):
+        key = os.path.basename(store.path)
+        if args.cmd == "build-index":
+            report[key] = store.build_index(args.nlist, args.sample, args.iters)
+        else:
+            report[key] = {**store.meta, **store.stats()}
+    print(json.dumps(report, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,183 @@
+# app/ml/fused_head.py
+"""Fused NumPy evaluation of the calibrated classifier head.
+
+`CalibratedClassifierCV.predict_proba` loops in Python over every calibration
+fold (base estimator + calibrator) and re-validates its input each time. For
+linear base estimators the whole head reduces to
+
+    Z = X @ W + b                      # one float32 matmul for all folds
+    P[:, k] = calibrator_k(Z[:, k])    # sigmoid: one vectorized expit; isotonic: np.interp
+    p = P.mean(axis=1)
+
+`compile_head` builds that from a fitted model, or returns None when the model
+is not a binary linear classifier (optionally wrapped in CalibratedClassifierCV
+with sigmoid/isotonic calibration); callers then keep sklearn.
+
+    python -m app.ml.fused_head parity [--texts sample.txt]
+
+compares both on sample embeddings (the loader runs the same check on load).
+"""
+import argparse
+import json
+from typing import Any, List, Optional, Tuple
+
+import numpy as np
+
+# Base estimators whose decision_function is X @ coef_.T + intercept_
+_LINEAR = ("LogisticRegression", "LogisticRegressionCV", "LinearSVC", "SGDClassifier",
+           "RidgeClassifier", "RidgeClassifierCV", "Perceptron", "PassiveAggressiveClassifier",
+           "LinearDiscriminantAnalysis")
+
+
+class SklearnHead:
+    """The unfused fallback: `predict_proba(X)[:, 1]` of the loaded model."""
+    kind = "sklearn"
+
+    def __init__(self, clf: Any):
+        self.clf = clf
+
+    def scores(self, X: np.ndarray) -> np.ndarray:
+        return self.clf.predict_proba(X)[:, 1]
+
+
+class FusedHead:
+    """Positive-class probability of a compiled binary (calibrated) linear classifier."""
+    kind = "fused"
+
+    def __init__(self, W: np.ndarray, b: np.ndarray, sigmoid: Optional[Tuple[np.ndarray, np.ndarray]],
+                 isotonic: List[Tuple[int, np.ndarray, np.ndarray]], n_folds: int):
+        self.W = np.ascontiguousarray(W, dtype=np.float32)  # (n_features, n_folds)
+        self.b = np.asarray(b, dtype=np.float32)             # (n_folds,)
+        # sigmoid folds: columns `idx` with p = expit(-(a * z + c))
+        self.sigmoid = sigmoid
+        # isotonic folds: (column, x thresholds, y thresholds) evaluated with np.interp
+        self.isotonic = isotonic
+        self.n_folds = n_folds
+        self.n_features_in_ = self.W.shape[0]
+
+    def scores(self, X: np.ndarray) -> np.ndarray:
+        Z = np.asarray(X, dtype=np.float32) @ self.W
+        Z += self.b
+        Z = Z.astype(np.float64)  # calibrators work in float64, like sklearn
+        total = np.zeros(Z.shape[0])
+        if self.sigmoid is not None:
+            idx, a, c = self.sigmoid
+            total += (1.0 / (1.0 + np.exp(Z[:, idx] * a + c))).sum(axis=1)
+        for col, xs, ys in self.isotonic:
+            total += np.interp(Z[:, col], xs, ys)
+        p = total / self.n_folds
+        p[(1.0 < p) & (p <= 1.0 + 1e-5)] = 1.0
+        return p
+
+    def predict_proba(self, X: np.ndarray) -> np.ndarray:
+        p = self.scores(X)
+        return np.column_stack([1.0 - p, p])
+
+
+def _linear_weights(est: Any) -> Optional[Tuple[np.ndarray, float]]:
+    if type(est).__name__ not in _LINEAR or not hasattr(est, "coef_"):
+        return None
+    coef = np.asarray(est.coef_, dtype=np.float64)
+    if coef.ndim != 2 or coef.shape[0] != 1 or len(getattr(est, "classes_", ())) != 2:
+        return None
+    return coef[0], float(np.ravel(est.intercept_)[0])
+
+
+def compile_head(clf: Any) -> Optional[FusedHead]:
+    """FusedHead equivalent to `clf.predict_proba(X)[:, 1]`, or None if `clf` isn't supported."""
+    name = type(clf).__name__
+    if name == "LogisticRegression":
+        lin = _linear_weights(clf)
+        if lin is None:
+            return None
+        # plain logistic regression: p = expit(z) = expit(-(-1 * z + 0))
+        return FusedHead(lin[0][:, None], np.array([lin[1]]),
+                         (np.array([0]), np.array([-1.0]), np.array([0.0])), [], 1)
+    if name != "CalibratedClassifierCV" or len(getattr(clf, "classes_", ())) != 2:
+        return None
+
+    cols, bias, sig_idx, sig_a, sig_c, iso = [], [], [], [], [], []
+    for k, cc in enumerate(clf.calibrated_classifiers_):
+        lin = _linear_weights(cc.estimator)
+        if lin is None or len(cc.calibrators) != 1:
+            return None
+        # the decision value scores classes_[1]; both must match the ensemble's order
+        if not np.array_equal(cc.estimator.classes_, clf.classes_):
+            return None
+        cal = cc.calibrators[0]
+        cal_name = type(cal).__name__
+        if cal_name == "_SigmoidCalibration":
+            sig_idx.append(k)
+            sig_a.append(float(cal.a_))
+            sig_c.append(float(cal.b_))
+        elif cal_name == "IsotonicRegression" and getattr(cal, "out_of_bounds", None) == "clip":
+            iso.append((k, np.asarray(cal.X_thresholds_, dtype=np.float64),
+                        np.asarray(cal.y_thresholds_, dtype=np.float64)))
+        else:
+            return None
+        cols.append(lin[0])
+        bias.append(lin[1])
+
+    sigmoid = (np.array(sig_idx), np.array(sig_a), np.array(sig_c)) if sig_idx else None
+    return FusedHead(np.stack(cols, axis=1), np.array(bias), sigmoid, iso, len(cols))
+
+
+def parity(head: FusedHead, clf: Any, X: np.ndarray) -> float:
+    """Max |fused - sklearn| positive-class probability over the rows of X."""
+    return float(np.max(np.abs(head.scores(X) - clf.predict_proba(X)[:, 1]))) if len(X) else 0.0
+
+
+def probe_inputs(n_features: int, X: Optional[np.ndarray] = None, n_random: int = 64, seed: int = 0) -> np.ndarray:
+    """Parity inputs: real embeddings when given, plus random unit vectors to cover the score range."""
+    rng = np.random.default_rng(seed)
+    R = rng.standard_normal((n_random, n_features)).astype(np.float32)
+    R /= np.linalg.norm(R, axis=1, keepdims=True)
+    return R if X is None else np.vstack([np.asarray(X, dtype=np.float32), R])
+
+
+def load_head(clf: Any, enabled: bool, tolerance: float, X: Optional[np.ndarray] = None):
+    """(head, parity report): the fused head if it compiles and matches sklearn within `tolerance`."""
+    if not enabled:
+        return SklearnHead(clf), {"kind": "sklearn", "reason": "disabled"}
+    head = compile_head(clf)
+    if head is None:
+        return SklearnHead(clf), {"kind": "sklearn", "reason": f"unsupported model {type(clf).__name__}"}
+    diff = parity(head, clf, probe_inputs(head.n_features_in_, X))
+    report = {"kind": "fused", "max_score_diff": round(diff, 8), "tolerance": tolerance, "folds": head.n_folds}
+    if diff > tolerance:
+        return SklearnHead(clf), {**report, "kind": "sklearn", "reason": "parity check failed"}
+    return head, report
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    import joblib
+    from app.core.config import ARTS_DIR, CLF_PATH, FUSED_HEAD_PARITY_TOL
+
+    ap = argparse.ArgumentParser(prog="python -m app.ml.fused_head")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    chk = sub.add_parser("parity", help="compare the fused head with sklearn predict_proba")
+    chk.add_argument("--tolerance", type=float, default=FUSED_HEAD_PARITY_TOL)
+    chk.add_argument("--texts", help="optional file with one sample text per line (embedded with the model)")
+    chk.add_argument("--random", type=int, default=1000, help="random unit vectors added to the probe set")
+    args = ap.parse_args(argv)
+
+    clf = joblib.load(CLF_PATH)
+    head = compile_head(clf)
+    if head is None:
+        print(json.dumps({"supported": False, "model": type(clf).__name__}))
+        return 1
+    X = None
+    if args.texts:
+        from app.ml.model_loader import load_bundle
+        with open(args.texts, "r", encoding="utf-8") as f:
+            texts = [line.strip() for line in f if line.strip()]
+        X = load_bundle(ARTS_DIR, warmup_batch_sizes=[]).emb.encode(
+            texts, normalize_embeddings=True, convert_to_numpy=True, show_progress_bar=False)
+    diff = parity(head, clf, probe_inputs(head.n_features_in_, X, n_random=args.random))
+    print(json.dumps({"supported": True, "folds": head.n_folds, "max_score_diff": diff,
+                      "tolerance": args.tolerance, "passed": diff <= args.tolerance}, indent=2))
+    return 0 if diff <= args.tolerance else 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -1,11 +1,90 @@
-from typing import List, Literal
+from typing import List, Literal, Optional, Tuple
 import numpy as np
-from app.ml.model_loader import EMB, CLF, THRESHOLD
+from app.core.config import (
+    EMBED_CHARS_PER_TOKEN, LONG_TEXT_STRATEGY, MAX_CHUNKS, EMBED_BATCH_SIZE, EMBED_BATCH_CHARS
+)
+from app.core.deadline import check
+from app.ml.model_loader import ModelBundle
+from app.ml.registry import get_bundle
 
-def infer_labels(texts: List[str]) -> np.ndarray:
-    X = EMB.encode(texts, normalize_embeddings=True, convert_to_numpy=True, show_progress_bar=False)
-    p = CLF.predict_proba(X)[:, 1]
-    return p
+def _segment_chars(emb) -> int:
+    # Approximate chars the encoder can see per segment; the tokenizer still enforces max_seq_length exactly.
+    return int(getattr(emb, "max_seq_length", None) or 128) * EMBED_CHARS_PER_TOKEN
 
-def decide_label(p: float, threshold: float = THRESHOLD) -> Literal["Produtivo","Improdutivo"]:
+def _segments(text: str, seg_chars: int, strategy: str = LONG_TEXT_STRATEGY) -> List[str]:
+    if strategy == "chunk_mean":
+        if len(text) <= seg_chars:
+            return [text]
+        return [text[i:i + seg_chars] for i in range(0, len(text), seg_chars)][:MAX_CHUNKS]
+    if strategy == "head_tail":
+        if len(text) <= seg_chars:
+            return [text]
+        half = seg_chars // 2
+        return [text[:half] + "\n...\n" + text[-half:]]
+    # head: keep a 2x margin so the tokenizer, not us, decides the exact cut
+    return [text[:2 * seg_chars]]
+
+def _length_batches(lengths: List[int]) -> List[List[int]]:
+    """Indices sorted by length, grouped so padded size (n * longest) stays within EMBED_BATCH_CHARS."""
+    order = sorted(range(len(lengths)), key=lengths.__getitem__)
+    batches: List[List[int]] = []
+    cur: List[int] = []
+    for i in order:
+        if cur and (len(cur) >= EMBED_BATCH_SIZE or (len(cur) + 1) * max(lengths[i], 1) > EMBED_BATCH_CHARS):
+            batches.append(cur)
+            cur = []
+        cur.append(i)
+    if cur:
+        batches.append(cur)
+    return batches
+
+def _embedding_dim(bundle: ModelBundle) -> int:
+    # the classifier was fitted on the embedder's output, so it knows the width without an encode
+    return int(getattr(bundle.head, "n_features_in_", None) or bundle.clf.n_features_in_)
+
+def _encode_segments(emb, segs: List[str], deadline=None, dim: int = 0) -> np.ndarray:
+    """(len(segs), dim) embeddings; `dim` only shapes the result when there is nothing to encode."""
+    if not segs:
+        return np.empty((0, dim), dtype=np.float32)
+    out = None
+    for idx in _length_batches([len(s) for s in segs]):
+        check(deadline, "encode")  # give up between sub-batches once nobody is waiting
+        X = emb.encode([segs[i] for i in idx], batch_size=len(idx), normalize_embeddings=True,
+                       convert_to_numpy=True, show_progress_bar=False)
+        if out is None:
+            out = np.empty((len(segs), X.shape[1]), dtype=X.dtype)
+        out[idx] = X
+    return out
+
+def encode_texts(texts: List[str], bundle: Optional[ModelBundle] = None, deadline=None) -> np.ndarray:
+    bundle = bundle or get_bundle()
+    emb = bundle.emb
+    seg_chars = _segment_chars(emb)
+    segs: List[str] = []
+    owners: List[Tuple[int, int]] = []  # (start, stop) into segs per text
+    for t in texts:
+        parts = _segments(t, seg_chars)
+        owners.append((len(segs), len(segs) + len(parts)))
+        segs.extend(parts)
+    S = _encode_segments(emb, segs, deadline, _embedding_dim(bundle))
+    if len(segs) == len(texts):
+        return S
+    # chunk_mean: average chunk embeddings per text and renormalize
+    X = np.stack([S[a:b].mean(axis=0) for a, b in owners])
+    X /= np.clip(np.linalg.norm(X, axis=1, keepdims=True), 1e-12, None)
+    return X
+
+def predict_scores(X: np.ndarray, bundle: Optional[ModelBundle] = None) -> np.ndarray:
+    """P(Produtivo) per row, through the bundle's fused head when it has one."""
+    if not len(X):
+        return np.empty(0, dtype=np.float64)  # sklearn refuses 0-row input
+    return (bundle or get_bundle()).head.scores(X)
+
+def infer_labels(texts: List[str], bundle: Optional[ModelBundle] = None, deadline=None) -> np.ndarray:
+    bundle = bundle or get_bundle()
+    return predict_scores(encode_texts(texts, bundle, deadline), bundle)
+
+def decide_label(p: float, threshold: Optional[float] = None) -> Literal["Produtivo","Improdutivo"]:
+    if threshold is None:
+        threshold = get_bundle().threshold
     return "Produtivo" if p >= threshold else "Improdutivo"
@@ -1,25 +1,183 @@
 import os
 import json
+import time
+import logging
+import importlib
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
 import joblib
-from sentence_transformers import SentenceTransformer
-from app.core.config import META_PATH, CLF_PATH, EMB_DIR
+from app.core.config import (
+    ARTS_DIR, EMBED_BACKEND, EMBED_BACKEND_MODULES, ONNX_PARITY_TOL, LONG_TEXT_STRATEGY, WARMUP_BATCH_SIZES,
+    FUSED_HEAD_ON, FUSED_HEAD_PARITY_TOL, THRESHOLD_FILE,
+)
+from app.ml.fused_head import SklearnHead, load_head
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_EMB_ID = "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2"
+
+# Representative inputs for warmup: short asks, templated notices and a long thread
+WARMUP_TEXTS = [
+    "Qual o status do chamado 48213?",
+    "Estou recebendo erro 500 ao acessar o sistema.",
+    "Pode liberar meu acesso ao ERP?",
+    "Segue anexo o contrato assinado.",
+    "Estou ausente até segunda-feira.",
+    "Feliz aniversário! Muitas felicidades.",
+    "Hi team, could you send me the status of ticket 9912?",
+    "Prezados, conforme conversado na reunião, encaminho as pendências do projeto. "
+    "Favor verificar os itens em aberto e retornar até sexta-feira com as atualizações. " * 8,
+]
+
+
+@dataclass
+class ModelBundle:
+    """Everything one model version needs to serve: metadata, embedder, classifier, threshold."""
+    meta: Dict[str, Any]
+    emb: Any
+    clf: Any
+    threshold: float
+    emb_id: str
+    emb_backend: str
+    arts_dir: str
+    timings_ms: Dict[str, float] = field(default_factory=dict)
+    generation: int = 0  # set by the registry when the bundle is swapped in
+    head: Any = None  # scores(X) -> P(Produtivo); fused NumPy head or the sklearn model itself
+    head_report: Dict[str, Any] = field(default_factory=dict)
+    threshold_source: str = "metadata"  # metadata | <THRESHOLD_FILE> | env
+
+    def __post_init__(self):
+        if self.head is None:
+            self.head = SklearnHead(self.clf)
+
+    @property
+    def version(self) -> str:
+        return self.meta.get("created_at", "unknown")
+
+    @property
+    def cache_namespace(self) -> str:
+        """Identifies everything that changes an embedding/score for the same text."""
+        return f"{self.version}\0{self.emb_id}\0{self.emb_backend}\0{LONG_TEXT_STRATEGY}\0"
+
+
+def _load_torch_embedder(emb_dir: str, emb_id: str):
+    # imported lazily so ONNX-only deployments never pay for torch
+    from sentence_transformers import SentenceTransformer
+    if os.path.isdir(emb_dir):
+        return SentenceTransformer(emb_dir)
+    return SentenceTransformer(emb_id)
+
+
+# name -> load(emb_dir, emb_id); filled by the EMBED_BACKEND_MODULES, never by the service itself
+_EXTRA_BACKENDS: Dict[str, Callable[[str, str], Any]] = {}
+_extra_modules_imported = False
+
+
+def register_embed_backend(name: str, load: Callable[[str, str], Any]) -> None:
+    """Serve `"embed_backend": name` with `load(emb_dir, emb_id)`, e.g. a stand-in embedder for benchmarks."""
+    _EXTRA_BACKENDS[name] = load
+
+
+def _import_extra_backends() -> None:
+    global _extra_modules_imported
+    if not _extra_modules_imported:
+        for module in EMBED_BACKEND_MODULES:
+            importlib.import_module(module)
+        _extra_modules_imported = True
+
+
+def _load_embedder(emb_dir: str, emb_id: str, backend: str, clf: Any):
+    _import_extra_backends()
+    if backend in _EXTRA_BACKENDS:
+        return _EXTRA_BACKENDS[backend](emb_dir, emb_id), backend
+    if backend in ("onnx", "onnx-int8"):
+        from app.ml.onnx_backend import load_onnx_embedder
+        try:
+            return load_onnx_embedder(emb_dir, backend, ONNX_PARITY_TOL, clf), backend
+        except Exception as e:
+            logger.warning("ONNX backend %s not enabled (%s); falling back to torch", backend, e)
+    elif backend != "torch":
+        logger.warning("Unknown embed backend %r; using torch", backend)
+    return _load_torch_embedder(emb_dir, emb_id), "torch"
+
+
+def _warmup(emb, head, batch_sizes: List[int]) -> None:
+    for n in batch_sizes:
+        texts = (WARMUP_TEXTS * (n // len(WARMUP_TEXTS) + 1))[:n]
+        X = emb.encode(texts, batch_size=n, normalize_embeddings=True, convert_to_numpy=True,
+                       show_progress_bar=False)
+        head.scores(X)
+
+
+def _recalibrated_threshold(arts_dir: str, meta: Dict[str, Any], emb_id: str) -> Optional[float]:
+    """Threshold from THRESHOLD_FILE (app.cli.recalibrate) if it was computed for this model."""
+    if not THRESHOLD_FILE:
+        return None
+    path = os.path.join(arts_dir, THRESHOLD_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        doc = json.load(f)
+    if doc.get("model_version") != meta.get("created_at", "unknown") or doc.get("embedding_model") != emb_id:
+        logger.warning("Ignoring %s: written for model %s / %s", path, doc.get("model_version"), doc.get("embedding_model"))
+        return None
+    return float(doc["threshold_produtivo"])
+
+
+def resolve_threshold(arts_dir: str, meta: Dict[str, Any], emb_id: str) -> Tuple[float, str]:
+    """(threshold, source) a load of `arts_dir` serves: THRESHOLD env, else THRESHOLD_FILE, else metadata."""
+    if os.environ.get("THRESHOLD"):
+        return float(os.environ["THRESHOLD"]), "env"
+    recalibrated = _recalibrated_threshold(arts_dir, meta, emb_id)
+    if recalibrated is not None:
+        return recalibrated, THRESHOLD_FILE
+    return float(meta["threshold_produtivo"]), "metadata"
+
+
+def load_bundle(arts_dir: str = ARTS_DIR, warmup_batch_sizes: Optional[List[int]] = None) -> ModelBundle:
+    """Load metadata, embedder and classifier from `arts_dir` and warm them up, timing each phase."""
+    timings: Dict[str, float] = {}
+
+    t0 = time.perf_counter()
+    with open(os.path.join(arts_dir, "metadata.json"), "r", encoding="utf-8") as f:
+        meta = json.load(f)
+    emb_id = meta.get("embedding_model", DEFAULT_EMB_ID)
+    threshold, threshold_source = resolve_threshold(arts_dir, meta, emb_id)
+    backend = EMBED_BACKEND or str(meta.get("embed_backend", "torch")).lower()
+    timings["metadata"] = (time.perf_counter() - t0) * 1000
 
-# Load META, embeddings, classifier
-with open(META_PATH, "r", encoding="utf-8") as f:
-    META = json.load(f)
+    t0 = time.perf_counter()
+    clf = joblib.load(os.path.join(arts_dir, "clf_cal.joblib"))
+    timings["classifier"] = (time.perf_counter() - t0) * 1000
 
-THRESHOLD = float(os.environ.get("THRESHOLD", META["threshold_produtivo"]))
-EMB_ID = META.get("embedding_model", "sentence-transformers/paraphrase-multilingual-MiniLM-L12-v2")
+    t0 = time.perf_counter()
+    # the classifier scores the ONNX parity probe, so it is loaded first
+    emb, backend = _load_embedder(os.path.join(arts_dir, "embedder"), emb_id, backend, clf)
+    timings["embedder"] = (time.perf_counter() - t0) * 1000
 
-if os.path.isdir(EMB_DIR):
-    EMB = SentenceTransformer(EMB_DIR)
-else:
-    EMB = SentenceTransformer(EMB_ID)
+    t0 = time.perf_counter()
+    try:
+        # checked on real embeddings of the warmup texts plus random unit vectors
+        probe = emb.encode(WARMUP_TEXTS, normalize_embeddings=True, convert_to_numpy=True,
+                           show_progress_bar=False)
+        head, head_report = load_head(clf, FUSED_HEAD_ON, FUSED_HEAD_PARITY_TOL, probe)
+    except Exception as e:
+        logger.warning("Fused classifier head not enabled (%s); using sklearn", e)
+        head, head_report = SklearnHead(clf), {"kind": "sklearn", "reason": str(e)}
+    if head_report.get("reason") not in (None, "disabled"):
+        logger.warning("Classifier head: %s", head_report)
+    timings["head"] = (time.perf_counter() - t0) * 1000
 
-CLF = joblib.load(CLF_PATH)
+    t0 = time.perf_counter()
+    try:
+        _warmup(emb, head, WARMUP_BATCH_SIZES if warmup_batch_sizes is None else warmup_batch_sizes)
+    except Exception:
+        logger.exception("Warmup failed")
+    timings["warmup"] = (time.perf_counter() - t0) * 1000
 
-# Warmup
-try:
-    EMB.encode(["warmup"], normalize_embeddings=True, convert_to_numpy=True, show_progress_bar=False)
-except Exception:
-    pass
\ No newline at end of file
+    return ModelBundle(
+        meta=meta, emb=emb, clf=clf, threshold=threshold, emb_id=emb_id, emb_backend=backend,
+        arts_dir=arts_dir, timings_ms={k: round(v, 1) for k, v in timings.items()},
+        head=head, head_report=head_report, threshold_source=threshold_source,
+    )
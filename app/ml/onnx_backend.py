@@ -0,0 +1,246 @@
+# app/ml/onnx_backend.py
+"""ONNX Runtime embedding backend.
+
+Export the SentenceTransformer in EMB_DIR (optionally with a dynamic int8
+variant) and record a parity report against the torch embeddings:
+
+    python -m app.ml.onnx_backend export [--quantize] [--tolerance 0.01]
+
+`model_loader` only serves an ONNX variant whose report passed, at a
+tolerance no looser than `ONNX_PARITY_TOL`. The check also stores a small
+probe set (texts + torch embeddings, `parity_probe.npz`); every load re-scores
+it through the variant with the loaded classifier and refuses the variant if
+it drifts, since int8 kernels can differ between onnxruntime builds and CPUs.
+"""
+import argparse
+import json
+import os
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+ONNX_SUBDIR = "onnx"
+PARITY_FILE = "parity.json"
+PROBE_FILE = "parity_probe.npz"
+PROBE_MAX_TEXTS = 32  # re-encoded on every load, so keep it small
+VARIANTS = {"onnx": "model.onnx", "onnx-int8": "model.int8.onnx"}
+
+# Representative PT/EN inputs for the parity check (short, long, templated)
+PARITY_TEXTS = [
+    "Qual o status do chamado 48213? Preciso de uma atualização.",
+    "Estou recebendo erro 500 ao acessar o sistema de faturamento.",
+    "Pode liberar meu acesso ao ERP? Fui transferido para o financeiro.",
+    "Preciso redefinir minha senha, o reset não chegou no e-mail.",
+    "Segue anexo o contrato assinado para conferência.",
+    "Estou ausente até segunda-feira com acesso limitado ao e-mail.",
+    "Feliz aniversário! Muitas felicidades para você e sua família.",
+    "Obrigado pela ajuda de ontem, pessoal!",
+    "Hi team, could you send me the status of ticket 9912?",
+    "Out of office: I will be back on Monday.",
+    "Bom dia, tudo bem? " * 40,
+    "Prezados, conforme conversado na reunião, encaminho as pendências do projeto. "
+    "Favor verificar os itens em aberto e retornar até sexta. " * 10,
+]
+
+
+class OnnxEmbedder:
+    """Drop-in for the subset of `SentenceTransformer.encode` the service uses (mean pooling)."""
+
+    def __init__(self, model_path: str, tokenizer_dir: str, max_seq_length: int = 128,
+                 intra_op_threads: Optional[int] = None):
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+
+        opts = ort.SessionOptions()
+        opts.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        threads = intra_op_threads or int(os.environ.get("OMP_NUM_THREADS", "1"))
+        opts.intra_op_num_threads = threads
+        opts.inter_op_num_threads = 1
+        self.session = ort.InferenceSession(model_path, sess_options=opts, providers=["CPUExecutionProvider"])
+        self.input_names = {i.name for i in self.session.get_inputs()}
+        self.max_seq_length = max_seq_length
+        self.tokenizer = Tokenizer.from_file(os.path.join(tokenizer_dir, "tokenizer.json"))
+        self.tokenizer.enable_truncation(max_length=max_seq_length)
+        self.tokenizer.enable_padding()
+
+    def encode(self, texts: List[str], batch_size: int = 32, normalize_embeddings: bool = True,
+               convert_to_numpy: bool = True, show_progress_bar: bool = False) -> np.ndarray:
+        out = []
+        for i in range(0, len(texts), batch_size):
+            encs = self.tokenizer.encode_batch(list(texts[i:i + batch_size]))
+            ids = np.asarray([e.ids for e in encs], dtype=np.int64)
+            mask = np.asarray([e.attention_mask for e in encs], dtype=np.int64)
+            feeds = {"input_ids": ids, "attention_mask": mask}
+            if "token_type_ids" in self.input_names:
+                feeds["token_type_ids"] = np.zeros_like(ids)
+            tokens = self.session.run(None, feeds)[0]
+            m = mask[..., None].astype(np.float32)
+            emb = (tokens * m).sum(axis=1) / np.clip(m.sum(axis=1), 1e-9, None)
+            if normalize_embeddings:
+                emb /= np.clip(np.linalg.norm(emb, axis=1, keepdims=True), 1e-12, None)
+            out.append(emb.astype(np.float32))
+        return np.vstack(out) if out else np.zeros((0, 0), dtype=np.float32)
+
+
+def _max_seq_length(emb_dir: str, default: int = 128) -> int:
+    path = os.path.join(emb_dir, "sentence_bert_config.json")
+    if os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            return int(json.load(f).get("max_seq_length", default))
+    return default
+
+
+def read_parity(emb_dir: str) -> Dict[str, dict]:
+    path = os.path.join(emb_dir, ONNX_SUBDIR, PARITY_FILE)
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def read_probe(emb_dir: str) -> Optional[Tuple[List[str], np.ndarray]]:
+    """(texts, torch embeddings) stored by the last parity check, or None."""
+    path = os.path.join(emb_dir, ONNX_SUBDIR, PROBE_FILE)
+    if not os.path.exists(path):
+        return None
+    with np.load(path, allow_pickle=False) as f:
+        return [str(t) for t in f["texts"]], f["embeddings"]
+
+
+def probe_score_diff(emb: OnnxEmbedder, clf, texts: List[str], ref: np.ndarray) -> float:
+    """Max |score(variant) - score(torch)| on the probe texts, both through `clf`."""
+    return float(np.max(np.abs(clf.predict_proba(emb.encode(texts))[:, 1] - clf.predict_proba(ref)[:, 1])))
+
+
+def load_onnx_embedder(emb_dir: str, variant: str, tolerance: float, clf=None) -> OnnxEmbedder:
+    """Load an exported variant, refusing it unless its parity report is within `tolerance`.
+
+    With `clf`, the stored probe set is re-scored through the variant here and
+    now, and the variant is refused if that drifts past `tolerance` too.
+    """
+    if variant not in VARIANTS:
+        raise ValueError(f"unknown ONNX variant {variant!r}")
+    report = read_parity(emb_dir).get(variant)
+    if not report:
+        raise RuntimeError(f"no parity report for {variant}; run `python -m app.ml.onnx_backend export`")
+    if not report.get("passed") or report["max_score_diff"] > tolerance:
+        raise RuntimeError(
+            f"{variant} score drift {report['max_score_diff']:.5f} exceeds tolerance {tolerance}"
+        )
+    onnx_dir = os.path.join(emb_dir, ONNX_SUBDIR)
+    emb = OnnxEmbedder(os.path.join(onnx_dir, VARIANTS[variant]), onnx_dir, _max_seq_length(emb_dir))
+    if clf is not None:
+        probe = read_probe(emb_dir)
+        if probe is None:
+            raise RuntimeError(f"no parity probe for {variant}; run `python -m app.ml.onnx_backend parity`")
+        diff = probe_score_diff(emb, clf, *probe)
+        if diff > tolerance:
+            raise RuntimeError(f"{variant} score drift {diff:.5f} on load exceeds tolerance {tolerance}")
+    return emb
+
+
+def export_onnx(emb_dir: str, quantize: bool = False, opset: int = 17) -> List[str]:
+    """Export the transformer in `emb_dir` to ONNX (and optionally a dynamic int8 copy)."""
+    import torch
+    from sentence_transformers import SentenceTransformer
+
+    st = SentenceTransformer(emb_dir, device="cpu")
+    transformer = st[0]
+    model = transformer.auto_model.eval()
+    onnx_dir = os.path.join(emb_dir, ONNX_SUBDIR)
+    os.makedirs(onnx_dir, exist_ok=True)
+    transformer.tokenizer.save_pretrained(onnx_dir)
+
+    sample = transformer.tokenizer(["warmup text"], return_tensors="pt", padding=True)
+    input_names = [n for n in ("input_ids", "attention_mask", "token_type_ids") if n in sample]
+    dynamic = {n: {0: "batch", 1: "seq"} for n in input_names}
+    dynamic["last_hidden_state"] = {0: "batch", 1: "seq"}
+    out_path = os.path.join(onnx_dir, VARIANTS["onnx"])
+    with torch.no_grad():
+        torch.onnx.export(
+            model,
+            tuple(sample[n] for n in input_names),
+            out_path,
+            input_names=input_names,
+            output_names=["last_hidden_state"],
+            dynamic_axes=dynamic,
+            opset_version=opset,
+        )
+    written = [out_path]
+    if quantize:
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+
+        q_path = os.path.join(onnx_dir, VARIANTS["onnx-int8"])
+        quantize_dynamic(out_path, q_path, weight_type=QuantType.QInt8)
+        written.append(q_path)
+    return written
+
+
+def parity_check(emb_dir: str, clf, variants: List[str], tolerance: float,
+                 texts: Optional[List[str]] = None) -> Dict[str, dict]:
+    """Compare ONNX variants against torch on embeddings and calibrated scores; persist the report."""
+    from sentence_transformers import SentenceTransformer
+
+    texts = texts or PARITY_TEXTS
+    ref = SentenceTransformer(emb_dir, device="cpu").encode(
+        texts, normalize_embeddings=True, convert_to_numpy=True, show_progress_bar=False
+    )
+    ref_p = clf.predict_proba(ref)[:, 1]
+    report = read_parity(emb_dir)
+    onnx_dir = os.path.join(emb_dir, ONNX_SUBDIR)
+    np.savez(os.path.join(onnx_dir, PROBE_FILE), texts=np.array(texts[:PROBE_MAX_TEXTS]),
+             embeddings=ref[:PROBE_MAX_TEXTS].astype(np.float32))
+    for variant in variants:
+        emb = OnnxEmbedder(os.path.join(onnx_dir, VARIANTS[variant]), onnx_dir, _max_seq_length(emb_dir))
+        X = emb.encode(texts)
+        p = clf.predict_proba(X)[:, 1]
+        score_diff = float(np.max(np.abs(p - ref_p)))
+        report[variant] = {
+            "n_texts": len(texts),
+            "max_score_diff": round(score_diff, 6),
+            "min_cosine": round(float(np.min(np.sum(X * ref, axis=1))), 6),
+            "tolerance": tolerance,
+            "passed": score_diff <= tolerance,
+        }
+    with open(os.path.join(onnx_dir, PARITY_FILE), "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    return report
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    import joblib
+    from app.core.config import CLF_PATH, EMB_DIR, ONNX_PARITY_TOL
+
+    ap = argparse.ArgumentParser(prog="python -m app.ml.onnx_backend")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    exp = sub.add_parser("export", help="export to ONNX and run the parity check")
+    exp.add_argument("--emb-dir", default=EMB_DIR)
+    exp.add_argument("--quantize", action="store_true", help="also write a dynamic int8 variant")
+    exp.add_argument("--tolerance", type=float, default=ONNX_PARITY_TOL)
+    chk = sub.add_parser("parity", help="re-run the parity check on existing exports")
+    chk.add_argument("--emb-dir", default=EMB_DIR)
+    chk.add_argument("--tolerance", type=float, default=ONNX_PARITY_TOL)
+    chk.add_argument("--texts", help="optional file with one sample text per line")
+    args = ap.parse_args(argv)
+
+    if not os.path.isdir(args.emb_dir):
+        ap.error(f"embedder directory not found: {args.emb_dir}")
+    texts = None
+    if args.cmd == "export":
+        written = export_onnx(args.emb_dir, quantize=args.quantize)
+        variants = ["onnx"] + (["onnx-int8"] if args.quantize else [])
+        print("exported:", ", ".join(written))
+    else:
+        variants = [v for v, f in VARIANTS.items()
+                    if os.path.exists(os.path.join(args.emb_dir, ONNX_SUBDIR, f))]
+        if args.texts:
+            with open(args.texts, "r", encoding="utf-8") as f:
+                texts = [line.strip() for line in f if line.strip()]
+
+    report = parity_check(args.emb_dir, joblib.load(CLF_PATH), variants, args.tolerance, texts)
+    print(json.dumps({v: report[v] for v in variants}, indent=2))
+    return 0 if all(report[v]["passed"] for v in variants) else 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
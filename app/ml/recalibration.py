@@ -0,0 +1,141 @@
+# app/ml/recalibration.py
+"""Threshold curves from feedback telemetry, accumulated as score histograms.
+
+Feedback tells whether a classification's label was right:
+
+- `helpful = true`: the label was right;
+- `helpful = false` with `reason_code = WRONG_INTENT`: the label was wrong;
+- other unhelpful feedback (tone, missing info, ...) is about the reply, so
+  it counts toward the observed helpful rate only.
+
+From that, a label-judged row is truly Produtivo when (label == Produtivo)
+equals (label was right). `FeedbackCurves` bins `score_produtivo` per
+(model, template_code) and counts truly-Produtivo / truly-Improdutivo /
+helpful / all feedback per bin; one reverse cumulative sum then gives
+precision, recall, F1 and the projected helpful rate at every threshold.
+Memory depends on groups x bins, never on rows.
+"""
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+_POS, _NEG, _HELPFUL, _FEEDBACK = range(4)
+
+
+class FeedbackCurves:
+    def __init__(self, bins: int = 1000):
+        self.bins = bins
+        self.groups: Dict[Tuple[int, str], int] = {}  # (model_id, template_code) -> row in counts
+        self.counts = np.zeros((0, 4, bins), dtype=np.int64)
+        self.rows = 0
+
+    def _group_ids(self, model_id: np.ndarray, template_code: np.ndarray) -> np.ndarray:
+        models, mi = np.unique(model_id, return_inverse=True)
+        templates, ti = np.unique(template_code.astype(str), return_inverse=True)
+        pairs, inverse = np.unique(mi * len(templates) + ti, return_inverse=True)
+        ids = np.empty(len(pairs), dtype=np.int64)
+        for i, p in enumerate(pairs.tolist()):
+            key = (int(models[p // len(templates)]), str(templates[p % len(templates)]))
+            ids[i] = self.groups.setdefault(key, len(self.groups))
+        if len(self.groups) > len(self.counts):
+            grow = np.zeros((len(self.groups) - len(self.counts), 4, self.bins), dtype=np.int64)
+            self.counts = np.concatenate([self.counts, grow])
+        return ids[inverse]
+
+    def add(self, chunk: Dict[str, np.ndarray]) -> None:
+        """Fold in one chunk from `telemetry_repo.stream_feedback_scores`."""
+        n = len(chunk["score"])
+        if n == 0:
+            return
+        group = self._group_ids(chunk["model_id"], chunk["template_code"])
+        # scores are stored as REAL: nudge values like 0.65f (0.6499999...) into the bin they name
+        b = np.clip(np.floor(chunk["score"].astype(np.float64) * self.bins + 1e-4).astype(np.int64), 0, self.bins - 1)
+        flat = group * self.bins + b
+        right = chunk["helpful"]
+        judged = right | chunk["wrong_intent"]
+        truly_produtivo = chunk["produtivo"] == right
+        size = len(self.counts) * self.bins
+        for k, mask in ((_POS, judged & truly_produtivo), (_NEG, judged & ~truly_produtivo), (_HELPFUL, right)):
+            self.counts[:, k, :] += np.bincount(flat[mask], minlength=size).reshape(-1, self.bins)
+        self.counts[:, _FEEDBACK, :] += np.bincount(flat, minlength=size).reshape(-1, self.bins)
+        self.rows += n
+
+    def total(self, model_id: int, template_code: Optional[str] = None) -> np.ndarray:
+        """(4, bins) counts of one model, over all its templates or just one."""
+        idx = [g for (m, t), g in self.groups.items() if m == model_id and template_code in (None, t)]
+        return self.counts[idx].sum(axis=0)
+
+    def templates(self, model_id: int) -> List[str]:
+        return sorted(t for m, t in self.groups if m == model_id)
+
+    def models(self) -> List[int]:
+        return sorted({m for m, _ in self.groups})
+
+
+def curves(counts: np.ndarray) -> Dict[str, np.ndarray]:
+    """Metrics at thresholds 0, 1/bins, ..., 1 (predict Produtivo when score >= threshold).
+
+    `helpful_rate` is the share of label-judged feedback that would have been
+    helpful with that threshold (i.e. accuracy on the judged rows).
+    """
+    bins = counts.shape[1]
+    tp = np.concatenate([np.cumsum(counts[_POS][::-1])[::-1], [0]]).astype(np.float64)
+    fp = np.concatenate([np.cumsum(counts[_NEG][::-1])[::-1], [0]]).astype(np.float64)
+    pos, neg = tp[0], fp[0]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        precision = np.where(tp + fp > 0, tp / (tp + fp), np.nan)
+        recall = tp / pos if pos else np.full_like(tp, np.nan)
+        f1 = np.where(precision + recall > 0, 2 * precision * recall / (precision + recall), 0.0)
+        helpful_rate = (tp + neg - fp) / (pos + neg) if pos + neg else np.full_like(tp, np.nan)
+    return {"threshold": np.arange(bins + 1) / bins, "precision": precision, "recall": recall,
+            "f1": f1, "helpful_rate": helpful_rate}
+
+
+def at(c: Dict[str, np.ndarray], threshold: float) -> Dict[str, Optional[float]]:
+    """Curve values at the bin edge at or above `threshold`."""
+    i = min(int(np.ceil(threshold * (len(c["threshold"]) - 1) - 1e-9)), len(c["threshold"]) - 1)
+    return {k: (None if np.isnan(v[i]) else round(float(v[i]), 4)) for k, v in c.items() if k != "threshold"}
+
+
+def propose(counts: np.ndarray, objective: str = "f1", min_precision: Optional[float] = None,
+            min_judged: int = 200) -> Optional[float]:
+    """Threshold in (0, 1] to serve, or None with fewer than `min_judged` label-judged rows.
+
+    With `min_precision`, the lowest threshold reaching that precision (max
+    recall); otherwise the middle of the best plateau of `objective`
+    (`f1` or `helpful_rate`), since empty bins leave ties.
+    """
+    if counts[_POS].sum() + counts[_NEG].sum() < min_judged:
+        return None
+    c = curves(counts)
+    t = c["threshold"][1:]  # a threshold of 0 would label everything Produtivo
+    if min_precision is not None:
+        ok = np.flatnonzero(np.nan_to_num(c["precision"][1:]) >= min_precision)
+        return float(t[ok[0]]) if len(ok) else None
+    metric = np.nan_to_num(c[objective][1:], nan=-1.0)
+    best = np.flatnonzero(metric == metric.max())
+    return float(t[best[len(best) // 2]])
+
+
+def summarize(counts: np.ndarray, proposed: Optional[float], compare: Optional[Dict[str, Optional[float]]] = None,
+              curve_step: float = 0.0) -> Dict[str, Any]:
+    """Counts, the proposal and metrics at it and at each `compare` threshold (name -> value)."""
+    c = curves(counts)
+    feedback = int(counts[_FEEDBACK].sum())
+    out: Dict[str, Any] = {
+        "feedback": feedback,
+        "label_judged": int(counts[_POS].sum() + counts[_NEG].sum()),
+        "helpful_rate_observed": round(float(counts[_HELPFUL].sum()) / feedback, 4) if feedback else None,
+        "proposed_threshold": proposed,
+    }
+    if proposed is not None:
+        out["at_proposed"] = at(c, proposed)
+    for name, threshold in (compare or {}).items():
+        if threshold is not None:
+            out[f"{name}_threshold"] = threshold
+            out[f"at_{name}"] = at(c, threshold)
+    if curve_step > 0:
+        bins = counts.shape[1]
+        idx = np.unique(np.round(np.arange(0, 1 + 1e-9, curve_step) * bins).astype(int))
+        out["curves"] = {k: [None if np.isnan(x) else round(float(x), 4) for x in v[idx]] for k, v in c.items()}
+    return out
@@ -0,0 +1,183 @@
+import os
+import time
+import logging
+import threading
+from typing import Any, Callable, Dict, List, Optional
+
+import numpy as np
+
+from app.core.config import ARTS_DIR, MODEL_HISTORY_MAX, MODELS_ROOT
+from app.ml.model_loader import WARMUP_TEXTS, ModelBundle, load_bundle
+
+logger = logging.getLogger(__name__)
+
+
+class ModelNotReady(RuntimeError):
+    """Raised when inference is requested before any model has been loaded."""
+
+
+class ReloadInProgress(RuntimeError):
+    """Raised when a load is requested while another one is still running."""
+
+
+def resolve_model_dir(name: str, root: str = MODELS_ROOT) -> str:
+    """Path of the artifact directory `name` directly under `root`.
+
+    Raises ValueError for anything that resolves elsewhere (`..`, absolute
+    paths, symlinks out of `root`) or isn't a directory: loading unpickles
+    the classifier, so only operator-placed directories may be loaded.
+    """
+    root = os.path.realpath(root)
+    path = os.path.realpath(os.path.join(root, name))
+    if os.path.dirname(path) != root:
+        raise ValueError(f"model {name!r} is not a directory directly under MODELS_ROOT")
+    if not os.path.isdir(path):
+        raise ValueError(f"model {name!r} not found under MODELS_ROOT")
+    return path
+
+
+def validate_bundle(bundle: ModelBundle) -> None:
+    """Sanity-check a freshly loaded bundle before it may serve traffic."""
+    if not 0 < bundle.threshold <= 1:
+        raise ValueError(f"threshold {bundle.threshold} outside (0, 1]")
+    X = bundle.emb.encode(WARMUP_TEXTS, normalize_embeddings=True, convert_to_numpy=True,
+                          show_progress_bar=False)
+    n_features = getattr(bundle.clf, "n_features_in_", None)
+    if n_features is not None and X.shape[1] != n_features:
+        raise ValueError(f"embedder dim {X.shape[1]} != classifier n_features_in_ {n_features}")
+    p = bundle.clf.predict_proba(X)
+    if p.shape != (len(WARMUP_TEXTS), 2) or not np.all(np.isfinite(p)) or p.min() < 0 or p.max() > 1:
+        raise ValueError("classifier returned invalid probabilities on probe texts")
+    head_p = bundle.head.scores(X)
+    if head_p.shape != (len(WARMUP_TEXTS),) or not np.all(np.isfinite(head_p)) or head_p.min() < 0 or head_p.max() > 1:
+        raise ValueError(f"{bundle.head.kind} classifier head returned invalid probabilities on probe texts")
+
+
+class ModelRegistry:
+    """Holds the serving ModelBundle and swaps in new ones atomically.
+
+    Requests pin `current()` once and keep that reference until they finish,
+    so a swap never changes the model under an in-flight request; the old
+    bundle is freed when the last of them drops it.
+    """
+
+    def __init__(self, history_max: int = MODEL_HISTORY_MAX):
+        self._current: Optional[ModelBundle] = None
+        self._generation = 0
+        self._load_lock = threading.Lock()
+        self._prepare_hooks: List[Callable[[ModelBundle, int], None]] = []
+        self.history: List[Dict[str, Any]] = []
+        self.history_max = history_max
+        # last load attempt, reported on /healthz, /readyz and /admin/models
+        self.state: Dict[str, Any] = {
+            "phase": "idle", "error": None, "started_at": None, "load_ms": None, "model_dir": None,
+        }
+
+    # ---- serving ----
+    def current(self) -> ModelBundle:
+        bundle = self._current
+        if bundle is None:
+            raise ModelNotReady(f"model {self.state['phase']}")
+        return bundle
+
+    def is_ready(self) -> bool:
+        return self._current is not None
+
+    @property
+    def generation(self) -> int:
+        return self._generation
+
+    # ---- loading ----
+    def add_prepare_hook(self, hook: Callable[[ModelBundle, int], None]) -> None:
+        """Run `hook(bundle, generation)` after validation and before the swap; raising fails the load."""
+        self._prepare_hooks.append(hook)
+
+    def load(self, arts_dir: str = ARTS_DIR) -> ModelBundle:
+        """Load, validate and warm `arts_dir`, then swap it in. Blocking; one load at a time."""
+        if not self._load_lock.acquire(blocking=False):
+            raise ReloadInProgress("a model load is already running")
+        try:
+            self.state.update(phase="loading", error=None, started_at=time.time(), load_ms=None, model_dir=arts_dir)
+            t0 = time.perf_counter()
+            try:
+                bundle = load_bundle(arts_dir)
+                validate_bundle(bundle)
+                for hook in self._prepare_hooks:
+                    hook(bundle, self._generation + 1)
+            except Exception as e:
+                self.state.update(phase="failed", error=f"{type(e).__name__}: {e}")
+                raise
+            self._swap(bundle)
+            self.state.update(phase="ready", load_ms=round((time.perf_counter() - t0) * 1000, 1))
+            return bundle
+        finally:
+            self._load_lock.release()
+
+    def load_once(self, arts_dir: str = ARTS_DIR) -> ModelBundle:
+        """Load only if nothing is serving yet (CLI workers, scripts)."""
+        if self._current is not None:
+            return self._current
+        return self.load(arts_dir)
+
+    def reload_in_background(self, arts_dir: Optional[str] = None) -> threading.Thread:
+        """Start a load in a daemon thread; the current bundle keeps serving until the swap."""
+        if self._load_lock.locked():
+            raise ReloadInProgress("a model load is already running")
+        target = arts_dir or (self._current.arts_dir if self._current else ARTS_DIR)
+
+        def _run():
+            try:
+                self.load(target)
+            except ReloadInProgress:
+                pass
+            except Exception:
+                logger.exception("Model load from %s failed; keeping the current model", target)
+
+        thread = threading.Thread(target=_run, name="model-loader", daemon=True)
+        thread.start()
+        return thread
+
+    def _swap(self, bundle: ModelBundle) -> None:
+        previous = self._current
+        self._generation += 1
+        bundle.generation = self._generation
+        # single reference assignment: readers see either the old or the new bundle
+        self._current = bundle
+        self.history.append({
+            "generation": self._generation,
+            "model_version": bundle.version,
+            "model_dir": bundle.arts_dir,
+            "threshold": bundle.threshold,
+            "embedding_backend": bundle.emb_backend,
+            "loaded_at": time.time(),
+            "replaced": previous.version if previous else None,
+        })
+        del self.history[:-self.history_max]
+        logger.info("Serving model %s (generation %d) from %s", bundle.version, self._generation, bundle.arts_dir)
+
+    def describe(self) -> Dict[str, Any]:
+        bundle = self._current
+        return {
+            "current": None if bundle is None else {
+                "generation": bundle.generation,
+                "model_version": bundle.version,
+                "model_dir": bundle.arts_dir,
+                "embedding_model": bundle.emb_id,
+                "embedding_backend": bundle.emb_backend,
+                "threshold": bundle.threshold,
+                "timings_ms": bundle.timings_ms,
+            },
+            "load": dict(self.state),
+            "history": list(self.history),
+        }
+
+
+REGISTRY = ModelRegistry()
+
+
+def get_bundle() -> ModelBundle:
+    return REGISTRY.current()
+
+
+def is_ready() -> bool:
+    return REGISTRY.is_ready()
@@ -0,0 +1,305 @@
+import os
+import time
+import asyncio
+import logging
+import threading
+import multiprocessing as mp
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from app.core.config import INFER_WORKERS, INFER_THREADS, INFER_QUEUE_MAX, INFER_START_METHOD
+from app.core.deadline import DEADLINES, DeadlineExceeded, check
+from app.core.metrics import BATCH_SIZE, EVENTS, LAST_BATCH_SIZE, QUEUE_DEPTH, observe_stage
+from app.ml.inference import encode_texts, predict_scores
+from app.ml.model_loader import ModelBundle, load_bundle
+from app.ml.registry import REGISTRY
+
+logger = logging.getLogger(__name__)
+
+Result = Tuple[np.ndarray, np.ndarray, Dict[str, float]]  # (embeddings, score_produtivo, stage seconds)
+
+
+class Overloaded(RuntimeError):
+    """Raised when more requests are waiting for inference than INFER_QUEUE_MAX allows."""
+
+
+_WORKER_BUNDLE: Optional[ModelBundle] = None  # the model a pool worker process serves
+
+
+def _init_worker(arts_dir: str, generation: int) -> None:
+    # Workers start from a clean interpreter (forkserver/spawn), never from a
+    # fork of the multi-threaded API process, so they load the bundle themselves.
+    global _WORKER_BUNDLE
+    bundle = load_bundle(arts_dir)
+    bundle.generation = generation
+    _WORKER_BUNDLE = bundle
+
+
+def _ping() -> int:
+    return os.getpid()
+
+
+def _run_in_worker(texts: List[str], generation: int, deadline=None):
+    bundle = _WORKER_BUNDLE
+    if bundle is None or bundle.generation != generation:
+        raise RuntimeError(f"worker serves generation {bundle and bundle.generation}, asked for {generation}")
+    return (*_encode_predict(texts, bundle, deadline), f"pid-{os.getpid()}")
+
+
+def _run_local(texts: List[str], bundle: ModelBundle, deadline=None):
+    return (*_encode_predict(texts, bundle, deadline), threading.current_thread().name)
+
+
+def _encode_predict(texts: List[str], bundle: ModelBundle, deadline=None):
+    check(deadline, "queued")
+    t0 = time.perf_counter()
+    X = encode_texts(texts, bundle, deadline)
+    t1 = time.perf_counter()
+    p = predict_scores(X, bundle)
+    return X, p, {"encode": t1 - t0, "predict": time.perf_counter() - t1}
+
+
+class InferencePool:
+    """Runs encode + predict_proba off the event loop.
+
+    With `workers > 0`, each model generation gets a process pool started with
+    `start_method` (forkserver or spawn: forking the API process, with its
+    live threads and locks, can deadlock a child). Every worker loads the
+    bundle from its `arts_dir` in the pool initializer, so each holds its own
+    model copy. The forkserver does not preload it to share pages: an
+    onnxruntime session's thread pool doesn't survive a fork, and the
+    forkserver outlives hot reloads, so it would pin the first model. `prepare()`, run by the
+    registry before a swap, starts the pool and waits until each worker has
+    loaded, so the new generation is warm when it goes live; the previous
+    pool is retired once the new generation gets traffic, after its queued
+    work is done. With `workers == 0`, a thread pool of `threads` runs
+    inference in-process (one model copy, GIL released inside
+    torch/onnxruntime).
+
+    A worker that dies (OOM kill, segfault) breaks its whole process pool:
+    its running tasks fail with `BrokenProcessPool`, the pool is replaced
+    with a fresh one for the same generation, and a submit that found it
+    broken is retried once on the new pool. If that fails too, the caller
+    gets the error and `broken` stays set, which turns /readyz to 503 until
+    a task succeeds again.
+
+    `admit()` bounds the number of requests waiting on inference; beyond
+    `queue_max` callers get `Overloaded` so the API can shed load with 429.
+    A task carrying a `Deadline` is skipped if it is already dead when a
+    worker picks it up and stops between encode sub-batches once it dies;
+    cancelling the returned future drops the task if it has not started.
+    """
+
+    def __init__(self, workers: int = INFER_WORKERS, threads: int = INFER_THREADS, queue_max: int = INFER_QUEUE_MAX,
+                 start_method: str = INFER_START_METHOD):
+        self.workers = max(0, workers)
+        self.start_method = start_method if start_method in ("forkserver", "spawn") else "forkserver"
+        self.threads = max(1, threads)
+        self.queue_max = max(1, queue_max)
+        self._threads: Optional[ThreadPoolExecutor] = None
+        self._pools: Dict[int, ProcessPoolExecutor] = {}
+        self._lock = threading.Lock()
+        self._started = time.monotonic()
+        self._busy: Dict[str, List[float]] = {}  # worker -> [tasks, busy_s, items]
+        self.pending = 0
+        self.shed = 0
+        self.restarts = 0  # process pools replaced after a worker died
+        self.broken: Optional[str] = None  # last pool failure, until a process task succeeds
+
+    @property
+    def slots(self) -> int:
+        """Inference tasks that can run at once (worker processes, else threads)."""
+        return self.workers or self.threads
+
+    # ---- admission ----
+    @contextmanager
+    def admit(self):
+        with self._lock:
+            if self.pending >= self.queue_max:
+                self.shed += 1
+                raise Overloaded(f"{self.pending} requests already waiting for inference")
+            self.pending += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self.pending -= 1
+
+    # ---- dispatch ----
+    def _thread_pool(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._threads is None:
+                self._threads = ThreadPoolExecutor(max_workers=self.threads, thread_name_prefix="infer")
+            return self._threads
+
+    def _new_pool(self, arts_dir: str, generation: int) -> ProcessPoolExecutor:
+        ctx = mp.get_context(self.start_method)
+        if self.start_method == "forkserver":
+            ctx.set_forkserver_preload(["app.ml.worker_pool"])
+        pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=ctx,
+                                   initializer=_init_worker, initargs=(arts_dir, generation))
+        logger.info("Starting %d inference workers (%s) for model generation %d",
+                    self.workers, self.start_method, generation)
+        return pool
+
+    def prepare(self, bundle: ModelBundle, generation: int) -> None:
+        """Registry prepare hook: start and warm the pool `generation` will use."""
+        if not self.workers:
+            return
+        pool = self._new_pool(bundle.arts_dir, generation)
+        try:
+            # each submit finding no idle worker starts one, so this brings up the whole pool
+            for f in [pool.submit(_ping) for _ in range(self.workers)]:
+                f.result()
+        except BaseException:
+            pool.shutdown(wait=False, cancel_futures=True)
+            raise
+        with self._lock:
+            self._pools[generation] = pool
+
+    def _retire_others(self, generation: int) -> None:
+        # caller holds self._lock
+        retired = [gen for gen in self._pools if gen != generation]
+        for gen in retired:
+            self._pools.pop(gen).shutdown(wait=False)  # queued tasks still finish on the old generation
+        if retired:
+            # utilization is reported for the live pool only
+            self._busy = {w: v for w, v in self._busy.items() if not w.startswith("pid-")}
+            self._started = time.monotonic()
+
+    def _replace_pool(self, bundle: ModelBundle, broken: ProcessPoolExecutor) -> Optional[ProcessPoolExecutor]:
+        """Swap a broken pool for a fresh one of the same generation (once, however many callers saw it).
+
+        Returns the generation's current pool, or None if it was retired meanwhile.
+        """
+        with self._lock:
+            pool = self._pools.get(bundle.generation)
+            if pool is broken:
+                logger.warning("Inference pool for model generation %d is broken; starting a new one",
+                               bundle.generation)
+                pool = self._pools[bundle.generation] = self._new_pool(bundle.arts_dir, bundle.generation)
+                self.restarts += 1
+                # the dead pool's workers are gone from the utilization report
+                self._busy = {w: v for w, v in self._busy.items() if not w.startswith("pid-")}
+        broken.shutdown(wait=False, cancel_futures=True)
+        return pool
+
+    def _submit_process(self, pool: ProcessPoolExecutor, texts: List[str], bundle: ModelBundle,
+                        deadline) -> Tuple[Future, Optional[ProcessPoolExecutor]]:
+        """(task future, pool running it); retried once on a fresh pool if `pool` is broken."""
+        try:
+            return pool.submit(_run_in_worker, texts, bundle.generation, deadline), pool
+        except BrokenProcessPool:
+            pool = self._replace_pool(bundle, pool)
+        if pool is None:
+            # the generation was retired while its pool broke: finish this stale request in-process
+            return self._thread_pool().submit(_run_local, texts, bundle, deadline), None
+        try:
+            return pool.submit(_run_in_worker, texts, bundle.generation, deadline), pool
+        except BrokenProcessPool as e:
+            self.broken = str(e) or type(e).__name__
+            raise
+
+    def _process_pool(self, bundle: ModelBundle) -> Optional[ProcessPoolExecutor]:
+        with self._lock:
+            live = REGISTRY.is_ready() and REGISTRY.current() is bundle
+            pool = self._pools.get(bundle.generation)
+            if pool is None:
+                if not live:
+                    # stale bundle whose pool was already retired: run in-process
+                    return None
+                # no prepare hook ran for this generation (e.g. scripts): start the pool now
+                pool = self._pools[bundle.generation] = self._new_pool(bundle.arts_dir, bundle.generation)
+            if live:
+                self._retire_others(bundle.generation)
+            return pool
+
+    def submit(self, texts: List[str], bundle: ModelBundle, deadline=None) -> "Future[Result]":
+        pool = self._process_pool(bundle) if self.workers else None
+        n = len(texts)
+        BATCH_SIZE.observe(n)
+        LAST_BATCH_SIZE.set(n)
+        submitted = time.perf_counter()
+        if pool is not None:
+            inner, pool = self._submit_process(pool, list(texts), bundle, deadline)
+        else:
+            inner = self._thread_pool().submit(_run_local, list(texts), bundle, deadline)
+        outer: Future = Future()
+        outer.add_done_callback(lambda f: inner.cancel() if f.cancelled() else None)
+
+        def _done(f: Future) -> None:
+            if f.cancelled():
+                if outer.cancelled():
+                    DEADLINES.note_dropped("queued", n)
+                else:
+                    outer.cancel()  # pool shut down with the task still queued
+                return
+            e = f.exception()
+            if isinstance(e, DeadlineExceeded):
+                DEADLINES.note_dropped("queued" if e.stage == "queued" else "encode", n)
+            elif isinstance(e, BrokenProcessPool) and pool is not None:
+                # a worker died under this task; replace the pool now rather than on the next submit
+                self.broken = str(e) or type(e).__name__
+                self._replace_pool(bundle, pool)
+            elif e is None and pool is not None:
+                self.broken = None
+            if outer.cancelled():
+                return
+            if e is not None:
+                outer.set_exception(e)
+                return
+            X, p, timings, worker = f.result()
+            busy = timings["encode"] + timings["predict"]
+            # time spent queued for a worker, plus IPC in process mode
+            timings["inference_wait"] = max(0.0, time.perf_counter() - submitted - busy)
+            for name, seconds in timings.items():
+                observe_stage(name, seconds)
+            with self._lock:
+                acc = self._busy.setdefault(worker, [0, 0.0, 0])
+                acc[0] += 1
+                acc[1] += busy
+                acc[2] += n
+            outer.set_result((X, p, timings))
+
+        inner.add_done_callback(_done)
+        return outer
+
+    async def run(self, texts: List[str], bundle: ModelBundle, deadline=None) -> Result:
+        return await asyncio.wrap_future(self.submit(texts, bundle, deadline))
+
+    def shutdown(self) -> None:
+        with self._lock:
+            for pool in self._pools.values():
+                pool.shutdown(wait=False, cancel_futures=True)
+            self._pools.clear()
+            threads, self._threads = self._threads, None
+        if threads is not None:
+            threads.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self) -> dict:
+        wall = max(time.monotonic() - self._started, 1e-9)
+        with self._lock:
+            per_worker = {
+                w: {"tasks": int(t), "items": int(n), "busy_s": round(b, 3), "utilization": round(b / wall, 4)}
+                for w, (t, b, n) in self._busy.items()
+            }
+            return {
+                "mode": "processes" if self.workers else "threads",
+                "workers": self.slots,
+                "pending_requests": self.pending,
+                "queue_max": self.queue_max,
+                "shed": self.shed,
+                "restarts": self.restarts,
+                "broken": self.broken,
+                "per_worker": per_worker,
+            }
+
+
+INFERENCE = InferencePool()
+QUEUE_DEPTH.add(lambda: INFERENCE.pending, "inference_pending")
+EVENTS.add(lambda: INFERENCE.shed, "inference", "shed")
+EVENTS.add(lambda: INFERENCE.restarts, "inference", "pool_restarts")
@@ -0,0 +1,88 @@
+from datetime import datetime, timedelta, timezone
+from typing import TYPE_CHECKING, Any, Dict, List, Sequence, Tuple
+
+from sqlalchemy import delete, select
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session
+
+from app.db.models import IdempotencyRecord
+from app.repositories.telemetry_repo import dialect_insert
+
+if TYPE_CHECKING:
+    from sqlalchemy.ext.asyncio import AsyncSession
+
+
+def _select_records(keys: Sequence[str], ttl_s: float):
+    stmt = select(IdempotencyRecord.key, IdempotencyRecord.request_hash, IdempotencyRecord.response).where(
+        IdempotencyRecord.key.in_(list(keys)))
+    if ttl_s > 0:
+        stmt = stmt.where(IdempotencyRecord.created_at >= datetime.now(timezone.utc) - timedelta(seconds=ttl_s))
+    return stmt
+
+
+def get_idempotency_records(db: Session, keys: Sequence[str], ttl_s: float) -> Dict[str, Tuple[str, Dict[str, Any]]]:
+    """key -> (request_hash, response) for stored keys younger than `ttl_s` (0 = no expiry)."""
+    if not keys:
+        return {}
+    return {k: (h, r) for k, h, r in db.execute(_select_records(keys, ttl_s))}
+
+
+async def get_idempotency_records_async(db: "AsyncSession", keys: Sequence[str],
+                                        ttl_s: float) -> Dict[str, Tuple[str, Dict[str, Any]]]:
+    if not keys:
+        return {}
+    return {k: (h, r) for k, h, r in await db.execute(_select_records(keys, ttl_s))}
+
+
+def insert_idempotency_records(db: Session, rows: List[Dict[str, Any]]) -> None:
+    """Insert {key, request_hash, response} rows; keys that already exist keep their first response."""
+    if not rows:
+        return
+    upsert = dialect_insert(db)
+    try:
+        db.execute(upsert(IdempotencyRecord).on_conflict_do_nothing(index_elements=["key"]), rows)
+        db.commit()
+    except SQLAlchemyError:
+        db.rollback()
+        raise
+
+
+async def insert_idempotency_records_async(db: "AsyncSession", rows: List[Dict[str, Any]]) -> None:
+    if not rows:
+        return
+    upsert = dialect_insert(db)
+    try:
+        await db.execute(upsert(IdempotencyRecord).on_conflict_do_nothing(index_elements=["key"]), rows)
+        await db.commit()
+    except SQLAlchemyError:
+        await db.rollback()
+        raise
+
+
+def _delete_expired(ttl_s: float):
+    cutoff = datetime.now(timezone.utc) - timedelta(seconds=ttl_s)
+    return delete(IdempotencyRecord).where(IdempotencyRecord.created_at < cutoff)
+
+
+def purge_idempotency_records(db: Session, ttl_s: float) -> int:
+    if ttl_s <= 0:
+        return 0
+    try:
+        n = db.execute(_delete_expired(ttl_s)).rowcount
+        db.commit()
+    except SQLAlchemyError:
+        db.rollback()
+        raise
+    return n or 0
+
+
+async def purge_idempotency_records_async(db: "AsyncSession", ttl_s: float) -> int:
+    if ttl_s <= 0:
+        return 0
+    try:
+        n = (await db.execute(_delete_expired(ttl_s))).rowcount
+        await db.commit()
+    except SQLAlchemyError:
+        await db.rollback()
+        raise
+    return n or 0
@@ -0,0 +1,115 @@
+import re
+from datetime import datetime, timezone
+from typing import List
+
+from sqlalchemy import text
+
+# Postgres only: partitions are created by 0003_partition_telemetry and kept up
+# by app/cli/telemetry_maintenance.py. `conn` is a Connection or Session; the
+# caller owns the transaction.
+
+_PARTITION_NAME = re.compile(r"^classification_(\d{4})_(\d{2})$")
+
+
+def month_start(ts: datetime) -> datetime:
+    ts = ts.astimezone(timezone.utc)
+    return datetime(ts.year, ts.month, 1, tzinfo=timezone.utc)
+
+
+def add_months(month: datetime, n: int) -> datetime:
+    y, m = divmod(month.year * 12 + month.month - 1 + n, 12)
+    return datetime(y, m + 1, 1, tzinfo=timezone.utc)
+
+
+def partition_name(month: datetime) -> str:
+    return f"classification_{month:%Y_%m}"
+
+
+def existing_partitions(conn) -> List[str]:
+    return list(conn.execute(text(
+        "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+        "WHERE i.inhparent = 'classification'::regclass"
+    )).scalars())
+
+
+def ensure_partitions(conn, first: datetime, months: int) -> List[str]:
+    """Create the monthly partitions from `first`'s month on, `months` of them.
+
+    Rows already in `classification_default` for a new month are moved into it
+    before it is attached, since Postgres refuses to attach over them.
+    """
+    have = set(existing_partitions(conn))
+    created = []
+    for i in range(months):
+        lo = add_months(month_start(first), i)
+        name = partition_name(lo)
+        if name in have:
+            continue
+        hi = add_months(lo, 1)
+        conn.execute(text(f"CREATE TABLE {name} (LIKE classification INCLUDING DEFAULTS INCLUDING CONSTRAINTS)"))
+        conn.execute(text(
+            f"WITH moved AS (DELETE FROM classification_default WHERE ts_utc >= :lo AND ts_utc < :hi RETURNING *) "
+            f"INSERT INTO {name} SELECT * FROM moved"
+        ), {"lo": lo, "hi": hi})
+        conn.execute(text(
+            f"ALTER TABLE classification ATTACH PARTITION {name} "
+            f"FOR VALUES FROM ('{lo.isoformat()}') TO ('{hi.isoformat()}')"
+        ))
+        created.append(name)
+    return created
+
+
+def drop_expired(conn, cutoff: datetime) -> List[str]:
+    """Drop monthly partitions that end at or before `cutoff` and older default-partition rows.
+
+    Feedback goes with its classification (feedback can arrive long after it,
+    so its own ts_utc says nothing about retention). Hourly rollups are kept.
+    """
+    dropped = []
+    for name in existing_partitions(conn):
+        m = _PARTITION_NAME.match(name)
+        if m and add_months(datetime(int(m[1]), int(m[2]), 1, tzinfo=timezone.utc), 1) <= cutoff:
+            conn.execute(text(f"DROP TABLE {name}"))
+            dropped.append(name)
+    conn.execute(text("DELETE FROM classification_default WHERE ts_utc < :cutoff"), {"cutoff": cutoff})
+    conn.execute(text(
+        "DELETE FROM feedback f WHERE NOT EXISTS "
+        "(SELECT 1 FROM classification c WHERE c.classification_id = f.classification_id)"
+    ))
+    return dropped
+
+
+_ROLLUP = text("""
+WITH c AS (
+  SELECT date_trunc('hour', c.ts_utc) AS bucket, c.model_id, c.label, c.template_code,
+         c.score_produtivo, c.latency_ms, f.helpful
+  FROM classification c
+  LEFT JOIN feedback f ON f.classification_id = c.classification_id
+  WHERE c.ts_utc >= :since AND c.ts_utc < :until
+), t AS (
+  SELECT bucket, model_id, jsonb_object_agg(template_code, n) AS template_counts
+  FROM (SELECT bucket, model_id, template_code, count(*) AS n FROM c GROUP BY 1, 2, 3) x
+  GROUP BY 1, 2
+)
+INSERT INTO classification_hourly (
+  bucket, model_id, n, n_produtivo, score_mean, latency_p50_ms, latency_p95_ms, latency_p99_ms,
+  template_counts, feedback_n, helpful_n, updated_at
+)
+SELECT c.bucket, c.model_id, count(*), count(*) FILTER (WHERE c.label = 'Produtivo'), avg(c.score_produtivo),
+       percentile_cont(0.50) WITHIN GROUP (ORDER BY c.latency_ms),
+       percentile_cont(0.95) WITHIN GROUP (ORDER BY c.latency_ms),
+       percentile_cont(0.99) WITHIN GROUP (ORDER BY c.latency_ms),
+       t.template_counts, count(c.helpful), count(*) FILTER (WHERE c.helpful), NOW()
+FROM c JOIN t USING (bucket, model_id)
+GROUP BY c.bucket, c.model_id, t.template_counts
+ON CONFLICT (bucket, model_id) DO UPDATE SET
+  n = EXCLUDED.n, n_produtivo = EXCLUDED.n_produtivo, score_mean = EXCLUDED.score_mean,
+  latency_p50_ms = EXCLUDED.latency_p50_ms, latency_p95_ms = EXCLUDED.latency_p95_ms,
+  latency_p99_ms = EXCLUDED.latency_p99_ms, template_counts = EXCLUDED.template_counts,
+  feedback_n = EXCLUDED.feedback_n, helpful_n = EXCLUDED.helpful_n, updated_at = EXCLUDED.updated_at
+""")
+
+
+def rollup_hourly(conn, since: datetime, until: datetime) -> int:
+    """(Re)compute `classification_hourly` for the whole hours in [since, until). Returns rows upserted."""
+    return conn.execute(_ROLLUP, {"since": since, "until": until}).rowcount or 0
@@ -1,17 +1,64 @@
 import uuid
-from typing import Optional
-from decimal import Decimal
+from datetime import datetime, timezone
+from typing import TYPE_CHECKING, Any, Dict, Iterable, Iterator, List, Optional, Set, Tuple
 
-from sqlalchemy import select
+import numpy as np
+from sqlalchemy import column, insert, select, true, tuple_, values
 from sqlalchemy.exc import SQLAlchemyError
 from sqlalchemy.orm import Session
 
-from app.db.models import Classification, Feedback
+if TYPE_CHECKING:
+    from sqlalchemy.ext.asyncio import AsyncSession
 
+from app.db.models import Classification, Feedback, ModelVersion
 
-def insert_classification_row(
-    db: Session,
-    classification_id: uuid.UUID,   # <-- UUID, not str
+
+def dialect_insert(db):
+    """`insert` with ON CONFLICT support for the (sync or async) session's backend (Postgres, or sqlite for local runs)."""
+    dialect = db.get_bind().dialect.name
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as upsert
+    elif dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert as upsert
+    else:
+        # app.db.session.check_backend refuses these at startup
+        raise RuntimeError(f"upserts not supported on {dialect}")
+    return upsert
+
+
+# (model_version, embedding_model) -> model_id, filled after commit; ids never change once assigned
+_MODEL_IDS: Dict[Tuple[str, str], int] = {}
+
+
+def model_ids(db: Session, pairs: Iterable[Tuple[str, str]]) -> Dict[Tuple[str, str], int]:
+    """`model_version` ids for these pairs, inserting unknown ones. Does not commit."""
+    pairs = set(pairs)
+    ids = {p: _MODEL_IDS[p] for p in pairs if p in _MODEL_IDS}
+    missing = pairs - ids.keys()
+    if missing:
+        upsert = dialect_insert(db)
+        db.execute(
+            upsert(ModelVersion).on_conflict_do_nothing(index_elements=["model_version", "embedding_model"]),
+            [{"model_version": v, "embedding_model": e} for v, e in missing],
+        )
+        found = db.execute(
+            select(ModelVersion.model_version, ModelVersion.embedding_model, ModelVersion.model_id)
+            .where(tuple_(ModelVersion.model_version, ModelVersion.embedding_model).in_(list(missing)))
+        )
+        ids.update({(v, e): mid for v, e, mid in found})
+    return ids
+
+
+def insert_classification_row(db: Session, **fields: Any) -> None:
+    """Insert a classification snapshot. Swallow errors so requests don't fail due to telemetry."""
+    try:
+        insert_classification_rows(db, [build_classification_row(**fields)])
+    except SQLAlchemyError:
+        pass  # telemetry errors are intentionally swallowed
+
+
+def build_classification_row(
+    classification_id: uuid.UUID,
     model_version: str,
     embedding_model: str,
     threshold_used: float,
@@ -21,58 +68,154 @@ def insert_classification_row(
     text_length_chars: int,
     latency_ms: int,
     language: str,
-) -> None:
-    """Insert a classification snapshot. Swallow errors so requests don't fail due to telemetry."""
+    ts_utc: Optional[datetime] = None,
+) -> Dict[str, Any]:
+    """Column dict for `insert_classification_rows`.
+
+    `ts_utc` defaults to now, i.e. when the request was served rather than when
+    the background writer flushes it, so rows land in the right partition/hour.
+    """
+    return {
+        "classification_id": classification_id,
+        "ts_utc": ts_utc or datetime.now(timezone.utc),
+        "model_version": model_version,
+        "embedding_model": embedding_model,
+        "threshold_used": float(threshold_used),
+        "label": label,
+        "score_produtivo": round(float(score_produtivo), 4),
+        "template_code": template_code,
+        "text_length_chars": text_length_chars,
+        "latency_ms": latency_ms,
+        "language": language,
+    }
+
+
+def insert_classification_rows(db: Session, rows: List[Dict[str, Any]]) -> int:
+    """Multi-row INSERT of classification snapshots in one statement/commit. Raise on DB errors."""
+    if not rows:
+        return 0
     try:
-        row = Classification(
-            classification_id=classification_id,  # <-- pass UUID object
-            model_version=model_version,
-            embedding_model=embedding_model,
-            threshold_used=Decimal(str(threshold_used)),
-            label=label,
-            score_produtivo=Decimal(str(round(score_produtivo, 4))),
-            template_code=template_code,
-            text_length_chars=text_length_chars,
-            latency_ms=latency_ms,
-            language=language,
-        )
-        db.add(row)
+        ids = model_ids(db, {(r["model_version"], r["embedding_model"]) for r in rows})
+        db.execute(insert(Classification), [
+            {**{k: v for k, v in r.items() if k not in ("model_version", "embedding_model")},
+             "model_id": ids[(r["model_version"], r["embedding_model"])]}
+            for r in rows
+        ])
         db.commit()
     except SQLAlchemyError:
         db.rollback()
-        # telemetry errors are intentionally swallowed
+        raise
+    _MODEL_IDS.update(ids)
+    return len(rows)
+
+
+def existing_classification_ids(db: Session, ids: List[uuid.UUID]) -> Set[uuid.UUID]:
+    """The subset of `ids` already in the classification table."""
+    if not ids:
+        return set()
+    return set(db.scalars(select(Classification.classification_id)
+                          .where(Classification.classification_id.in_(ids))))
 
 
-def classification_exists(db: Session, classification_id: uuid.UUID) -> bool:
-    """Primary-key lookup; fastest way to check existence."""
-    return db.get(Classification, classification_id) is not None
+def _feedback_upsert(upsert, rows: List[Dict[str, Any]]):
+    latest = {r["classification_id"]: r for r in rows}  # ON CONFLICT can't touch a row twice
+    v = values(
+        column("feedback_id", Feedback.feedback_id.type),
+        column("classification_id", Feedback.classification_id.type),
+        column("helpful", Feedback.helpful.type),
+        column("reason_code", Feedback.reason_code.type),
+    ).data([(uuid.uuid4(), cid, r["helpful"], r.get("reason_code")) for cid, r in latest.items()]).cte("v")
+    src = (
+        select(v.c.feedback_id, v.c.classification_id, v.c.helpful, v.c.reason_code)
+        .join(Classification, Classification.classification_id == v.c.classification_id)
+        .where(true())  # sqlite needs a WHERE to parse INSERT ... SELECT ... ON CONFLICT
+    )
+    stmt = upsert(Feedback).from_select(["feedback_id", "classification_id", "helpful", "reason_code"], src)
+    return stmt.on_conflict_do_update(
+        index_elements=[Feedback.classification_id],
+        set_={"helpful": stmt.excluded.helpful, "reason_code": stmt.excluded.reason_code},
+    ).returning(Feedback.classification_id)
 
 
-def upsert_feedback_row(
-    db: Session,
-    feedback_id: uuid.UUID,          # <-- UUID, not str
-    classification_id: uuid.UUID,    # <-- UUID, not str
-    helpful: bool,
-    reason_code: Optional[str],
-) -> None:
-    """Insert or update feedback keyed by classification_id (unique). Raise on DB errors."""
+def upsert_feedback_rows(db: Session, rows: List[Dict[str, Any]]) -> Set[uuid.UUID]:
+    """Insert or update feedback for many classifications in one statement/commit.
+
+    `rows` are {classification_id, helpful, reason_code}; for a repeated
+    classification_id the last row wins. Rows are joined against
+    `classification` inside the INSERT, so unknown ids are skipped.
+    Returns the classification_ids written. Raise on DB errors.
+    """
+    if not rows:
+        return set()
     try:
-        existing = db.execute(
-            select(Feedback).where(Feedback.classification_id == classification_id)
-        ).scalar_one_or_none()
-        if existing:
-            existing.helpful = helpful
-            existing.reason_code = reason_code
-        else:
-            db.add(
-                Feedback(
-                    feedback_id=feedback_id,             # UUID object
-                    classification_id=classification_id, # UUID object
-                    helpful=helpful,
-                    reason_code=reason_code,
-                )
-            )
+        written = set(db.execute(_feedback_upsert(dialect_insert(db), rows)).scalars())
         db.commit()
     except SQLAlchemyError:
         db.rollback()
         raise
+    return written
+
+
+async def upsert_feedback_rows_async(db: "AsyncSession", rows: List[Dict[str, Any]]) -> Set[uuid.UUID]:
+    """`upsert_feedback_rows` on an AsyncSession."""
+    if not rows:
+        return set()
+    try:
+        written = set((await db.execute(_feedback_upsert(dialect_insert(db), rows))).scalars())
+        await db.commit()
+    except SQLAlchemyError:
+        await db.rollback()
+        raise
+    return written
+
+
+def _details_query(ids: List[uuid.UUID]):
+    return (
+        select(Classification.classification_id, Classification.ts_utc, Classification.label,
+               Classification.score_produtivo, Classification.template_code, ModelVersion.model_version,
+               Feedback.helpful, Feedback.reason_code)
+        .join(ModelVersion, ModelVersion.model_id == Classification.model_id)
+        .outerjoin(Feedback, Feedback.classification_id == Classification.classification_id)
+        .where(Classification.classification_id.in_(ids))
+    )
+
+
+def get_classification_details(db: Session, ids: List[uuid.UUID]) -> Dict[uuid.UUID, Dict[str, Any]]:
+    """classification_id -> stored label/score/template/model_version plus feedback (None if none given)."""
+    if not ids:
+        return {}
+    return {row["classification_id"]: dict(row) for row in db.execute(_details_query(ids)).mappings()}
+
+
+async def get_classification_details_async(db: "AsyncSession", ids: List[uuid.UUID]) -> Dict[uuid.UUID, Dict[str, Any]]:
+    """`get_classification_details` on an AsyncSession."""
+    if not ids:
+        return {}
+    return {row["classification_id"]: dict(row) for row in (await db.execute(_details_query(ids))).mappings()}
+
+
+def stream_feedback_scores(conn, since: Optional[datetime] = None,
+                           chunk_rows: int = 50_000) -> Iterator[Dict[str, np.ndarray]]:
+    """Classifications that received feedback, as column arrays of at most `chunk_rows` rows.
+
+    Read through a server-side cursor, so memory is bounded by one chunk
+    whatever the table size. `conn` is a Connection or Session.
+    """
+    stmt = (
+        select(Classification.model_id, Classification.template_code, Classification.score_produtivo,
+               Classification.label == "Produtivo", Feedback.helpful, Feedback.reason_code == "WRONG_INTENT")
+        .join(Feedback, Feedback.classification_id == Classification.classification_id)
+    )
+    if since is not None:
+        stmt = stmt.where(Classification.ts_utc >= since)  # prunes old partitions
+    result = conn.execute(stmt, execution_options={"stream_results": True, "yield_per": chunk_rows})
+    for rows in result.partitions():
+        model_id, template_code, score, produtivo, helpful, wrong_intent = zip(*rows)
+        yield {
+            "model_id": np.array(model_id, dtype=np.int32),
+            "template_code": np.array(template_code, dtype=object),
+            "score": np.array(score, dtype=np.float32),
+            "produtivo": np.array(produtivo, dtype=bool),
+            "helpful": np.array(helpful, dtype=bool),
+            "wrong_intent": np.array(wrong_intent, dtype=bool),  # NULL reason_code -> False
+        }
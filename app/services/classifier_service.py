@@ -1,102 +1,205 @@
 # app/services/classifier_service.py
 import uuid
 import time
-from typing import List, Optional
-from app.ml.inference import infer_labels, decide_label
-from app.ml.model_loader import META, EMB_ID, THRESHOLD
-from app.utils.suggest import suggest_reply_pt
-from app.utils.lang import detect_language
-from app.core.config import LANG_SET, TELEMETRY_ON
-from app.db.session import SessionLocal
+import asyncio
+from typing import Any, Dict, List, Optional, Tuple
+import numpy as np
+from app.ml.inference import decide_label
+from app.ml.batcher import BATCHER
+from app.ml.worker_pool import INFERENCE
+from app.ml.cache import SCORE_CACHE
+from app.ml.embedding_store import EMBEDDING_STORE
+from app.ml.model_loader import ModelBundle
+from app.ml.registry import get_bundle
+from app.utils.suggest import suggest_reply_pt, suggest_replies_pt
+from app.utils.lang import detect_language, detect_languages
+from app.core.config import LANG_SET, MICRO_BATCH_ON
+from app.core.deadline import Deadline, check
+from app.core.metrics import note_stage, stage
+from starlette.concurrency import run_in_threadpool
+from app.db.session import AsyncSessionLocal, SessionLocal
 from app.repositories.telemetry_repo import (
-    insert_classification_row, upsert_feedback_row, classification_exists
+    build_classification_row, get_classification_details, get_classification_details_async,
+    upsert_feedback_rows, upsert_feedback_rows_async
 )
+from app.services.telemetry_writer import TELEMETRY_WRITER
 
-def classify_one_service(text: str):
+async def _offload(blocking: bool, fn, *args):
+    # the sqlite cache and the "block" telemetry policy can wait on disk or a full queue
+    if blocking:
+        return await run_in_threadpool(fn, *args)
+    return fn(*args)
+
+async def _score_one(text: str, bundle: ModelBundle, deadline: Optional[Deadline] = None) -> Tuple[np.ndarray, float]:
+    ns = bundle.cache_namespace
+    with stage("cache"):
+        hit = await _offload(SCORE_CACHE.blocking, SCORE_CACHE.get, text, ns)
+    if hit is not None:
+        return hit.embedding, hit.score
+    if MICRO_BATCH_ON:
+        # Concurrent single-text requests share one encode/predict_proba pass
+        x, p, timings = await asyncio.wrap_future(BATCHER.submit(text, bundle, deadline))
+    else:
+        X, P, timings = await INFERENCE.run([text], bundle, deadline)
+        x, p = X[0], float(P[0])
+    for name, seconds in timings.items():
+        note_stage(name, seconds)
+    with stage("cache"):
+        await _offload(SCORE_CACHE.blocking, SCORE_CACHE.put, text, x, p, ns)
+    return x, p
+
+async def _score_many(texts: List[str], bundle: ModelBundle,
+                      deadline: Optional[Deadline] = None) -> Tuple[List[np.ndarray], List[float]]:
+    ns = bundle.cache_namespace
+    with stage("cache"):
+        hits = await _offload(SCORE_CACHE.blocking, SCORE_CACHE.get_many, texts, ns)
+    embs = [h.embedding if h is not None else None for h in hits]
+    probs = [h.score if h is not None else None for h in hits]
+    # encode each distinct missing text once
+    missing = list(dict.fromkeys(t for t, h in zip(texts, hits) if h is None))
+    if missing:
+        X, P, timings = await INFERENCE.run(missing, bundle, deadline)
+        for name, seconds in timings.items():
+            note_stage(name, seconds)
+        scores = P.tolist()
+        with stage("cache"):
+            await _offload(SCORE_CACHE.blocking, SCORE_CACHE.put_many, missing, X, scores, ns)
+        by_text = {t: (X[i], p) for i, (t, p) in enumerate(zip(missing, scores))}
+        embs = [x if x is not None else by_text[t][0] for t, x in zip(texts, embs)]
+        probs = [p if p is not None else by_text[t][1] for t, p in zip(texts, probs)]
+    return embs, probs
+
+def _telemetry_row(cid: uuid.UUID, bundle: ModelBundle, label: str, p: float, template_code: str,
+                   text: str, latency_ms: int, lang: str) -> Dict[str, Any]:
+    return build_classification_row(
+        classification_id=cid,  # <-- UUID object
+        model_version=bundle.version,
+        embedding_model=bundle.emb_id,
+        threshold_used=float(bundle.threshold),
+        label=label,
+        score_produtivo=float(p),
+        template_code=template_code,
+        text_length_chars=len(text),
+        latency_ms=latency_ms,
+        language=lang if lang in LANG_SET else "unknown",
+    )
+
+async def _enqueue_telemetry(rows: List[Dict[str, Any]]) -> None:
+    # Queued for the background writer; the DB round-trip stays off the request path
+    if not TELEMETRY_WRITER.enabled:
+        return
+    with stage("telemetry_enqueue"):
+        await _offload(TELEMETRY_WRITER.blocking, TELEMETRY_WRITER.enqueue_many, rows)
+
+async def classify_one_service(text: str, bundle: Optional[ModelBundle] = None, deadline: Optional[Deadline] = None):
+    # Pin one model bundle for the whole request
+    bundle = bundle or get_bundle()
     start = time.perf_counter()
-    p = float(infer_labels([text])[0])
-    label = decide_label(p)
-    suggestion, template_code = suggest_reply_pt(text, label)
+    x, p = await _score_one(text, bundle, deadline)
+    # scores are cached by now; skip suggestion and telemetry for an abandoned request
+    check(deadline, "postprocess")
+    label = decide_label(p, bundle.threshold)
+    with stage("suggest"):
+        suggestion, template_code = suggest_reply_pt(text, label)
     cid = uuid.uuid4()  
     latency_ms = int((time.perf_counter() - start) * 1000)
-    lang = detect_language(text)
-
-    if TELEMETRY_ON and SessionLocal:
-        try:
-            with SessionLocal() as db:
-                insert_classification_row(
-                    db=db,
-                    classification_id=cid,  # <-- UUID object
-                    model_version=META.get("created_at", "unknown"),
-                    embedding_model=EMB_ID,
-                    threshold_used=float(THRESHOLD),
-                    label=label,
-                    score_produtivo=float(p),
-                    template_code=template_code,
-                    text_length_chars=len(text),
-                    latency_ms=latency_ms,
-                    language=lang if lang in LANG_SET else "unknown",
-                )
-        except Exception:
-            # Telemetry must never break the request
-            pass
+    with stage("language"):
+        lang = detect_language(text)
+
+    await _enqueue_telemetry([_telemetry_row(cid, bundle, label, p, template_code, text, latency_ms, lang)])
+    EMBEDDING_STORE.enqueue(bundle, cid, x)
 
     return cid, label, p, suggestion  # FastAPI/Pydantic will serialize UUID
 
-def classify_batch_service(texts: List[str]):
+async def classify_batch_service(texts: List[str], bundle: Optional[ModelBundle] = None,
+                                 deadline: Optional[Deadline] = None):
+    bundle = bundle or get_bundle()
     start = time.perf_counter()
-    probs = infer_labels(texts).tolist()
+    embs, probs = await _score_many(texts, bundle, deadline)
+    check(deadline, "postprocess")
+    labels = [decide_label(float(p), bundle.threshold) for p in probs]
+    with stage("suggest"):
+        suggestions = suggest_replies_pt(texts, labels)
+    # per item: its share of the batch's scoring + suggestion time
+    latency_ms = int((time.perf_counter() - start) * 1000 / max(len(texts), 1))
+    with stage("language"):
+        langs = detect_languages(texts)
     results = []
+    rows = []
 
-    db_ctx = SessionLocal() if (TELEMETRY_ON and SessionLocal) else None
-    try:
-        for t, p in zip(texts, probs):
-            label = decide_label(float(p))
-            suggestion, template_code = suggest_reply_pt(t, label)
-            cid = uuid.uuid4()  # <-- UUID object
-            latency_ms = int((time.perf_counter() - start) * 1000)
-            lang = detect_language(t)
-
-            if db_ctx:
-                try:
-                    insert_classification_row(
-                        db=db_ctx,
-                        classification_id=cid,  # <-- UUID object
-                        model_version=META.get("created_at", "unknown"),
-                        embedding_model=EMB_ID,
-                        threshold_used=float(THRESHOLD),
-                        label=label,
-                        score_produtivo=float(p),
-                        template_code=template_code,
-                        text_length_chars=len(t),
-                        latency_ms=latency_ms,
-                        language=lang if lang in LANG_SET else "unknown",
-                    )
-                except Exception:
-                    pass
-
-            results.append((cid, label, float(p), suggestion))
-        if db_ctx:
-            # ensure all pending inserts are flushed
-            db_ctx.commit()
-    finally:
-        if db_ctx:
-            db_ctx.close()
+    for t, x, p, label, (suggestion, template_code), lang in zip(texts, embs, probs, labels, suggestions, langs):
+        cid = uuid.uuid4()  # <-- UUID object
+        rows.append(_telemetry_row(cid, bundle, label, p, template_code, t, latency_ms, lang))
+        EMBEDDING_STORE.enqueue(bundle, cid, x)
+        results.append((cid, label, float(p), suggestion))
 
+    await _enqueue_telemetry(rows)
     return results
 
-def submit_feedback_service(classification_id: uuid.UUID, helpful: bool, reason_code: Optional[str]) -> None:
-    """Accept a real UUID here; your Pydantic schema can be UUID4 so FastAPI hands a uuid.UUID."""
+def _upsert_feedback_sync(rows) -> set:
+    with SessionLocal() as db:
+        return upsert_feedback_rows(db, rows)
+
+async def _upsert_feedback(rows) -> set:
+    if AsyncSessionLocal is not None:
+        async with AsyncSessionLocal() as db:
+            return await upsert_feedback_rows_async(db, rows)
+    return await run_in_threadpool(_upsert_feedback_sync, rows)
+
+async def submit_feedback_batch_service(items: List[Tuple[uuid.UUID, bool, Optional[str]]]) -> List[bool]:
+    """Upsert (classification_id, helpful, reason_code) items in one statement; per item: was the id found.
+
+    Ids whose classification row is still in the telemetry writer's queue
+    are retried once after draining it.
+    """
     if not SessionLocal:
         raise RuntimeError("Telemetry disabled or DATABASE_URL not configured")
+    rows = [{"classification_id": cid, "helpful": helpful, "reason_code": reason_code}
+            for cid, helpful, reason_code in items]
+    written = await _upsert_feedback(rows)
+    missing = [r for r in rows if r["classification_id"] not in written]
+    if missing and TELEMETRY_WRITER.has_pending(r["classification_id"] for r in missing):
+        if await run_in_threadpool(TELEMETRY_WRITER.drain):
+            written |= await _upsert_feedback(missing)
+    return [cid in written for cid, _, _ in items]
+
+async def submit_feedback_service(classification_id: uuid.UUID, helpful: bool, reason_code: Optional[str]) -> None:
+    """Accept a real UUID here; your Pydantic schema can be UUID4 so FastAPI hands a uuid.UUID."""
+    if not (await submit_feedback_batch_service([(classification_id, helpful, reason_code)]))[0]:
+        from fastapi import HTTPException, status
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="classification_id not found")
+
+def _details_sync(ids: List[uuid.UUID]) -> Dict[uuid.UUID, Dict[str, Any]]:
     with SessionLocal() as db:
-        if not classification_exists(db, classification_id):
-            from fastapi import HTTPException, status
-            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="classification_id not found")
-        upsert_feedback_row(
-            db=db,
-            feedback_id=uuid.uuid4(),         # <-- UUID object
-            classification_id=classification_id,  # <-- UUID object
-            helpful=helpful,
-            reason_code=reason_code
-        )
+        return get_classification_details(db, ids)
+
+async def similar_service(text: Optional[str], classification_id: Optional[uuid.UUID], k: int,
+                          bundle: Optional[ModelBundle] = None) -> Optional[List[Dict[str, Any]]]:
+    """k nearest past classifications to a text or a stored classification, with their feedback.
+
+    Returns None when `classification_id` is not in the embedding store.
+    Telemetry columns are null for neighbours whose row hasn't been flushed
+    (or when DATABASE_URL is unset).
+    """
+    bundle = bundle or get_bundle()
+    store = EMBEDDING_STORE.store(bundle)
+    if text is not None:
+        x, _ = await _score_one(text, bundle)
+    else:
+        x = await run_in_threadpool(store.vector, classification_id) if store is not None else None
+        if x is None:
+            return None
+    if store is None:
+        return []
+    with stage("similar_search"):
+        hits = await run_in_threadpool(store.search, x, k + (classification_id is not None))
+    hits = [(cid, sim) for cid, sim in hits if cid != classification_id][:k]
+    details: Dict[uuid.UUID, Dict[str, Any]] = {}
+    if hits and SessionLocal is not None:
+        ids = [cid for cid, _ in hits]
+        if AsyncSessionLocal is not None:
+            async with AsyncSessionLocal() as db:
+                details = await get_classification_details_async(db, ids)
+        else:
+            details = await run_in_threadpool(_details_sync, ids)
+    return [{"classification_id": cid, "similarity": round(sim, 4), **details.get(cid, {})} for cid, sim in hits]
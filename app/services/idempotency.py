@@ -0,0 +1,218 @@
+# app/services/idempotency.py
+import asyncio
+import hashlib
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence, Tuple
+
+from starlette.concurrency import run_in_threadpool
+
+from app.core.config import IDEMPOTENCY_ON, IDEMPOTENCY_MAX_ITEMS, IDEMPOTENCY_TTL_S, IDEMPOTENCY_DB_ON
+from app.core.deadline import DeadlineExceeded
+from app.core.metrics import EVENTS
+from app.db.session import AsyncSessionLocal, SessionLocal
+from app.ml.cache import LRUTTLCache
+from app.repositories.idempotency_repo import (
+    get_idempotency_records, get_idempotency_records_async, insert_idempotency_records,
+    insert_idempotency_records_async, purge_idempotency_records, purge_idempotency_records_async,
+)
+
+Record = Tuple[str, Dict[str, Any]]  # (request hash, response)
+ComputeMany = Callable[[List[str]], Awaitable[List[Dict[str, Any]]]]
+
+
+class KeyConflict(ValueError):
+    """An Idempotency-Key was reused with a different text."""
+
+
+class IdempotencyStore:
+    """Replays the stored response for a repeated Idempotency-Key.
+
+    Responses live in an in-process LRU with TTL and, when `session_factory`
+    is given, in the `idempotency_key` table so other workers can replay them
+    too (through `async_session_factory` when there is one, else a thread). A key that is still being computed is not computed twice: later
+    requests in this process wait on the first one's future. Reusing a key
+    with a different text raises `KeyConflict`.
+    """
+
+    def __init__(self, enabled: bool, max_items: int, ttl_s: float,
+                 session_factory: Optional[Callable] = None, async_session_factory: Optional[Callable] = None,
+                 prune_every: int = 1000):
+        self.enabled = enabled
+        self.ttl_s = ttl_s
+        self.memory = LRUTTLCache(max_items, ttl_s)
+        self.session_factory = session_factory if enabled else None
+        self.async_session_factory = async_session_factory if self.session_factory is not None else None
+        self.prune_every = prune_every
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self._writes = 0
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.conflicts = 0
+        self.db_errors = 0
+
+    @staticmethod
+    def fingerprint(text: str) -> str:
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    async def run(self, key: Optional[str], text: str,
+                  compute: Callable[[str], Awaitable[Dict[str, Any]]]) -> Tuple[Dict[str, Any], bool]:
+        """(response, replayed) for one text; `compute` runs only if the key is new."""
+        async def compute_many(texts: List[str]) -> List[Dict[str, Any]]:
+            return [await compute(texts[0])]
+        return (await self.run_many([key], [text], compute_many))[0]
+
+    async def run_many(self, keys: Sequence[Optional[str]], texts: Sequence[str],
+                       compute_many: ComputeMany) -> List[Tuple[Dict[str, Any], bool]]:
+        """(response, replayed) per text. Unkeyed texts and unseen keys go to one `compute_many` call."""
+        if not self.enabled:
+            keys = [None] * len(texts)
+        hashes = [self.fingerprint(t) if k is not None else "" for k, t in zip(keys, texts)]
+        owner: Dict[str, int] = {}  # key -> first index using it in this batch
+        for i, k in enumerate(keys):
+            if k is None:
+                continue
+            j = owner.setdefault(k, i)
+            if hashes[j] != hashes[i]:
+                self._conflict(k)
+
+        found: Dict[str, Record] = {}
+        waiting: Dict[str, asyncio.Future] = {}
+        claimed: Dict[str, asyncio.Future] = {}
+        loop = asyncio.get_running_loop()
+        for k, i in owner.items():
+            fut = self._inflight.get(k)
+            if fut is not None:
+                waiting[k] = fut
+                continue
+            rec = self.memory.get(k)
+            if rec is not None:
+                found[k] = rec
+                continue
+            # claim before any await so concurrent duplicates wait on us
+            claimed[k] = self._inflight[k] = loop.create_future()
+
+        try:
+            if claimed and self.session_factory is not None:
+                stored = await self._db_get(list(claimed))
+                for k, rec in stored.items():
+                    self.memory.put(k, rec)
+                    found[k] = rec
+                    self._release(k, claimed.pop(k), result=rec)
+            for k, rec in found.items():
+                if rec[0] != hashes[owner[k]]:
+                    self._conflict(k)
+
+            todo = [i for i, k in enumerate(keys) if k is None or k in claimed and owner[k] == i]
+            computed: Dict[int, Dict[str, Any]] = {}
+            new: Dict[str, Record] = {}
+            if todo:
+                responses = await compute_many([texts[i] for i in todo])
+                computed = dict(zip(todo, responses))
+                new = {keys[i]: (hashes[i], computed[i]) for i in todo if keys[i] is not None}
+                for k, rec in new.items():
+                    self.memory.put(k, rec)
+                if new and self.session_factory is not None:
+                    await self._db_put(new)
+                for k, rec in new.items():
+                    self._release(k, claimed.pop(k), result=rec)
+        except BaseException as e:
+            for k, fut in claimed.items():
+                self._release(k, fut, error=e)
+            raise
+
+        for k, fut in waiting.items():
+            rec = await asyncio.shield(fut)
+            if rec[0] != hashes[owner[k]]:
+                self._conflict(k)
+            found[k] = rec
+
+        self.misses += len(new)
+        self.hits += sum(1 for k in found if k not in waiting)
+        self.coalesced += len(waiting)
+        out = []
+        for i, k in enumerate(keys):
+            if k is None:
+                out.append((computed[i], False))
+            elif k in found:
+                out.append((found[k][1], True))
+            else:
+                # a later copy of a key first seen earlier in this batch replays that item
+                out.append((computed[owner[k]], owner[k] != i))
+        return out
+
+    def _conflict(self, key: str) -> None:
+        self.conflicts += 1
+        raise KeyConflict(f"Idempotency-Key {key!r} was already used with a different text")
+
+    def _release(self, key: str, fut: asyncio.Future, result: Optional[Record] = None,
+                 error: Optional[BaseException] = None) -> None:
+        if self._inflight.get(key) is fut:
+            del self._inflight[key]
+        if fut.done():
+            return
+        if error is None:
+            fut.set_result(result)
+            return
+        if isinstance(error, (asyncio.CancelledError, KeyConflict, DeadlineExceeded)):
+            # our cancellation, deadline or another key's conflict is not the waiters' error
+            error = RuntimeError("request holding this Idempotency-Key did not complete")
+        fut.set_exception(error)
+        fut.exception()  # waiters re-raise it; don't log "exception never retrieved"
+
+    async def _db_get(self, keys: List[str]) -> Dict[str, Record]:
+        try:
+            if self.async_session_factory is not None:
+                async with self.async_session_factory() as db:
+                    return await get_idempotency_records_async(db, keys, self.ttl_s)
+            return await run_in_threadpool(self._db_get_sync, keys)
+        except Exception:
+            # the shared store is best effort; fall back to computing
+            self.db_errors += 1
+            return {}
+
+    def _db_get_sync(self, keys: List[str]) -> Dict[str, Record]:
+        with self.session_factory() as db:
+            return get_idempotency_records(db, keys, self.ttl_s)
+
+    async def _db_put(self, records: Dict[str, Record]) -> None:
+        rows = [{"key": k, "request_hash": h, "response": r} for k, (h, r) in records.items()]
+        before = self._writes
+        self._writes += len(rows)
+        prune = self._writes // self.prune_every > before // self.prune_every
+        try:
+            if self.async_session_factory is not None:
+                async with self.async_session_factory() as db:
+                    await insert_idempotency_records_async(db, rows)
+                    if prune:
+                        await purge_idempotency_records_async(db, self.ttl_s)
+            else:
+                await run_in_threadpool(self._db_put_sync, rows, prune)
+        except Exception:
+            self.db_errors += 1
+
+    def _db_put_sync(self, rows: List[Dict[str, Any]], prune: bool) -> None:
+        with self.session_factory() as db:
+            insert_idempotency_records(db, rows)
+            if prune:
+                purge_idempotency_records(db, self.ttl_s)
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "backend": "database" if self.session_factory is not None else "memory",
+            "size": len(self.memory),
+            "inflight": len(self._inflight),
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "conflicts": self.conflicts,
+            "db_errors": self.db_errors,
+        }
+
+
+IDEMPOTENCY = IdempotencyStore(
+    IDEMPOTENCY_ON, IDEMPOTENCY_MAX_ITEMS, IDEMPOTENCY_TTL_S,
+    SessionLocal if IDEMPOTENCY_DB_ON else None, AsyncSessionLocal,
+)
+for _event in ("hits", "misses", "coalesced", "conflicts", "db_errors"):
+    EVENTS.add(lambda e=_event: getattr(IDEMPOTENCY, e), "idempotency", _event)
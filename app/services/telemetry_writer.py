@@ -0,0 +1,134 @@
+# app/services/telemetry_writer.py
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+from app.core.background import BackgroundQueue
+from app.core.config import (
+    TELEMETRY_ON, TELEMETRY_QUEUE_MAX, TELEMETRY_FLUSH_ROWS, TELEMETRY_FLUSH_MS,
+    TELEMETRY_FULL_POLICY, TELEMETRY_BLOCK_MS,
+)
+from app.core.metrics import EVENTS, observe_stage
+from app.db.session import SessionLocal
+from app.repositories.telemetry_repo import insert_classification_rows
+
+
+class TelemetryWriter:
+    """Bounded in-memory queue of classification rows flushed by a background thread.
+
+    Rows are written with one multi-row INSERT every `flush_rows` rows or
+    `flush_ms` milliseconds, whichever comes first. When the queue is full the
+    `policy` decides: "drop" discards the row immediately, "block" waits up to
+    `block_ms` for room and then discards it (so `blocking` is true and
+    async callers enqueue from a threadpool thread).
+
+    The classification_ids of queued rows are tracked until their flush, so
+    feedback for a classification served moments ago can `drain()` the queue
+    instead of reporting the id as unknown.
+    """
+
+    def __init__(
+        self,
+        session_factory: Optional[Callable],
+        max_queue: int = TELEMETRY_QUEUE_MAX,
+        flush_rows: int = TELEMETRY_FLUSH_ROWS,
+        flush_ms: float = TELEMETRY_FLUSH_MS,
+        policy: str = TELEMETRY_FULL_POLICY,
+        block_ms: float = TELEMETRY_BLOCK_MS,
+    ):
+        self.session_factory = session_factory
+        self.policy = policy if policy in ("drop", "block") else "drop"
+        self.block_s = max(0.0, block_ms) / 1000.0
+        self.queue = BackgroundQueue("telemetry-writer", self._flush, max_queue=max(1, max_queue),
+                                     max_batch=flush_rows, max_wait_ms=max(1.0, flush_ms))
+        self._lock = threading.Lock()
+        self._pending_ids: set = set()  # classification_ids queued or batched but not flushed yet
+        self.queued = 0
+        self.flushed = 0
+        self.dropped = 0
+        self.failed = 0
+        self.flushes = 0
+
+    @property
+    def enabled(self) -> bool:
+        return TELEMETRY_ON and self.session_factory is not None
+
+    @property
+    def blocking(self) -> bool:
+        return self.enabled and self.policy == "block"
+
+    def start(self) -> None:
+        if self.enabled:
+            self.queue.start()
+
+    def stop(self, timeout: float = 10.0) -> None:
+        """Flush whatever is queued and stop the writer thread."""
+        self.queue.stop(timeout)
+
+    def enqueue(self, row: Dict[str, Any]) -> bool:
+        """Queue one row built by `build_classification_row`. Never raises."""
+        return self.enqueue_many([row]) == 1
+
+    def enqueue_many(self, rows: List[Dict[str, Any]]) -> int:
+        """Queue rows in order until the queue is full; the rest are dropped. Returns rows queued."""
+        if not self.enabled or not rows:
+            return 0
+        if not self.queue.started:
+            self.start()
+        n = 0
+        with self._lock:
+            self._pending_ids.update(r["classification_id"] for r in rows)
+        timeout = self.block_s if self.policy == "block" else 0.0
+        for row in rows:
+            if not self.queue.put(row, timeout):
+                break  # one wait per call: once it times out the queue is not draining fast enough
+            n += 1
+        if n < len(rows):
+            self.dropped += len(rows) - n
+            with self._lock:
+                self._pending_ids.difference_update(r["classification_id"] for r in rows[n:])
+        self.queued += n
+        return n
+
+    def has_pending(self, ids: Iterable) -> bool:
+        """True if any of these classification_ids is queued but not flushed yet."""
+        with self._lock:
+            return any(i in self._pending_ids for i in ids)
+
+    def drain(self, timeout: float = 5.0) -> bool:
+        """Flush everything queued before this call; False if that didn't finish within `timeout` seconds."""
+        return self.queue.drain(timeout)
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "policy": self.policy,
+            "queue_depth": self.queue.qsize(),
+            "queued": self.queued,
+            "flushed": self.flushed,
+            "dropped": self.dropped,
+            "failed": self.failed,
+            "flushes": self.flushes,
+        }
+
+    def _flush(self, rows: List[Dict[str, Any]]) -> None:
+        if not rows:
+            return
+        t0 = time.perf_counter()
+        try:
+            with self.session_factory() as db:
+                insert_classification_rows(db, rows)
+            self.flushed += len(rows)
+            observe_stage("telemetry_commit", time.perf_counter() - t0)
+        except Exception:
+            # Telemetry must never break the service; count and move on
+            self.failed += len(rows)
+        self.flushes += 1
+        with self._lock:
+            self._pending_ids.difference_update(r["classification_id"] for r in rows)
+
+
+TELEMETRY_WRITER = TelemetryWriter(SessionLocal)
+TELEMETRY_WRITER.queue.register_metrics("telemetry", "telemetry")
+for _event in ("queued", "flushed", "dropped", "failed", "flushes"):
+    EVENTS.add(lambda e=_event: getattr(TELEMETRY_WRITER, e), "telemetry", _event)
@@ -1,4 +1,17 @@
 import re
+from typing import List, Sequence
+
+from app.core.config import RULES_SCAN_CHARS
+
+# Single-char markers: one native substring scan each beats a regex char class
+_PT_CHARS = tuple("áéíóúãõçÁÉÍÓÚÃÕÇ")
+_RE_LATIN = re.compile(r"[a-z]", re.I)
 
 def detect_language(_text: str) -> str:
-    return "pt" if re.search(r"[áéíóúãõç]", _text, re.I) else "en" if re.search(r"[a-z]", _text, re.I) else "unknown"
+    head = _text[:RULES_SCAN_CHARS] if RULES_SCAN_CHARS else _text
+    if any(c in head for c in _PT_CHARS):
+        return "pt"
+    return "en" if _RE_LATIN.search(head) else "unknown"
+
+def detect_languages(texts: Sequence[str]) -> List[str]:
+    return [detect_language(t) for t in texts]
@@ -0,0 +1,133 @@
+import json
+import re
+from dataclasses import dataclass, field
+from typing import Any, Dict, FrozenSet, List, Optional, Sequence, Tuple
+
+_NON_WORD = re.compile(r"\W")
+
+
+@dataclass
+class Rule:
+    """One reply template and the patterns that trigger it.
+
+    A pattern hit counts when the pattern matches at a word start. If the
+    pattern has a capture group, its first group is the rule's `ref`. With
+    `ref_after`, the hit only counts if that regex also matches later on the
+    same line, and that match becomes the `ref`.
+    """
+    template: str
+    message: str
+    labels: FrozenSet[str] = frozenset({"Produtivo"})
+    message_no_ref: Optional[str] = None
+    patterns: List[Tuple[str, Optional[str]]] = field(default_factory=list)  # (pattern, ref_after)
+
+    def render(self, ref: str) -> str:
+        if ref or self.message_no_ref is None:
+            return self.message.replace("{ref}", ref)
+        return self.message_no_ref
+
+
+class RuleEngine:
+    """Declarative rules compiled into one case-insensitive alternation.
+
+    `match` scans the text once, at most `scan_chars` chars (rounded up to a
+    word end; 0 = whole text). It returns the first rule in table order that
+    applies to the label and has a hit, so table order is the precedence.
+    Patterns of different rules should not start matching at the same
+    position; when they do, the earlier rule wins.
+    """
+
+    def __init__(self, rules: Sequence[Rule], fallback: Dict[str, Tuple[str, str]], scan_chars: int = 0):
+        self.rules = list(rules)
+        self.fallback = fallback
+        self.scan_chars = max(0, scan_chars)
+        branches, self._hits = [], []  # branch k -> (rule index, inner group count, ref_after regex)
+        for ri, rule in enumerate(self.rules):
+            for pattern, ref_after in rule.patterns:
+                k = len(self._hits)
+                branches.append(f"(?P<_{k}>{pattern})")
+                inner = re.compile(pattern, re.I).groups
+                self._hits.append((ri, inner, re.compile(ref_after, re.I) if ref_after else None))
+        self._combined = re.compile(r"\b(?:" + "|".join(branches) + ")", re.I) if branches else None
+        if self._combined is not None:
+            self._group_of = {self._combined.groupindex[f"_{k}"]: k for k in range(len(self._hits))}
+        self._wants_ref = {ri for ri, inner, ref_after in self._hits if inner or ref_after is not None}
+        self._top: Dict[str, int] = {}  # label -> index of the first rule that applies to it
+
+    def _limit(self, text: str) -> int:
+        if not self.scan_chars or len(text) <= self.scan_chars:
+            return len(text)
+        # don't cut a word in half: a truncated "acessor" would read as "acesso"
+        m = _NON_WORD.search(text, self.scan_chars)
+        return m.start() if m else len(text)
+
+    def match(self, text: str, label: str) -> Tuple[Optional[Rule], str]:
+        """(winning rule or None, ref) for one text."""
+        if self._combined is None:
+            return None, ""
+        limit = self._limit(text)
+        best, ref = len(self.rules), ""
+        top = self._top.get(label)
+        if top is None:
+            top = self._top[label] = next((i for i, r in enumerate(self.rules) if label in r.labels), len(self.rules))
+        for m in self._combined.finditer(text, 0, limit):
+            gi = m.lastindex
+            ri, inner, ref_after = self._hits[self._group_of[gi]]
+            if ri > best or label not in self.rules[ri].labels:
+                continue
+            hit_ref = ""
+            if ref_after is not None:
+                eol = text.find("\n", m.end(), limit)
+                rm = ref_after.search(text, m.end(), limit if eol < 0 else eol)
+                if rm is None:
+                    continue  # keyword without its value: not a hit
+                hit_ref = rm.group(0)
+            elif inner:
+                hit_ref = m.group(gi + 1) or ""
+            if ri < best:
+                best, ref = ri, hit_ref
+            elif not ref:
+                ref = hit_ref
+            # nothing can beat the top rule once its ref (if any) is known
+            if best == top and (ref or best not in self._wants_ref):
+                break
+        return (self.rules[best], ref) if best < len(self.rules) else (None, "")
+
+    def suggest(self, text: str, label: str) -> Tuple[Optional[str], str]:
+        rule, ref = self.match(text, label)
+        if rule is not None:
+            return rule.render(ref), rule.template
+        template, message = self.fallback[label] if label in self.fallback else self.fallback["*"]
+        return message, template
+
+    def suggest_many(self, texts: Sequence[str], labels: Sequence[str]) -> List[Tuple[Optional[str], str]]:
+        suggest = self.suggest
+        return [suggest(t, lb) for t, lb in zip(texts, labels)]
+
+
+def engine_from_config(cfg: Dict[str, Any], scan_chars: int = 0) -> RuleEngine:
+    """Build an engine from the JSON shape documented in the README (`SUGGEST_RULES_PATH`)."""
+    rules = []
+    for r in cfg["rules"]:
+        patterns = []
+        for p in r["patterns"]:
+            if isinstance(p, str):
+                patterns.append((p, None))
+            else:
+                patterns.append((p["pattern"], p.get("ref_after")))
+        rules.append(Rule(
+            template=r["template"],
+            message=r["message"],
+            labels=frozenset(r.get("labels", ["Produtivo"])),
+            message_no_ref=r.get("message_no_ref"),
+            patterns=patterns,
+        ))
+    fallback = {label: (f["template"], f["message"]) for label, f in cfg["fallback"].items()}
+    if "*" not in fallback and not {"Produtivo", "Improdutivo"} <= set(fallback):
+        raise ValueError("rules config needs a fallback for each label (or '*')")
+    return RuleEngine(rules, fallback, scan_chars)
+
+
+def load_engine(path: str, scan_chars: int = 0) -> RuleEngine:
+    with open(path, "r", encoding="utf-8") as f:
+        return engine_from_config(json.load(f), scan_chars)
@@ -0,0 +1,386 @@
+"""Load test + latency benchmark for /classify, /classify_batch and /feedback.
+
+    python benchmarks/bench_api.py --out bench.json [--baseline baseline.json]
+
+Builds a dummy artifact set (hashing embedder + calibrated logistic
+regression, see `benchmarks/hashing_backend.py`) so no model download is needed,
+starts `uvicorn app.main:app` once per telemetry mode and drives it with
+closed-loop concurrent clients. Every scenario reports p50/p95/p99 latency
+and req/s (plus items/s for batches) to a JSON file, along with the
+server's resident memory after the run (API process, and each inference
+worker process when `INFER_WORKERS > 0`; Linux only). With `--baseline` the
+run is compared scenario by scenario and the exit code is 1 when p95 or
+req/s regress by more than `--max-regression`.
+
+Telemetry modes: `off`, `sqlite` (a throwaway file, tables created here) or
+a SQLAlchemy URL to a local Postgres whose schema is already migrated.
+`/feedback` needs telemetry, so it is skipped in `off` mode.
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+from typing import Any, Dict, List, Optional
+
+import httpx
+import numpy as np
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, ROOT)
+
+PRODUTIVO = [
+    "Qual o status do chamado {n}? Preciso de uma atualização.",
+    "Estou recebendo erro {n} ao acessar o sistema de faturamento.",
+    "Pode liberar meu acesso ao ERP? Fui transferido, matrícula {n}.",
+    "Preciso redefinir minha senha, o reset do usuário {n} não chegou.",
+    "Hi team, could you send me the status of ticket {n}?",
+]
+IMPRODUTIVO = [
+    "Feliz aniversário! Muitas felicidades, abraço {n}.",
+    "Obrigado pela ajuda de ontem, pessoal! ({n})",
+    "Estou ausente até segunda-feira, ref {n}.",
+    "Segue anexo o comunicado geral número {n}, apenas para ciência.",
+    "Out of office: I will be back on Monday ({n}).",
+]
+LONG_TAIL = " Prezados, conforme conversado na reunião, encaminho as pendências do projeto."
+
+
+# ================== Dummy artifacts ==================
+def build_dummy_artifacts(arts_dir: str) -> str:
+    import joblib
+    from sklearn.calibration import CalibratedClassifierCV
+    from sklearn.linear_model import LogisticRegression
+    from benchmarks.hashing_backend import CONFIG_FILE, HashingEmbedder
+
+    emb_dir = os.path.join(arts_dir, "embedder")
+    os.makedirs(emb_dir, exist_ok=True)
+    cfg = {"dim": 384, "ngram_min": 2, "ngram_max": 4, "max_seq_length": 128}
+    with open(os.path.join(emb_dir, CONFIG_FILE), "w", encoding="utf-8") as f:
+        json.dump(cfg, f)
+
+    rng = random.Random(0)
+    texts, y = [], []
+    for i in range(400):
+        label = i % 2
+        texts.append(rng.choice(PRODUTIVO if label else IMPRODUTIVO).format(n=rng.randint(1, 99999)))
+        y.append(label)
+    X = HashingEmbedder(**cfg).encode(texts)
+    clf = CalibratedClassifierCV(LogisticRegression(max_iter=1000), cv=3).fit(X, y)
+    joblib.dump(clf, os.path.join(arts_dir, "clf_cal.joblib"))
+    with open(os.path.join(arts_dir, "metadata.json"), "w", encoding="utf-8") as f:
+        json.dump({
+            "created_at": "bench-dummy",
+            "threshold_produtivo": 0.5,
+            "embedding_model": "hashing-char-2-4",
+            "embed_backend": "hashing",
+        }, f)
+    return arts_dir
+
+
+def make_texts(n: int, unique: bool, rng: random.Random) -> List[str]:
+    out = []
+    for i in range(n):
+        t = rng.choice(PRODUTIVO + IMPRODUTIVO).format(n=rng.randint(1, 99999) if unique else i % 50)
+        if rng.random() < 0.2:
+            t += LONG_TAIL * rng.randint(5, 40)
+        out.append(t)
+    return out
+
+
+# ================== Server ==================
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _prepare_db(mode: str, workdir: str) -> Optional[str]:
+    if mode == "off":
+        return None
+    if mode == "sqlite":
+        url = f"sqlite:///{os.path.join(workdir, 'telemetry.sqlite')}"
+        import sqlalchemy as sa
+        from app.db.models import Base
+        engine = sa.create_engine(url)
+        Base.metadata.create_all(engine)
+        engine.dispose()
+        return url
+    return mode  # external URL, schema managed by Alembic
+
+
+def start_server(arts_dir: str, db_url: Optional[str], port: int, extra_env: Dict[str, str],
+                 log_path: str) -> subprocess.Popen:
+    env = dict(os.environ)
+    env.pop("DATABASE_URL", None)
+    env.update({"MODEL_DIR": arts_dir, "TELEMETRY": "on" if db_url else "off", "PYTHONPATH": ROOT,
+                "EMBED_BACKEND_MODULES": "benchmarks.hashing_backend"})
+    if db_url:
+        env["DATABASE_URL"] = db_url
+    env.update(extra_env)
+    log = open(log_path, "ab")
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--host", "127.0.0.1", "--port", str(port),
+         "--log-level", "warning"],
+        cwd=ROOT, env=env, stdout=log, stderr=subprocess.STDOUT,
+    )
+
+
+async def wait_ready(base: str, proc: subprocess.Popen, timeout_s: float = 120.0) -> dict:
+    deadline = time.monotonic() + timeout_s
+    async with httpx.AsyncClient(base_url=base) as client:
+        while time.monotonic() < deadline:
+            if proc.poll() is not None:
+                raise RuntimeError(f"server exited with code {proc.returncode}")
+            try:
+                r = await client.get("/readyz")
+                if r.status_code == 200:
+                    return r.json()
+            except httpx.TransportError:
+                pass
+            await asyncio.sleep(0.2)
+    raise RuntimeError("server not ready in time")
+
+
+def _memory_mb(pid: int) -> Dict[str, Optional[float]]:
+    """RSS and PSS (shared pages split between the processes mapping them) of `pid`, from /proc."""
+    found: Dict[str, Optional[float]] = {"rss_mb": None, "pss_mb": None}
+    try:
+        with open(f"/proc/{pid}/smaps_rollup", "r", encoding="ascii") as f:
+            for line in f:
+                key, _, rest = line.partition(":")
+                if key in ("Rss", "Pss"):
+                    found[f"{key.lower()}_mb"] = round(int(rest.split()[0]) / 1024, 1)
+    except (OSError, ValueError):
+        pass
+    return found
+
+
+def server_memory(proc: subprocess.Popen, health: dict) -> Dict[str, Any]:
+    """Memory of the API process and of each inference worker that served a task (pids from /healthz)."""
+    workers = {w: _memory_mb(int(w[4:])) for w in health.get("inference", {}).get("per_worker", {})
+               if w.startswith("pid-")}
+    rss = [m["rss_mb"] for m in workers.values() if m["rss_mb"] is not None]
+    return {
+        "server": _memory_mb(proc.pid),
+        "workers": workers,
+        "worker_rss_mb_max": max(rss) if rss else None,
+    }
+
+
+def stop_server(proc: subprocess.Popen) -> None:
+    proc.terminate()
+    try:
+        proc.wait(timeout=30)
+    except subprocess.TimeoutExpired:
+        proc.kill()
+
+
+# ================== Load generation ==================
+def summarize(latencies_s: List[float], wall_s: float, errors: int, items_per_req: int) -> Dict[str, Any]:
+    ok = len(latencies_s)
+    lat = np.asarray(latencies_s) * 1000 if ok else np.zeros(1)
+    p50, p95, p99 = np.percentile(lat, [50, 95, 99])
+    return {
+        "requests": ok + errors,
+        "errors": errors,
+        "wall_s": round(wall_s, 3),
+        "rps": round(ok / wall_s, 2) if wall_s > 0 else 0.0,
+        "items_per_s": round(ok * items_per_req / wall_s, 2) if wall_s > 0 else 0.0,
+        "p50_ms": round(float(p50), 2),
+        "p95_ms": round(float(p95), 2),
+        "p99_ms": round(float(p99), 2),
+        "mean_ms": round(float(lat.mean()), 2),
+        "max_ms": round(float(lat.max()), 2),
+    }
+
+
+async def run_load(client: httpx.AsyncClient, path: str, bodies: List[dict], concurrency: int,
+                   ok_status: int, warmup: int = 0) -> Dict[str, Any]:
+    """Closed loop: `concurrency` clients each send their next request as soon as the previous returns."""
+    for body in bodies[:warmup]:
+        await client.post(path, json=body)
+    queue = list(reversed(bodies[warmup:]))
+    latencies: List[float] = []
+    responses: List[dict] = []
+    errors = 0
+
+    async def _client():
+        nonlocal errors
+        while queue:
+            body = queue.pop()
+            t0 = time.perf_counter()
+            try:
+                r = await client.post(path, json=body)
+            except httpx.TransportError:
+                errors += 1
+                continue
+            dt = time.perf_counter() - t0
+            if r.status_code == ok_status:
+                latencies.append(dt)
+                if r.content:
+                    responses.append(r.json())
+            else:
+                errors += 1
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(_client() for _ in range(concurrency)))
+    return {"latencies": latencies, "wall_s": time.perf_counter() - t0, "errors": errors, "responses": responses}
+
+
+async def wait_telemetry_flushed(client: httpx.AsyncClient, timeout_s: float = 30.0) -> dict:
+    deadline = time.monotonic() + timeout_s
+    stats: dict = {}
+    while time.monotonic() < deadline:
+        stats = (await client.get("/healthz")).json().get("telemetry", {})
+        if stats.get("queued", 0) <= stats.get("flushed", 0) + stats.get("dropped", 0) + stats.get("failed", 0):
+            break
+        await asyncio.sleep(0.2)
+    return stats
+
+
+async def run_mode(args, mode: str, arts_dir: str, workdir: str) -> List[Dict[str, Any]]:
+    db_url = _prepare_db(mode, workdir)
+    port = _free_port()
+    base = f"http://127.0.0.1:{port}"
+    extra_env = dict(kv.split("=", 1) for kv in args.server_env)
+    proc = start_server(arts_dir, db_url, port, extra_env, os.path.join(workdir, "server.log"))
+    telemetry = "off" if mode == "off" else ("sqlite" if mode == "sqlite" else "postgres")
+    rng = random.Random(args.seed)
+    results: List[Dict[str, Any]] = []
+    cids: List[str] = []
+
+    def _record(endpoint: str, concurrency: int, batch_size: int, run: dict) -> None:
+        row = {"name": f"{telemetry}/{endpoint}/c{concurrency}/b{batch_size}", "telemetry": telemetry,
+               "endpoint": endpoint, "concurrency": concurrency, "batch_size": batch_size,
+               **summarize(run["latencies"], run["wall_s"], run["errors"], batch_size)}
+        results.append(row)
+        print(f"  {row['name']:<38} p50={row['p50_ms']:>8}ms p95={row['p95_ms']:>8}ms "
+              f"p99={row['p99_ms']:>8}ms {row['rps']:>9} req/s  errors={row['errors']}", file=sys.stderr)
+
+    try:
+        await wait_ready(base, proc)
+        limits = httpx.Limits(max_connections=max(args.concurrency) * 2)
+        async with httpx.AsyncClient(base_url=base, limits=limits, timeout=60.0) as client:
+            for c in args.concurrency:
+                bodies = [{"text": t} for t in make_texts(args.requests + 2 * c, not args.repeat_texts, rng)]
+                run = await run_load(client, "/classify", bodies, c, 200, warmup=2 * c)
+                cids += [r["classification_id"] for r in run["responses"]]
+                _record("classify", c, 1, run)
+            for bs in args.batch_sizes:
+                for c in args.batch_concurrency:
+                    n = max(10, args.requests // 4)
+                    bodies = [{"texts": make_texts(bs, not args.repeat_texts, rng)} for _ in range(n + c)]
+                    run = await run_load(client, "/classify_batch", bodies, c, 200, warmup=c)
+                    cids += [r["classification_id"] for resp in run["responses"] for r in resp["results"]]
+                    _record("classify_batch", c, bs, run)
+            if db_url:
+                await wait_telemetry_flushed(client)
+                rng.shuffle(cids)
+                for c in args.concurrency:
+                    take, cids = cids[:args.requests], cids[args.requests:]
+                    if not take:
+                        break
+                    bodies = [{"classification_id": cid, "helpful": rng.random() < 0.8} for cid in take]
+                    _record("feedback", c, 1, await run_load(client, "/feedback", bodies, c, 204))
+            health = (await client.get("/healthz")).json()
+        memory = server_memory(proc, health)
+        print(f"  memory: server rss={memory['server']['rss_mb']}MB, {len(memory['workers'])} workers "
+              f"max rss={memory['worker_rss_mb_max']}MB", file=sys.stderr)
+        for row in results:
+            row["inference_mode"] = health.get("inference", {}).get("mode")
+            row["embedding_backend"] = health.get("embedding_backend")
+            row["memory"] = memory
+    finally:
+        stop_server(proc)
+    return results
+
+
+# ================== Baseline comparison ==================
+def compare(current: List[dict], baseline: List[dict], max_regression: float) -> List[dict]:
+    base = {r["name"]: r for r in baseline}
+    rows = []
+    for r in current:
+        b = base.get(r["name"])
+        if not b:
+            continue
+        p95 = (r["p95_ms"] - b["p95_ms"]) / b["p95_ms"] if b["p95_ms"] else 0.0
+        rps = (r["rps"] - b["rps"]) / b["rps"] if b["rps"] else 0.0
+        rows.append({"name": r["name"], "p95_delta": round(p95, 4), "rps_delta": round(rps, 4),
+                     "regressed": p95 > max_regression or rps < -max_regression})
+    return rows
+
+
+def _ints(s: str) -> List[int]:
+    return [int(x) for x in s.split(",") if x.strip()]
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    ap = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    ap.add_argument("--out", default="bench.json", help="JSON results file")
+    ap.add_argument("--baseline", help="previous results JSON to compare against")
+    ap.add_argument("--max-regression", type=float, default=0.15,
+                    help="allowed relative p95 increase / req/s drop before exiting 1")
+    ap.add_argument("--telemetry", default="off,sqlite",
+                    help="comma-separated modes: off, sqlite, or a SQLAlchemy URL (local Postgres)")
+    ap.add_argument("--artifacts", help="use this MODEL_DIR instead of generated dummy artifacts")
+    ap.add_argument("--requests", type=int, default=300, help="measured requests per scenario")
+    ap.add_argument("--concurrency", type=_ints, default=[1, 8, 32])
+    ap.add_argument("--batch-sizes", type=_ints, default=[8, 64])
+    ap.add_argument("--batch-concurrency", type=_ints, default=[1, 8])
+    ap.add_argument("--repeat-texts", action="store_true", help="reuse a small text pool (exercises the cache)")
+    ap.add_argument("--server-env", action="append", default=[], metavar="KEY=VALUE",
+                    help="extra env for the server, e.g. INFER_WORKERS=2 (repeatable)")
+    ap.add_argument("--seed", type=int, default=0)
+    args = ap.parse_args(argv)
+
+    workroot = tempfile.mkdtemp(prefix="autou-bench-")
+    arts_dir = args.artifacts or build_dummy_artifacts(os.path.join(workroot, "arts"))
+    scenarios: List[dict] = []
+    for i, mode in enumerate(m.strip() for m in args.telemetry.split(",") if m.strip()):
+        print(f"telemetry={mode if '://' not in mode else 'postgres'}", file=sys.stderr)
+        workdir = os.path.join(workroot, f"mode{i}")
+        os.makedirs(workdir, exist_ok=True)
+        scenarios += asyncio.run(run_mode(args, mode, arts_dir, workdir))
+
+    try:
+        sha = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True,
+                             text=True).stdout.strip() or None
+    except OSError:
+        sha = None
+    report: Dict[str, Any] = {
+        "run_id": str(uuid.uuid4()),
+        "created_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "git_sha": sha,
+        "python": platform.python_version(),
+        "cpu_count": os.cpu_count(),
+        "artifacts": "dummy" if not args.artifacts else args.artifacts,
+        "server_env": args.server_env,
+        "requests_per_scenario": args.requests,
+        "scenarios": scenarios,
+    }
+    exit_code = 0
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            report["comparison"] = compare(scenarios, json.load(f)["scenarios"], args.max_regression)
+        for row in report["comparison"]:
+            flag = "REGRESSED" if row["regressed"] else ""
+            print(f"  {row['name']:<38} p95 {row['p95_delta']:+.1%}  req/s {row['rps_delta']:+.1%} {flag}",
+                  file=sys.stderr)
+        exit_code = 1 if any(r["regressed"] for r in report["comparison"]) else 0
+
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"wrote {args.out} (server logs in {workroot})", file=sys.stderr)
+    return exit_code
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
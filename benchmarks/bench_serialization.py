@@ -0,0 +1,100 @@
+"""Micro-benchmark for /classify_batch response serialization.
+
+    python benchmarks/bench_serialization.py [--sizes 1,50,200] [--repeat 7] [--json]
+
+Times turning the service's result dicts into response body bytes:
+`pydantic` is the previous path (one `ClassificationOut` per item, then
+FastAPI's `response_model` validation, `jsonable_encoder` and
+`JSONResponse`); `fast` is `FastJSONResponse` (orjson when installed) and
+`fast_stdlib` the same without orjson.
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import timeit
+import uuid
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from fastapi.responses import JSONResponse  # noqa: E402
+from fastapi.routing import serialize_response  # noqa: E402
+from fastapi.utils import create_model_field  # noqa: E402
+
+import app.api.v1.responses as responses  # noqa: E402
+from app.api.v1.schemas import ClassificationBatchOut, ClassificationOut  # noqa: E402
+from app.core.config import MAX_BATCH_ITEMS  # noqa: E402
+
+SUGGESTION = ("Olá! Verificaremos o status do chamado e retornaremos com uma atualização em breve. "
+              "Caso precise, responda este e-mail com mais detalhes.")
+
+
+def make_results(n: int) -> list:
+    """What `routes._result` returns per item."""
+    return [{
+        "classification_id": str(uuid.uuid4()),
+        "label": "Produtivo" if i % 3 else "Improdutivo",
+        "score_produtivo": round(0.5 + (i % 50) / 101, 3),
+        "threshold_used": 0.65,
+        "suggestion": SUGGESTION,
+    } for i in range(n)]
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    ap.add_argument("--sizes", default=f"1,50,{MAX_BATCH_ITEMS}", help="comma-separated batch sizes")
+    ap.add_argument("--repeat", type=int, default=7)
+    ap.add_argument("--json", action="store_true", help="print one JSON object instead of a table")
+    args = ap.parse_args(argv)
+
+    field = create_model_field("Response_classify_batch", ClassificationBatchOut, mode="serialization")
+    loop = asyncio.new_event_loop()
+
+    def before(results: list) -> bytes:
+        out = ClassificationBatchOut(results=[ClassificationOut(**r) for r in results])
+        content = loop.run_until_complete(serialize_response(field=field, response_content=out))
+        return JSONResponse(content).body
+
+    def fast(results: list) -> bytes:
+        return responses.FastJSONResponse({"results": results}).body
+
+    orjson = responses.orjson
+
+    def fast_stdlib(results: list) -> bytes:
+        responses.orjson = None
+        try:
+            return fast(results)
+        finally:
+            responses.orjson = orjson
+
+    out = {}
+    for n in [int(s) for s in args.sizes.split(",") if s.strip()]:
+        results = make_results(n)
+        assert json.loads(before(results)) == json.loads(fast(results)) == json.loads(fast_stdlib(results))
+        cases = {"pydantic": before, "fast": fast}
+        if orjson is not None:
+            cases["fast_stdlib"] = fast_stdlib
+        number = max(1, 20000 // n)
+        row = {}
+        for name, fn in cases.items():
+            best = min(timeit.repeat(lambda: fn(results), number=number, repeat=args.repeat)) / number
+            row[name] = {"ms_per_batch": round(best * 1000, 4), "us_per_item": round(best * 1e6 / n, 2)}
+        row["speedup"] = round(row["pydantic"]["ms_per_batch"] / row["fast"]["ms_per_batch"], 1)
+        out[n] = row
+    loop.close()
+
+    if args.json:
+        print(json.dumps({"orjson": orjson is not None, "results": out}, indent=2))
+        return 0
+    print(f"{'items':>6}{'case':>14}{'ms/batch':>12}{'us/item':>10}")
+    for n, row in out.items():
+        for name in ("pydantic", "fast", "fast_stdlib"):
+            if name in row:
+                print(f"{n:>6}{name:>14}{row[name]['ms_per_batch']:>12}{row[name]['us_per_item']:>10}")
+        print(f"{'':>6}{'speedup':>14}{row['speedup']:>11}x")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,81 @@
+"""Micro-benchmark for request validation cost (ClassifyIn / ClassifyBatchIn).
+
+    python benchmarks/bench_validation.py [--repeat 7] [--json]
+
+Reports milliseconds per MB of input for the shared `clean_text` check, the
+pydantic models that use it, and the previous per-character implementation
+(kept here as a reference point).
+"""
+import argparse
+import json
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from app.api.v1.schemas import ClassifyBatchIn, ClassifyIn, clean_text  # noqa: E402
+from app.core.config import MAX_BATCH_ITEMS, MAX_TEXT_CHARS  # noqa: E402
+
+PARAGRAPH = (
+    "Prezados, conforme conversado na reunião de ontem, segue em anexo o relatório "
+    "atualizado com as pendências do projeto.\n\tFavor verificar os itens em aberto e "
+    "retornar até sexta-feira. Obrigado! "
+)
+
+
+def legacy_validate(v) -> str:
+    txt = str(v).strip()
+    if len(txt) == 0:
+        raise ValueError("text cannot be empty")
+    if len(txt) > MAX_TEXT_CHARS:
+        raise ValueError(f"text too long (>{MAX_TEXT_CHARS} chars)")
+    nonprintables = sum(1 for ch in txt if ord(ch) < 9 or (13 < ord(ch) < 32))
+    if nonprintables > 0:
+        raise ValueError("text contains invalid control characters")
+    return txt
+
+
+def make_text(n_chars: int) -> str:
+    return (PARAGRAPH * (n_chars // len(PARAGRAPH) + 1))[:n_chars].strip() + "."
+
+
+def bench(fn, n_bytes: int, repeat: int) -> dict:
+    number = max(1, int(5e6 // max(n_bytes, 1)))
+    best = min(timeit.repeat(fn, number=number, repeat=repeat)) / number
+    mb = n_bytes / 1e6
+    return {"ms_per_call": round(best * 1000, 4), "ms_per_mb": round(best * 1000 / mb, 3),
+            "mb_per_s": round(mb / best, 1)}
+
+
+def main(argv=None) -> int:
+    ap = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    ap.add_argument("--repeat", type=int, default=7)
+    ap.add_argument("--json", action="store_true", help="print one JSON object instead of a table")
+    args = ap.parse_args(argv)
+
+    text = make_text(MAX_TEXT_CHARS - 1)
+    batch = [make_text(MAX_TEXT_CHARS - 1 - i) for i in range(MAX_BATCH_ITEMS)]
+    one_bytes = len(text.encode("utf-8"))
+    batch_bytes = sum(len(t.encode("utf-8")) for t in batch)
+
+    cases = {
+        "legacy_per_char (1 text)": (lambda: legacy_validate(text), one_bytes),
+        "clean_text (1 text)": (lambda: clean_text(text), one_bytes),
+        "ClassifyIn (1 text)": (lambda: ClassifyIn.model_validate({"text": text}), one_bytes),
+        f"legacy_per_char ({len(batch)} texts)": (lambda: [legacy_validate(t) for t in batch], batch_bytes),
+        f"ClassifyBatchIn ({len(batch)} texts)": (lambda: ClassifyBatchIn.model_validate({"texts": batch}), batch_bytes),
+    }
+    results = {name: bench(fn, n, args.repeat) for name, (fn, n) in cases.items()}
+
+    if args.json:
+        print(json.dumps({"max_text_chars": MAX_TEXT_CHARS, "results": results}, indent=2))
+        return 0
+    print(f"{'case':<36}{'ms/call':>12}{'ms/MB':>12}{'MB/s':>10}")
+    for name, r in results.items():
+        print(f"{name:<36}{r['ms_per_call']:>12}{r['ms_per_mb']:>12}{r['mb_per_s']:>10}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
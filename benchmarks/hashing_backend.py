@@ -0,0 +1,56 @@
+# benchmarks/hashing_backend.py
+"""Dependency-free hashing embedder for benchmarks.
+
+Hashed character n-grams, L2-normalized. It has no semantic quality, so it is
+not part of the service: it lets the full serving path (loader, registry,
+inference pool, telemetry) run from a locally generated artifact set, e.g.
+`benchmarks/bench_api.py`, without downloading a transformer.
+
+Importing this module registers the `hashing` embed backend; the server picks
+it up with `EMBED_BACKEND_MODULES=benchmarks.hashing_backend` (set by
+bench_api.py) and serves artifacts whose `metadata.json` says
+`"embed_backend": "hashing"`. `embedder/hashing.json` may override `dim`,
+`ngram_min`, `ngram_max` and `max_seq_length`.
+"""
+import json
+import os
+from typing import List
+
+import numpy as np
+
+from app.ml.model_loader import register_embed_backend
+
+CONFIG_FILE = "hashing.json"
+
+
+class HashingEmbedder:
+    """Drop-in for the subset of `SentenceTransformer.encode` the service uses."""
+
+    def __init__(self, dim: int = 384, ngram_min: int = 2, ngram_max: int = 4, max_seq_length: int = 128):
+        from sklearn.feature_extraction.text import HashingVectorizer
+
+        self.dim = dim
+        self.max_seq_length = max_seq_length
+        self.vectorizer = HashingVectorizer(
+            n_features=dim, analyzer="char_wb", ngram_range=(ngram_min, ngram_max),
+            alternate_sign=False, norm="l2",
+        )
+
+    def encode(self, texts: List[str], batch_size: int = 32, normalize_embeddings: bool = True,
+               convert_to_numpy: bool = True, show_progress_bar: bool = False) -> np.ndarray:
+        if not len(texts):
+            return np.zeros((0, self.dim), dtype=np.float32)
+        # rows are already L2-normalized by the vectorizer
+        return self.vectorizer.transform(list(texts)).toarray().astype(np.float32)
+
+
+def load_hashing_embedder(emb_dir: str) -> HashingEmbedder:
+    path = os.path.join(emb_dir, CONFIG_FILE)
+    cfg = {}
+    if os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            cfg = json.load(f)
+    return HashingEmbedder(**cfg)
+
+
+register_embed_backend("hashing", lambda emb_dir, emb_id: load_hashing_embedder(emb_dir))
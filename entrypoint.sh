@@ -22,6 +22,12 @@ PY
   echo "Running Alembic migrations..."
   # Use your actual Alembic ini path
   alembic -c app/db/migrations/alembic.ini upgrade head
+
+  echo "Ensuring telemetry partitions..."
+  # partitions only, and never fatal: rows land in classification_default until a
+  # later run creates their month. Schedule the full job (rollups, retention) hourly.
+  python -m app.cli.telemetry_maintenance --partitions-only \
+    || echo "Telemetry partition setup failed; starting the API anyway." >&2
 else
   echo "Skipping DB wait & migrations (TELEMETRY off or DATABASE_URL not set)."
 fi
@@ -0,0 +1,30 @@
+# tests/conftest.py
+import os
+
+import pytest
+
+
+@pytest.fixture(scope="session")
+def dummy_arts(tmp_path_factory) -> str:
+    """The benchmark artifact set (hashing embedder + calibrated LR), servable without a model download."""
+    # worker processes import the backend themselves, from the environment they start with
+    os.environ["EMBED_BACKEND_MODULES"] = "benchmarks.hashing_backend"
+    import benchmarks.hashing_backend  # noqa: F401  registers "hashing" in this process
+    from benchmarks.bench_api import build_dummy_artifacts
+    return build_dummy_artifacts(str(tmp_path_factory.mktemp("arts")))
+
+
+@pytest.fixture
+def sqlite_sessions(tmp_path):
+    """A session factory on a fresh sqlite file with the telemetry tables created."""
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import sessionmaker
+
+    from app.db.models import Base
+    from app.repositories import telemetry_repo
+
+    telemetry_repo._MODEL_IDS.clear()  # model_version ids are cached per process, not per database
+    engine = create_engine(f"sqlite:///{tmp_path / 'telemetry.sqlite'}", future=True)
+    Base.metadata.create_all(engine)
+    yield sessionmaker(bind=engine, autoflush=False, autocommit=False, future=True)
+    engine.dispose()
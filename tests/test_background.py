@@ -0,0 +1,60 @@
+# tests/test_background.py
+"""The shared background queue: batching, drain/stop, and a handler that raises."""
+import threading
+
+import pytest
+
+from app.core.background import BackgroundQueue
+
+
+@pytest.fixture
+def handled():
+    return []
+
+
+def test_batches_by_size_and_drains(handled):
+    q = BackgroundQueue("test-bg", handled.append, max_batch=3, max_wait_ms=60_000)
+    q.start()
+    for i in range(7):
+        assert q.put(i)
+    assert q.drain(timeout=5)  # the last, partial batch doesn't wait for max_wait_ms
+    assert handled == [[0, 1, 2], [3, 4, 5], [6]]
+    q.stop()
+
+
+def test_handler_error_keeps_the_thread(handled):
+    def handle(batch):
+        if "boom" in batch:
+            raise RuntimeError("handler bug")
+        handled.append(batch)
+
+    q = BackgroundQueue("test-bg", handle, max_batch=1)
+    q.start()
+    q.put("boom")
+    q.put("ok")
+    assert q.drain(timeout=5)
+    assert q.errors == 1 and handled == [["ok"]]
+    q.stop()
+
+
+def test_stop_handles_the_rest(handled):
+    release = threading.Event()
+
+    def slow(batch):
+        release.wait(5)
+        handled.append(batch)
+
+    q = BackgroundQueue("test-bg", slow, max_queue=10, max_batch=2)
+    q.start()
+    for i in range(5):
+        q.put(i)
+    release.set()
+    q.stop(timeout=5)
+    assert sorted(i for batch in handled for i in batch) == list(range(5))
+    assert all(len(batch) <= 2 for batch in handled)
+    assert not q.started and not q.drain(timeout=0.1)
+
+
+def test_full_queue_rejects():
+    q = BackgroundQueue("test-bg", lambda batch: None, max_queue=1)  # not started: nothing drains it
+    assert q.put("a") and not q.put("b") and not q.put("c", timeout=0.01)
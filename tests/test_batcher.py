@@ -0,0 +1,47 @@
+# tests/test_batcher.py
+"""The micro-batcher fails its callers, not its thread, when inference can't be submitted."""
+import asyncio
+from concurrent.futures import Future
+from concurrent.futures.process import BrokenProcessPool
+
+import numpy as np
+import pytest
+
+from app.ml import batcher as batcher_module
+from app.ml.batcher import MicroBatcher
+
+
+def _fake_submit(texts, bundle, deadline=None):
+    done: Future = Future()
+    done.set_result((np.zeros((len(texts), 4), dtype=np.float32), np.full(len(texts), 0.75), {"encode": 0.0}))
+    return done
+
+
+@pytest.fixture
+def batcher():
+    b = MicroBatcher(max_batch_size=8, max_wait_ms=1)
+    b.start()
+    yield b
+    b.stop()
+
+
+def test_submit_error_reaches_every_caller(batcher, monkeypatch):
+    def broken(texts, bundle, deadline=None):
+        raise BrokenProcessPool("worker died")
+
+    monkeypatch.setattr(batcher_module.INFERENCE, "submit", broken)
+    bundle = object()
+
+    async def classify_many():
+        futs = [asyncio.wrap_future(batcher.submit(f"texto {i}", bundle)) for i in range(5)]
+        return await asyncio.wait_for(asyncio.gather(*futs, return_exceptions=True), timeout=5)
+
+    results = asyncio.run(classify_many())
+    assert all(isinstance(r, BrokenProcessPool) for r in results)
+    assert batcher.inflight == 0
+
+    # the thread survived: later requests are served once inference works again
+    monkeypatch.setattr(batcher_module.INFERENCE, "submit", _fake_submit)
+    x, p, timings = batcher.submit("depois", bundle).result(timeout=5)
+    assert p == 0.75 and x.shape == (4,) and "micro_batch_wait" in timings
+    assert batcher.inflight == 0 and batcher.stats()["items"] == 6
@@ -0,0 +1,96 @@
+# tests/test_cache.py
+"""Score cache: LRU eviction, TTL expiry, namespaces, and the shared sqlite store."""
+import numpy as np
+import pytest
+
+from app.ml import cache as cache_module
+from app.ml.cache import CacheEntry, LRUTTLCache, ScoreCache, SqliteCache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1_000.0
+
+    def monotonic(self) -> float:
+        return self.now
+
+    def time(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    c = FakeClock()
+    monkeypatch.setattr(cache_module, "time", c)
+    return c
+
+
+def _entry(score: float) -> CacheEntry:
+    return CacheEntry(np.full(4, score, dtype=np.float32), score)
+
+
+def test_lru_evicts_least_recently_used(clock):
+    c = LRUTTLCache(max_items=2, ttl_s=0)
+    c.put("a", _entry(0.1))
+    c.put("b", _entry(0.2))
+    assert c.get("a").score == 0.1  # a is now the most recent
+    c.put("c", _entry(0.3))
+    assert c.get("b") is None and c.get("a") is not None and c.get("c") is not None
+    assert len(c) == 2 and c.evictions == 1
+
+
+def test_ttl_expires_entries(clock):
+    c = LRUTTLCache(max_items=10, ttl_s=60)
+    c.put("a", _entry(0.5))
+    clock.now += 60
+    assert c.get("a") is not None  # exactly ttl_s old is still live
+    clock.now += 1
+    assert c.get("a") is None
+    assert len(c) == 0 and c.expirations == 1
+
+    forever = LRUTTLCache(max_items=10, ttl_s=0)
+    forever.put("a", _entry(0.5))
+    clock.now += 10 ** 9
+    assert forever.get("a") is not None
+
+
+def test_score_cache_keys_by_namespace_and_normalized_text(clock):
+    sc = ScoreCache(enabled=True, max_items=10, ttl_s=60)
+    sc.put("Qual o  status\ndo chamado?", np.ones(4), 0.9, "model-a")
+    assert sc.get("  Qual o status do chamado? ", "model-a").score == pytest.approx(0.9)
+    assert sc.get("Qual o status do chamado?", "model-b") is None
+    assert sc.get_many(["Qual o status do chamado?", "outro"], "model-a")[1] is None
+    assert (sc.hits, sc.misses) == (2, 2)
+
+    clock.now += 61
+    assert sc.get("Qual o status do chamado?", "model-a") is None
+    assert sc.stats()["expirations"] == 1
+
+    off = ScoreCache(enabled=False, max_items=10, ttl_s=60)
+    off.put("x", np.ones(4), 0.5, "model-a")
+    assert off.get("x", "model-a") is None and off.stats()["size"] == 0
+
+
+def test_sqlite_store_expires_and_prunes(clock, tmp_path):
+    store = SqliteCache(str(tmp_path / "cache.sqlite"), max_items=2, ttl_s=60, prune_every=1)
+    store.put("old", _entry(0.1))
+    clock.now += 30
+    store.put_many([("mid", _entry(0.2)), ("new", _entry(0.3))])
+    # pruned to the newest max_items rows
+    assert store.get("old") is None
+    assert set(store.get_many(["old", "mid", "new"])) == {"mid", "new"}
+
+    clock.now += 31  # 31 s old: still live
+    assert store.get("mid") is not None
+    clock.now += 30
+    assert store.get("mid") is None and store.get_many(["mid", "new"]) == {}
+
+
+def test_sqlite_hits_are_promoted_to_memory(clock, tmp_path):
+    path = str(tmp_path / "shared.sqlite")
+    writer = ScoreCache(True, 10, 60, backend="sqlite", sqlite_path=path)
+    reader = ScoreCache(True, 10, 60, backend="sqlite", sqlite_path=path)  # another uvicorn worker
+    writer.put("texto", np.ones(4), 0.7, "ns")
+    assert len(reader.memory) == 0
+    assert reader.get("texto", "ns").score == pytest.approx(0.7)
+    assert len(reader.memory) == 1 and reader.blocking
@@ -0,0 +1,36 @@
+# tests/test_db_session.py
+"""Pool instrumentation through the public checkout path, and the startup backend check."""
+import pytest
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import TimeoutError as PoolTimeout
+from sqlalchemy.pool import QueuePool
+
+from app.db.session import PoolStats, _timed_pool, check_backend, instrument_pool
+
+
+def test_pool_wait_and_timeouts_are_recorded(tmp_path):
+    stats = PoolStats("test")
+    engine = create_engine(f"sqlite:///{tmp_path / 'pool.sqlite'}", poolclass=_timed_pool(QueuePool, stats),
+                           pool_size=1, max_overflow=0, pool_timeout=0.05)
+    instrument_pool(engine, stats)
+    with engine.connect() as conn:
+        conn.execute(text("SELECT 1"))
+        assert stats.stats()["checked_out"] == 1
+        with pytest.raises(PoolTimeout):
+            engine.connect()
+    s = stats.stats()
+    assert (s["checkouts"], s["connects"], s["timeouts"], s["checked_out"]) == (1, 1, 1, 0)
+    assert stats.wait_s >= 0.05  # the timed-out checkout waited pool_timeout
+
+    # dispose() swaps the engine's pool; the stats follow it
+    engine.dispose()
+    with engine.connect():
+        assert stats.stats()["checked_out"] == 1
+    engine.dispose()
+
+
+def test_unsupported_backend_fails_at_startup():
+    check_backend("sqlite:///x.db")
+    check_backend("postgresql+psycopg://u:p@localhost/db")
+    with pytest.raises(RuntimeError, match="ON CONFLICT"):
+        check_backend("mysql+pymysql://u:p@localhost/db")
@@ -0,0 +1,111 @@
+# tests/test_deadline.py
+"""Deadline / DeadlineGroup checks and run_within cancellation."""
+import asyncio
+import pickle
+
+import pytest
+
+from app.core import deadline as deadline_module
+from app.core.deadline import DEADLINES, Deadline, DeadlineExceeded, DeadlineGroup, check, run_within
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 100.0
+
+    def monotonic(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    c = FakeClock()
+    monkeypatch.setattr(deadline_module, "time", c)
+    return c
+
+
+def test_deadline_expires_and_cancels(clock):
+    d = Deadline(2.0)
+    d.check("queued")
+    assert d.remaining() == pytest.approx(2.0)
+    clock.now += 2.0
+    with pytest.raises(DeadlineExceeded) as e:
+        d.check("encode")
+    assert (e.value.reason, e.value.stage) == ("expired", "encode")
+
+    unlimited = Deadline(None)
+    clock.now += 10 ** 6
+    unlimited.check("encode")
+    check(None, "encode")
+    assert unlimited.remaining() is None
+    unlimited.cancel()
+    with pytest.raises(DeadlineExceeded, match="cancelled during queued"):
+        check(unlimited, "queued")
+
+
+def test_pickled_deadline_keeps_only_the_time_budget(clock):
+    d = Deadline(5.0)
+    d.cancel()
+    copy = pickle.loads(pickle.dumps(d))  # what a worker process receives
+    assert copy.expires_at == d.expires_at and not copy.cancelled
+    copy.check("queued")
+    clock.now += 5.0
+    with pytest.raises(DeadlineExceeded):
+        copy.check("queued")
+
+
+def test_group_is_alive_while_any_member_is(clock):
+    short, long_, gone = Deadline(1.0), Deadline(3.0), Deadline(10.0)
+    gone.cancel()
+    group = DeadlineGroup([short, long_, gone])
+    clock.now += 1.5
+    group.check("encode")  # `long_` still wants the result
+    clock.now += 2.0
+    with pytest.raises(DeadlineExceeded):
+        group.check("encode")
+
+
+def test_run_within_returns_the_result():
+    async def work():
+        await asyncio.sleep(0.01)
+        return 42
+
+    assert asyncio.run(run_within(Deadline(5.0), work())) == 42
+    assert asyncio.run(run_within(Deadline(None), work())) == 42
+
+
+def test_run_within_expiry_cancels_deadline_and_work():
+    d = Deadline(0.05)
+    state = {}
+
+    async def slow():
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            state["cancelled"] = True
+            raise
+
+    before = DEADLINES.counts["expired"]["waiting"]
+    with pytest.raises(DeadlineExceeded) as e:
+        asyncio.run(run_within(d, slow()))
+    assert (e.value.reason, e.value.stage) == ("expired", "waiting")
+    assert d.cancelled and state == {"cancelled": True}
+    assert DEADLINES.counts["expired"]["waiting"] == before + 1
+
+
+def test_run_within_disconnect_cancels():
+    d = Deadline(None)
+    polls = []
+
+    async def disconnected() -> bool:
+        polls.append(1)
+        return len(polls) >= 3  # the client goes away on the third poll
+
+    async def slow():
+        await asyncio.sleep(10)
+
+    before = DEADLINES.counts["cancelled"]["waiting"]
+    with pytest.raises(DeadlineExceeded) as e:
+        asyncio.run(run_within(d, slow(), disconnected, poll_s=0.01))
+    assert e.value.reason == "cancelled" and d.cancelled and len(polls) == 3
+    assert DEADLINES.counts["cancelled"]["waiting"] == before + 1
@@ -0,0 +1,48 @@
+# tests/test_feedback.py
+"""Feedback for a classification whose telemetry row is still queued is accepted, not reported unknown."""
+import asyncio
+import uuid
+
+import pytest
+
+from app.repositories.telemetry_repo import build_classification_row
+from app.services import classifier_service, telemetry_writer
+from app.services.telemetry_writer import TelemetryWriter
+
+
+def _row(cid: uuid.UUID) -> dict:
+    return build_classification_row(
+        classification_id=cid, model_version="test", embedding_model="hashing", threshold_used=0.5,
+        label="Produtivo", score_produtivo=0.9, template_code="generic", text_length_chars=20,
+        latency_ms=3, language="pt",
+    )
+
+
+@pytest.fixture
+def writer(sqlite_sessions, monkeypatch):
+    monkeypatch.setattr(telemetry_writer, "TELEMETRY_ON", True)
+    # long flush interval: rows stay queued unless something drains them
+    w = TelemetryWriter(sqlite_sessions, flush_rows=1000, flush_ms=60_000)
+    monkeypatch.setattr(classifier_service, "TELEMETRY_WRITER", w)
+    monkeypatch.setattr(classifier_service, "SessionLocal", sqlite_sessions)
+    monkeypatch.setattr(classifier_service, "AsyncSessionLocal", None)
+    yield w
+    w.stop()
+
+
+def test_feedback_right_after_classify(writer):
+    cid, unknown = uuid.uuid4(), uuid.uuid4()
+    writer.enqueue(_row(cid))  # what /classify does; the flush is a minute away
+    assert writer.has_pending([cid]) and not writer.has_pending([unknown])
+
+    found = asyncio.run(classifier_service.submit_feedback_batch_service(
+        [(cid, True, None), (unknown, False, "WRONG_INTENT")]))
+    assert found == [True, False]
+    assert writer.flushed == 1 and not writer.has_pending([cid])
+
+    # an unknown id alone doesn't force a flush
+    asyncio.run(classifier_service.submit_feedback_service(cid, False, "WRONG_INTENT"))
+    with pytest.raises(Exception) as e:
+        asyncio.run(classifier_service.submit_feedback_service(unknown, True, None))
+    assert e.value.status_code == 404
+    assert writer.flushes == 1
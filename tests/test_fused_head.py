@@ -0,0 +1,45 @@
+# tests/test_fused_head.py
+"""FusedHead must score like the sklearn (calibrated) head it was compiled from."""
+import numpy as np
+import pytest
+from sklearn.calibration import CalibratedClassifierCV
+from sklearn.linear_model import LogisticRegression
+from sklearn.svm import LinearSVC
+
+from app.core.config import FUSED_HEAD_PARITY_TOL
+from app.ml.fused_head import compile_head, probe_inputs
+
+# the gate the loader applies; isotonic steps amplify float32 matmul rounding past 1e-5
+ATOL = min(FUSED_HEAD_PARITY_TOL, 1e-4)
+
+
+def _corpus(n: int = 400, dim: int = 64, seed: int = 7):
+    """Fixed unit-vector 'embeddings' with a noisy linear label, like a trained bundle sees."""
+    rng = np.random.default_rng(seed)
+    X = rng.standard_normal((n, dim)).astype(np.float32)
+    X /= np.linalg.norm(X, axis=1, keepdims=True)
+    y = (X @ rng.standard_normal(dim) + 0.3 * rng.standard_normal(n) > 0).astype(int)
+    return X, y
+
+
+@pytest.mark.parametrize("clf", [
+    CalibratedClassifierCV(LogisticRegression(max_iter=1000), cv=3),  # as bench_api / training
+    CalibratedClassifierCV(LogisticRegression(max_iter=1000), cv=5, method="isotonic"),
+    CalibratedClassifierCV(LinearSVC(), cv=3),
+    LogisticRegression(max_iter=1000),
+], ids=["sigmoid", "isotonic", "linear_svc", "plain_lr"])
+def test_fused_head_matches_sklearn(clf):
+    X, y = _corpus()
+    clf.fit(X, y)
+    head = compile_head(clf)
+    assert head is not None
+    probes = probe_inputs(X.shape[1], X)
+    assert head.scores(probes).shape == (len(probes),)
+    assert np.allclose(head.scores(probes), clf.predict_proba(probes)[:, 1], rtol=0, atol=ATOL)
+    assert np.allclose(head.predict_proba(probes), clf.predict_proba(probes), rtol=0, atol=ATOL)
+
+
+def test_unsupported_model_is_not_compiled():
+    from sklearn.ensemble import RandomForestClassifier
+    X, y = _corpus(n=100)
+    assert compile_head(RandomForestClassifier(n_estimators=5, random_state=0).fit(X, y)) is None
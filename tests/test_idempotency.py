@@ -0,0 +1,111 @@
+# tests/test_idempotency.py
+"""Idempotency-Key replay, coalescing of concurrent duplicates, and KeyConflict -> 422."""
+import asyncio
+import uuid
+from types import SimpleNamespace
+
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.api.v1 import routes
+from app.services.idempotency import IdempotencyStore, KeyConflict
+
+
+@pytest.fixture
+def store():
+    return IdempotencyStore(enabled=True, max_items=100, ttl_s=60)
+
+
+def _counting_compute(calls: list, delay: float = 0.0):
+    async def compute(text: str) -> dict:
+        calls.append(text)
+        await asyncio.sleep(delay)
+        return {"text": text, "n": len(calls)}
+    return compute
+
+
+def test_concurrent_duplicates_are_computed_once(store):
+    calls = []
+
+    async def main():
+        compute = _counting_compute(calls, delay=0.05)
+        return await asyncio.gather(*(store.run("k1", "mesmo texto", compute) for _ in range(3)))
+
+    outcomes = asyncio.run(main())
+    assert calls == ["mesmo texto"]
+    assert [r for r, _ in outcomes] == [{"text": "mesmo texto", "n": 1}] * 3
+    assert sorted(replayed for _, replayed in outcomes) == [False, True, True]
+    assert (store.misses, store.coalesced, store.stats()["inflight"]) == (1, 2, 0)
+
+    # later requests replay from memory
+    result, replayed = asyncio.run(store.run("k1", "mesmo texto", _counting_compute(calls)))
+    assert replayed and result["n"] == 1 and store.hits == 1 and len(calls) == 1
+
+
+def test_batch_items_share_one_compute(store):
+    seen = []
+
+    async def compute_many(texts):
+        seen.append(list(texts))
+        return [{"text": t} for t in texts]
+
+    outcomes = asyncio.run(store.run_many(["a", None, "a", "b"], ["x", "y", "x", "z"], compute_many))
+    assert seen == [["x", "y", "z"]]  # unkeyed and new keys in one call; the repeated key replays
+    assert [replayed for _, replayed in outcomes] == [False, False, True, False]
+    assert outcomes[2][0] == {"text": "x"}
+
+
+def test_key_reused_with_other_text_conflicts(store):
+    calls = []
+    asyncio.run(store.run("k1", "primeiro", _counting_compute(calls)))
+    with pytest.raises(KeyConflict):
+        asyncio.run(store.run("k1", "segundo", _counting_compute(calls)))
+    with pytest.raises(KeyConflict):
+        asyncio.run(store.run_many(["k2", "k2"], ["a", "b"], lambda texts: None))
+    assert calls == ["primeiro"] and store.conflicts == 2 and store.stats()["inflight"] == 0
+
+
+def test_failed_compute_releases_the_key(store):
+    async def boom(text):
+        await asyncio.sleep(0.02)
+        raise RuntimeError("model failed")
+
+    async def main():
+        return await asyncio.gather(store.run("k1", "t", boom), store.run("k1", "t", boom),
+                                    return_exceptions=True)
+
+    first, waiter = asyncio.run(main())
+    assert isinstance(first, RuntimeError) and isinstance(waiter, RuntimeError)
+    # nothing was stored: a retry computes
+    result, replayed = asyncio.run(store.run("k1", "t", _counting_compute([])))
+    assert not replayed and result == {"text": "t", "n": 1}
+
+
+def test_conflict_is_422(store, monkeypatch):
+    bundle = SimpleNamespace(threshold=0.5)
+    monkeypatch.setattr(routes, "IDEMPOTENCY", store)
+
+    async def fake_classify_one(text, bundle, deadline=None):
+        return uuid.uuid4(), "Produtivo", 0.9, "resposta"
+
+    async def fake_classify_batch(texts, bundle, deadline=None):
+        return [(uuid.uuid4(), "Produtivo", 0.9, "resposta") for _ in texts]
+
+    monkeypatch.setattr(routes, "classify_one_service", fake_classify_one)
+    monkeypatch.setattr(routes, "classify_batch_service", fake_classify_batch)
+    app = FastAPI()
+    app.include_router(routes.router)
+    app.dependency_overrides[routes.require_model] = lambda: bundle
+    client = TestClient(app)
+
+    first = client.post("/classify", json={"text": "Qual o status?"}, headers={"Idempotency-Key": "abc"})
+    again = client.post("/classify", json={"text": "Qual o status?"}, headers={"Idempotency-Key": "abc"})
+    assert first.status_code == again.status_code == 200
+    assert again.headers.get("Idempotent-Replayed") == "true" and again.json() == first.json()
+
+    other = client.post("/classify", json={"text": "Outro texto"}, headers={"Idempotency-Key": "abc"})
+    assert other.status_code == 422 and "abc" in other.json()["detail"]
+
+    batch = client.post("/classify_batch", json={"texts": ["a", "b"], "idempotency_keys": ["abc", "x"]})
+    assert batch.status_code == 422
@@ -0,0 +1,48 @@
+# tests/test_inference.py
+"""Empty inputs flow through encode/predict with correctly shaped results."""
+import numpy as np
+import pytest
+from sklearn.calibration import CalibratedClassifierCV
+from sklearn.linear_model import LogisticRegression
+
+from app.ml.fused_head import SklearnHead, compile_head
+from app.ml.inference import encode_texts, infer_labels, predict_scores
+from app.ml.model_loader import ModelBundle
+
+DIM = 16
+
+
+class _Embedder:
+    """Deterministic stand-in for SentenceTransformer.encode; refuses empty calls like some backends do."""
+    max_seq_length = 128
+
+    def encode(self, texts, batch_size=32, normalize_embeddings=True, convert_to_numpy=True,
+               show_progress_bar=False):
+        assert len(texts), "encode called with no texts"
+        X = np.array([[hash((t, i)) % 1000 + 1 for i in range(DIM)] for t in texts], dtype=np.float32)
+        return X / np.linalg.norm(X, axis=1, keepdims=True)
+
+
+def _bundle(fused: bool) -> ModelBundle:
+    rng = np.random.default_rng(0)
+    X = rng.standard_normal((60, DIM)).astype(np.float32)
+    clf = CalibratedClassifierCV(LogisticRegression(max_iter=1000), cv=3).fit(X, np.arange(60) % 2)
+    head = compile_head(clf) if fused else SklearnHead(clf)
+    return ModelBundle(meta={}, emb=_Embedder(), clf=clf, threshold=0.5, emb_id="test", emb_backend="test",
+                       arts_dir="", head=head)
+
+
+@pytest.mark.parametrize("fused", [True, False], ids=["fused", "sklearn"])
+def test_empty_input(fused):
+    bundle = _bundle(fused)
+    X = encode_texts([], bundle)
+    assert X.shape == (0, DIM) and X.dtype == np.float32
+    assert predict_scores(X, bundle).shape == (0,)
+    assert infer_labels([], bundle).shape == (0,)
+
+
+@pytest.mark.parametrize("fused", [True, False], ids=["fused", "sklearn"])
+def test_nonempty_input_shapes(fused):
+    bundle = _bundle(fused)
+    p = infer_labels(["status do chamado", "obrigado"], bundle)
+    assert p.shape == (2,) and np.all((0 <= p) & (p <= 1))
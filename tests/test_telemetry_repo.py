@@ -0,0 +1,51 @@
+# tests/test_telemetry_repo.py
+"""The feedback upsert (VALUES CTE joined to classification, ON CONFLICT DO UPDATE) on sqlite."""
+import uuid
+
+from sqlalchemy import func, select
+
+from app.db.models import Feedback
+from app.repositories.telemetry_repo import (
+    build_classification_row, get_classification_details, insert_classification_rows, upsert_feedback_rows,
+)
+
+
+def _classify(db, n: int):
+    ids = [uuid.uuid4() for _ in range(n)]
+    insert_classification_rows(db, [build_classification_row(
+        classification_id=cid, model_version="test", embedding_model="hashing", threshold_used=0.5,
+        label="Produtivo", score_produtivo=0.8, template_code="generic", text_length_chars=10,
+        latency_ms=1, language="pt") for cid in ids])
+    return ids
+
+
+def test_upsert_inserts_updates_and_skips_unknown(sqlite_sessions):
+    with sqlite_sessions() as db:
+        a, b = _classify(db, 2)
+        unknown = uuid.uuid4()
+        written = upsert_feedback_rows(db, [
+            {"classification_id": a, "helpful": True, "reason_code": None},
+            {"classification_id": unknown, "helpful": False, "reason_code": "WRONG_INTENT"},
+        ])
+        assert written == {a}
+
+        # second round: a is updated in place, b is new, a repeated id keeps its last row
+        written = upsert_feedback_rows(db, [
+            {"classification_id": a, "helpful": True, "reason_code": None},
+            {"classification_id": b, "helpful": True, "reason_code": None},
+            {"classification_id": a, "helpful": False, "reason_code": "WRONG_INTENT"},
+        ])
+        assert written == {a, b}
+        assert db.scalar(select(func.count()).select_from(Feedback)) == 2
+        details = get_classification_details(db, [a, b, unknown])
+        assert set(details) == {a, b}
+        assert (details[a]["helpful"], details[a]["reason_code"]) == (False, "WRONG_INTENT")
+        assert (details[b]["helpful"], details[b]["reason_code"]) == (True, None)
+        assert details[a]["model_version"] == "test" and details[a]["label"] == "Produtivo"
+
+
+def test_upsert_of_nothing_touches_nothing(sqlite_sessions):
+    with sqlite_sessions() as db:
+        assert upsert_feedback_rows(db, []) == set()
+        assert upsert_feedback_rows(db, [{"classification_id": uuid.uuid4(), "helpful": True}]) == set()
+        assert db.scalar(select(func.count()).select_from(Feedback)) == 0
@@ -0,0 +1,55 @@
+# tests/test_worker_pool.py
+"""A worker process that dies must not leave inference hanging."""
+import os
+import signal
+import time
+from concurrent.futures.process import BrokenProcessPool
+from types import SimpleNamespace
+
+import pytest
+
+from app.ml.worker_pool import InferencePool, _ping
+
+
+@pytest.fixture
+def process_pool(dummy_arts):
+    pool = InferencePool(workers=1, threads=1, start_method="spawn")
+    bundle = SimpleNamespace(arts_dir=dummy_arts, generation=1)
+    pool.prepare(bundle, 1)
+    yield pool, bundle
+    pool.shutdown()
+
+
+def _kill_worker(pool: InferencePool) -> None:
+    executor = pool._pools[1]
+    os.kill(executor.submit(_ping).result(timeout=60), signal.SIGKILL)
+    deadline = time.monotonic() + 30
+    while not executor._broken and time.monotonic() < deadline:
+        time.sleep(0.05)
+    assert executor._broken, "executor never noticed the dead worker"
+
+
+def test_killed_worker_is_replaced_on_next_submit(process_pool):
+    pool, bundle = process_pool
+    X, p, _ = pool.submit(["status do chamado 1"], bundle).result(timeout=120)
+    _kill_worker(pool)
+
+    X2, p2, _ = pool.submit(["status do chamado 1"], bundle).result(timeout=120)
+    assert p2.shape == (1,) and abs(float(p2[0]) - float(p[0])) < 1e-6
+    assert pool.restarts == 1 and pool.broken is None
+
+
+def test_task_running_on_killed_worker_fails_instead_of_hanging(process_pool):
+    pool, bundle = process_pool
+    pool.submit(["aquecimento"], bundle).result(timeout=120)
+    executor = pool._pools[1]
+    pid = executor.submit(_ping).result(timeout=60)
+    running = pool.submit(["Prezados, segue o relatório. " * 400] * 64, bundle)
+    os.kill(pid, signal.SIGKILL)
+    try:
+        running.result(timeout=60)  # may have finished before the kill landed
+    except BrokenProcessPool:
+        assert pool.broken is not None
+    # the next request gets a fresh pool either way
+    assert pool.submit(["obrigado"], bundle).result(timeout=120)[1].shape == (1,)
+    assert pool.broken is None and pool._pools[1] is not executor